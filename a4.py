@@ -4,9 +4,76 @@ A module to draw cool shapes with the introcs Turtle.
 Renee Gowda (rsg276) and Muskan Gupta (mg2479)
 October 31st, 2024
 """
-from introcs.turtle import Window, Turtle, Pen
-import introcs  # For the RGB and HSV objects
+import array    # For the arguments of command logs
+import importlib  # For importing the modules below only when needed
 import math     # For the math computations
+import os       # For geometry files
+import struct   # For the geometry file header
+import threading  # For computing while drawing
+import time     # For rendering within a deadline
+import tracemalloc  # For memory reports
+import weakref  # For keeping raster images alive
+
+
+################# Helpers for Deferred Imports #################
+class _LazyModule(object):
+    """
+    A module that is only imported the first time one of its attributes is used.
+
+    The turtle (and with it Tkinter), numpy and even introcs take far longer
+    to import than the rest of this module. Geometry and precondition code that never draws
+    or never computes arrays should not pay for them.
+    """
+    # HIDDEN ATTRIBUTES:
+    #    _name   : The full name of the module
+    #    _module : The module, or None if it is not imported yet
+
+    def __init__(self, name):
+        """
+        Initializes a deferred import of the module name.
+
+        Parameter name: The full name of the module (e.g. 'introcs.turtle')
+        Precondition: name is a string
+        """
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        """
+        Returns: the attribute attr of the module, importing it if necessary.
+
+        Parameter attr: The attribute name
+        Precondition: attr is a string
+        """
+        return getattr(self._load(), attr)
+
+    def _load(self):
+        """
+        Returns: the module, importing it if necessary.
+        """
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+
+introcs = _LazyModule('introcs')         # For the RGB and HSV objects
+_turtle = _LazyModule('introcs.turtle')  # For the Window, Turtle and Pen
+np = _LazyModule('numpy')               # For computing many shapes at once
+
+
+def __getattr__(name):
+    """
+    Returns: the introcs class Window, Turtle or Pen, importing the turtle.
+
+    This keeps a4.Window, a4.Turtle and a4.Pen working even though the turtle
+    is not imported with this module.
+
+    Parameter name: The attribute name
+    Precondition: name is a string
+    """
+    if name in ['Window', 'Turtle', 'Pen']:
+        return getattr(_turtle, name)
+    raise AttributeError('module ' + repr(__name__) + ' has no attribute ' + repr(name))
 
 
 ################# Helpers for Precondition Verification #################
@@ -27,7 +94,7 @@ def is_window(w):
     Parameter w: the value to check
     Precondition: NONE (w can be any value)
     """
-    return type(w) == Window
+    return type(w) == _turtle.Window
 
 
 def is_valid_color(c):
@@ -37,6 +104,8 @@ def is_valid_color(c):
     Parameter c: the value to check
     Precondition: NONE (c can be any value)
     """
+    if type(c) == str and c in _COLOR_INDEX:
+        return True  # Already resolved by color_index
     return (type(c) == introcs.RGB or type(c) == introcs.HSV or
             (type(c) == str
                 and (introcs.is_tkcolor(c) or introcs.is_webcolor(c))))
@@ -89,7 +158,7 @@ def is_valid_turtlemode(t):
     Parameter t: the value to check
     Precondition: NONE (t can be any value)
     """
-    return (type(t) == Turtle and t.drawmode)
+    return (type(t) == _turtle.Turtle and t.drawmode)
 
 
 def is_valid_penmode(p):
@@ -99,7 +168,7 @@ def is_valid_penmode(p):
     Parameter p: the value to check
     Precondition: NONE (p can be any value)
     """
-    return (type(p) == Pen and not p.solid)
+    return (type(p) == _turtle.Pen and not p.solid)
 
 
 def report_error(message, value):
@@ -124,6 +193,507 @@ def report_error(message, value):
     return message+': '+repr(value)
 
 
+#################### Color Palette ####################
+# Every color the drawing code uses is resolved once, to a small int index.
+# Color ramps can use a new color for every shape, so the palette is cleared
+# and starts over when it reaches PALETTE_LIMIT colors. Indices are only
+# meant to be used right away; figures and logs keep their colors by name.
+PALETTE_LIMIT = 4096
+
+# The index of each color (by name, or by value for RGB and HSV objects)
+_COLOR_INDEX = {}
+
+# The web color and the (red, green, blue) tuple of each index
+_COLOR_WEB = []
+_COLOR_RGB = []
+
+
+def _color_key(c):
+    """
+    Returns: the dictionary key for the color c, or None if c is not a color.
+
+    RGB and HSV objects are mutable (and not hashable), so they are keyed
+    by their current value.
+
+    Parameter c: the value to look up
+    Precondition: NONE (c can be any value)
+    """
+    if type(c) == str:
+        return c
+    if type(c) == introcs.RGB:
+        return ('rgb', c.red, c.green, c.blue)
+    if type(c) == introcs.HSV:
+        return ('hsv', c.hue, c.saturation, c.value)
+    return None
+
+
+def clear_palette():
+    """
+    Removes every color from the palette, so that old indices are no longer valid.
+    """
+    _COLOR_INDEX.clear()
+    del _COLOR_WEB[:]
+    del _COLOR_RGB[:]
+
+
+def color_index(c):
+    """
+    Returns: the palette index of the color c, adding it to the palette if needed.
+
+    The first time a color is seen, it is checked and converted to a web
+    color and an RGB tuple. Every later use is a single dictionary lookup,
+    so the drawing code can resolve colors in its inner loops. The same
+    color always has the same index, whatever form it is given in, until
+    the palette is cleared (which adding a color to a full palette does).
+
+    Parameter c: the color to look up
+    Precondition: c is a valid turtle color
+    """
+    key = _color_key(c)
+    index = _COLOR_INDEX.get(key)
+    if index is None:
+        assert is_valid_color(c), report_error('c is not a valid color', c)
+        if type(c) != str:
+            web = c.webColor().lower()
+        elif c[0] != '#':
+            web = introcs.tk_webcolor(c).lower()
+        else:
+            web = c.lower()
+
+        # Different names for the same color share its web color entry
+        index = _COLOR_INDEX.get(web)
+        if index is None:
+            if len(_COLOR_WEB) >= PALETTE_LIMIT:
+                clear_palette()
+            index = len(_COLOR_WEB)
+            _COLOR_WEB.append(web)
+            _COLOR_RGB.append((int(web[1:3], 16), int(web[3:5], 16), int(web[5:7], 16)))
+            _COLOR_INDEX[web] = index
+        _COLOR_INDEX[key] = index
+    return index
+
+
+def palette_web(index):
+    """
+    Returns: the web color (a string '#rrggbb') of the palette index.
+
+    Parameter index: the palette index
+    Precondition: index was returned by color_index since the palette was last cleared
+    """
+    return _COLOR_WEB[index]
+
+
+def palette_rgb(index):
+    """
+    Returns: the tuple (red, green, blue) of the palette index, each in 0..255.
+
+    Parameter index: the palette index
+    Precondition: index was returned by color_index since the palette was last cleared
+    """
+    return _COLOR_RGB[index]
+
+
+#################### Helpers for Fast Drawing ####################
+# The speed 0 paths compute the (cos, sin) pair of every heading a drawing
+# uses in one numpy pass, and then only index into it. Animated turtles turn
+# one step at a time and do their own trig, so this only helps at speed 0.
+
+# The most segments drawn as a single canvas line (very long lines redraw slowly)
+RUN_LIMIT = 8192
+
+
+def heading_steps(heading, ang, n):
+    """
+    Returns: the unit steps along the headings heading, heading+ang, ..., heading+(n-1)*ang.
+
+    The result is a numpy array of shape (n, 2), whose row i is the pair
+    (cos, sin) of heading+i*ang. The headings are in degrees counter
+    clockwise from due east. All of the pairs are computed in one pass.
+
+    Parameter heading: the first heading in degrees
+    Precondition: heading is a number
+
+    Parameter ang: the angle between successive headings
+    Precondition: ang is a number
+
+    Parameter n: the number of headings
+    Precondition: n is an int >= 0
+    """
+    rad = np.radians(heading + ang * np.arange(n))
+    return np.column_stack([np.cos(rad), np.sin(rad)])
+
+
+def _walk(x, y, steps):
+    """
+    Returns: the points visited by taking the given steps from (x, y).
+
+    The result is a numpy array of shape (m+1, 2) for m steps, starting
+    with (x, y).
+
+    Parameter x: the starting x-coordinate
+    Precondition: x is a number
+
+    Parameter y: the starting y-coordinate
+    Precondition: y is a number
+
+    Parameter steps: the steps
+    Precondition: steps is a numpy float array of shape (m, 2)
+    """
+    path = np.empty((len(steps) + 1, 2))
+    path[0] = (x, y)
+    np.cumsum(steps, axis=0, out=path[1:])
+    path[1:] += path[0]
+    return path
+
+
+def polygon_path(x, y, heading, side, n):
+    """
+    Returns: the vertices of the polygon drawn by draw_polygon.
+
+    The vertices are a numpy array of the n+1 points (x, y) visited by a
+    turtle at (x, y) with the given heading, one per row. The last point
+    is the first one (within round-off).
+
+    Parameter x: the starting x-coordinate
+    Precondition: x is a number
+
+    Parameter y: the starting y-coordinate
+    Precondition: y is a number
+
+    Parameter heading: the starting heading in degrees
+    Precondition: heading is a number
+
+    Parameter side: the length of each side
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter n: the number of sides
+    Precondition: n is an int >= 1
+    """
+    return _walk(x, y, heading_steps(heading, 360.0 / n, n) * side)
+
+
+def spiral_path(x, y, heading, side, ang, n):
+    """
+    Returns: the vertices of the spiral drawn by draw_spiral_helper.
+
+    The vertices are a numpy array of n+1 points (x, y), one per row. Line i
+    runs from point i to point i+1, has length (i+1)*side, and each line
+    turns ang degrees to the left of the one before it.
+
+    Parameter x: the starting x-coordinate
+    Precondition: x is a number
+
+    Parameter y: the starting y-coordinate
+    Precondition: y is a number
+
+    Parameter heading: the starting heading in degrees
+    Precondition: heading is a number
+
+    Parameter side: the length of the first line
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter ang: the angle to turn after each line
+    Precondition: ang is a number
+
+    Parameter n: the number of lines
+    Precondition: n is an int >= 1
+    """
+    lengths = side * np.arange(1, n + 1)
+    return _walk(x, y, heading_steps(heading, ang, n) * lengths[:, None])
+
+
+def diamond_path(x, y, heading, length, width):
+    """
+    Returns: the vertices of the diamond drawn by draw_diamond.
+
+    The vertices are a flat list of the five points [x, y, ..., x, y] of a
+    diamond whose major axis (of size length) runs along the heading from
+    (x, y), and whose minor axis (of size width) is perpendicular to it.
+
+    Parameter x: the x-coordinate of the diamond tip
+    Precondition: x is a number
+
+    Parameter y: the y-coordinate of the diamond tip
+    Precondition: y is a number
+
+    Parameter heading: the direction of the major axis in degrees
+    Precondition: heading is a number
+
+    Parameter length: the size of the major axis
+    Precondition: length is a valid length (number >= 0)
+
+    Parameter width: the size of the minor axis
+    Precondition: width is a valid length (number >= 0)
+    """
+    rad = math.radians(heading)
+    cos = math.cos(rad)
+    sin = math.sin(rad)
+    mx = x + cos * length / 2
+    my = y + sin * length / 2
+    wx = -sin * width / 2
+    wy = cos * width / 2
+    return [x, y, mx - wx, my - wy, x + cos * length, y + sin * length,
+            mx + wx, my + wy, x, y]
+
+
+def petal_paths(x, y, heading, length, width, n):
+    """
+    Returns: the vertices of the n petals drawn by radiate_petals_helper.
+
+    The result is a numpy array with one row per petal. Row i is the closed
+    diamond path (in the format of diamond_path) for the petal whose major
+    axis has heading heading+i*360/n. All petals are computed in one pass.
+
+    Parameter x: the x-coordinate of the flower center
+    Precondition: x is a number
+
+    Parameter y: the y-coordinate of the flower center
+    Precondition: y is a number
+
+    Parameter heading: the heading of the first petal in degrees
+    Precondition: heading is a number
+
+    Parameter length: the size of each petal major axis
+    Precondition: length is a valid length (number >= 0)
+
+    Parameter width: the size of each petal minor axis
+    Precondition: width is a valid length (number >= 0)
+
+    Parameter n: the number of petals
+    Precondition: n is an int >= 1
+    """
+    trig = heading_steps(heading, 360.0 / n, n)
+    cos = trig[:, 0]
+    sin = trig[:, 1]
+
+    paths = np.empty((n, 10))
+    paths[:, 0::8] = x
+    paths[:, 1::8] = y
+    paths[:, 4] = x + cos * length
+    paths[:, 5] = y + sin * length
+    mx = x + cos * (length / 2)
+    my = y + sin * (length / 2)
+    paths[:, 2] = mx + sin * (width / 2)
+    paths[:, 3] = my - cos * (width / 2)
+    paths[:, 6] = mx - sin * (width / 2)
+    paths[:, 7] = my + cos * (width / 2)
+    return paths
+
+
+def hsv_rgb(hues, s=1, v=1):
+    """
+    Returns: the RGB colors for the given HSV hues, as an (n, 3) int array.
+
+    The conversion matches introcs.HSV(h, s, v) for every hue (each channel
+    is in 0..255), but it converts all of the hues in one numpy pass.
+
+    Parameter hues: the hues in degrees
+    Precondition: hues is a numpy array of numbers in the range 0..360
+
+    Parameter s: the saturation
+    Precondition: s is a number in the range 0..1
+
+    Parameter v: the value (brightness)
+    Precondition: v is a number in the range 0..1
+    """
+    h6 = np.asarray(hues, dtype=float) / 360.0 * 6.0  # Rounds as colorsys does
+    i = np.floor(h6).astype(int) % 6
+    f = h6 - np.floor(h6)
+    p = np.full_like(f, v * (1.0 - s))
+    q = v * (1.0 - s * f)
+    r = v * (1.0 - s * (1.0 - f))
+    w = np.full_like(f, v)
+
+    # The six sextants of the color wheel (as in colorsys.hsv_to_rgb)
+    red = np.choose(i, [w, q, p, p, r, w])
+    green = np.choose(i, [r, w, w, q, p, p])
+    blue = np.choose(i, [p, p, r, w, w, q])
+    return np.round(np.stack([red, green, blue], axis=1) * 255).astype(int)
+
+
+def hsv_webcolors(hues, s=1, v=1):
+    """
+    Returns: the web colors (e.g. '#ff8000') for the given HSV hues.
+
+    The conversion matches introcs.HSV(h, s, v).webColor() for every hue, but
+    it converts all of the hues in one numpy pass (see hsv_rgb). The result
+    is a list of strings, one per hue.
+
+    Parameter hues: the hues in degrees
+    Precondition: hues is a numpy array of numbers in the range 0..360
+
+    Parameter s: the saturation
+    Precondition: s is a number in the range 0..1
+
+    Parameter v: the value (brightness)
+    Precondition: v is a number in the range 0..1
+    """
+    names, inverse = _web_palette(hsv_rgb(hues, s, v))
+    return [names[k] for k in inverse.tolist()]
+
+
+def _web_palette(rgb):
+    """
+    Returns: a pair (names, inverse) of the distinct colors in rgb.
+
+    names is a list of the distinct web colors, and inverse is an int array
+    with the position in names of every row of rgb. Many rows usually share
+    a color, so each distinct color is only formatted once.
+
+    Parameter rgb: the colors, one row (red, green, blue) per color
+    Precondition: rgb is an (n, 3) numpy int array with values in 0..255
+    """
+    codes = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+    unique, inverse = np.unique(codes, return_inverse=True)
+    return ['#%06x' % code for code in unique.tolist()], inverse.ravel()
+
+
+# Cache of (turn angle, edge length) for each diamond shape
+_DIAMONDS = {}
+
+
+def _diamond_shape(length, width):
+    """
+    Returns: the tuple (angle, edge) used by draw_diamond to trace a diamond.
+
+    The angle is how far the first edge turns away from the major axis, in
+    degrees, and edge is the length of each diamond edge. Neither depends on
+    the turtle heading, so they are cached by shape.
+
+    Parameter length: the size of the major axis
+    Precondition: length is a valid length (number >= 0)
+
+    Parameter width: the size of the minor axis
+    Precondition: width is a valid length (number >= 0)
+    """
+    shape = _DIAMONDS.get((length, width))
+    if shape is None:
+        shape = (math.atan2(width, length) * 180.0 / math.pi,
+                 math.sqrt(length ** 2 + width ** 2) / 2)
+        _DIAMONDS[(length, width)] = shape
+    return shape
+
+
+#################### Turtle State ####################
+# The turtle attributes that push_state can save, in the order pop_state
+# restores them (speed is last, as changing it from 0 flushes the turtle)
+STATE_ATTRIBUTES = ('x', 'y', 'heading', 'color', 'drawmode', 'speed')
+
+# The stack of saved states of each turtle
+_STATE_STACKS = weakref.WeakKeyDictionary()
+
+
+class TurtleState(object):
+    """
+    The saved attributes of a turtle, as pushed by push_state.
+
+    Only the attributes in names are saved and restored. The others are None.
+
+    Attribute names: The attributes saved
+    Invariant: names is a tuple of elements of STATE_ATTRIBUTES
+
+    The other attributes are those of STATE_ATTRIBUTES.
+    """
+    __slots__ = STATE_ATTRIBUTES + ('names',)
+
+    def __init__(self, t, names=STATE_ATTRIBUTES):
+        """
+        Initializes the saved state of t.
+
+        Parameter t: The turtle to save
+        Precondition: t is a Turtle
+
+        Parameter names: The attributes to save
+        Precondition: names is a tuple of elements of STATE_ATTRIBUTES
+        """
+        self.names = names
+        for name in STATE_ATTRIBUTES:
+            setattr(self, name, getattr(t, name) if name in names else None)
+
+    def apply(self, t):
+        """
+        Gives t the saved attributes, setting only those that differ.
+
+        Parameter t: The turtle to restore
+        Precondition: t is a Turtle
+        """
+        values = dict((name, getattr(self, name)) for name in self.names)
+        set_state(t, **values)
+
+
+def set_state(t, **changes):
+    """
+    Sets the given attributes of t, skipping those it already has.
+
+    Every attribute set on a turtle updates it on the window, even when the
+    value is the same. Colors are the same if they are the same web color,
+    and positions are the same within round-off (1e-9). Positions are set
+    with move, so nothing is drawn.
+
+    Parameter t: The turtle to change
+    Precondition: t is a Turtle
+
+    Parameter changes: The new attribute values
+    Precondition: changes are valid values of attributes in STATE_ATTRIBUTES
+    """
+    x = changes.get('x', t.x)
+    y = changes.get('y', t.y)
+    if abs(x - t.x) > 1e-9 or abs(y - t.y) > 1e-9:
+        t.move(x, y)
+    for name in STATE_ATTRIBUTES[2:]:
+        if name not in changes:
+            continue
+        value = changes[name]
+        old = getattr(t, name)
+        if name == 'color':
+            same = old is value or old == value or color_index(old) == color_index(value)
+        else:
+            same = old == value
+        if not same:
+            setattr(t, name, value)
+
+
+def push_state(t, names=STATE_ATTRIBUTES, **changes):
+    """
+    Saves the given attributes of t on its state stack, and then changes them.
+
+    The changes are made as in set_state. The saved attributes are restored
+    by the matching pop_state. This replaces saving attributes in local
+    variables and setting them back, without setting anything that did not
+    change (which adds up in nested figures, like draw_hex).
+
+    Parameter t: The turtle to save
+    Precondition: t is a Turtle
+
+    Parameter names: The attributes to save
+    Precondition: names is a tuple of elements of STATE_ATTRIBUTES
+
+    Parameter changes: The new attribute values
+    Precondition: changes are valid values of attributes in STATE_ATTRIBUTES
+    """
+    stack = _STATE_STACKS.get(t)
+    if stack is None:
+        stack = []
+        _STATE_STACKS[t] = stack
+    stack.append(TurtleState(t, names))
+    if changes:
+        set_state(t, **changes)
+
+
+def pop_state(t):
+    """
+    Restores the attributes of t saved by the last push_state.
+
+    Only attributes that changed since then are set.
+
+    Parameter t: The turtle to restore
+    Precondition: t is a Turtle with a state pushed by push_state
+    """
+    stack = _STATE_STACKS.get(t)
+    assert stack, report_error('No turtle state to pop', t)
+    stack.pop().apply(t)
+
+
 #################### DEMO: Two lines ####################
 def draw_two_lines(w, sp):
     """
@@ -153,7 +723,7 @@ def draw_two_lines(w, sp):
     w.clear()
 
     # Create a turtle and set its speed, then draw the lines
-    t = Turtle(w)
+    t = _turtle.Turtle(w)
     t.speed = sp
     t.color = 'green'  # Set color for the first line
     t.forward(100)  # Draw a green line 100 pixels in the current direction
@@ -194,10 +764,8 @@ def draw_triangle(t, s, c):
     assert is_valid_length(s), report_error('Invalid side length', s)
     assert is_valid_color(c), report_error('Invalid color', c)
 
-    # Save the current color and speed for restoration later
-    col = t.color
-    t.color = c  # Set the turtle's color for the triangle
-    spd = t.speed
+    # Save the current color and speed, and set the color for the triangle
+    push_state(t, ('color', 'speed'), color=c)
 
     # Draw the equilateral triangle
     for i in range(3):
@@ -205,8 +773,7 @@ def draw_triangle(t, s, c):
         t.right(120)  # Turn the turtle 120 degrees to form the triangle
 
     # Restore the turtle's original color and speed
-    t.color = col
-    t.speed = spd
+    pop_state(t)
     t.flush()  # Ensure drawing is visible, especially if speed is 0
 
 
@@ -237,10 +804,8 @@ def draw_hex(t, s):
     assert is_valid_turtlemode(t), report_error('Invalid turtle mode', t)
     assert is_valid_length(s), report_error('Invalid side length', s)
 
-    # Save the current color and speed for restoration later
-    col = t.color
-    t.color = 'cyan'  # Set the color for the hexagon
-    spd = t.speed
+    # Save the current color and speed, and set the color for the hexagon
+    push_state(t, ('color', 'speed'), color='cyan')
 
     # Draw six triangles to form a hexagon
     for j in range(6):
@@ -248,8 +813,7 @@ def draw_hex(t, s):
         t.left(60)  # Turn the turtle 60 degrees to make the next triangle
 
     # Restore the turtle's original color and speed
-    t.color = col
-    t.speed = spd
+    pop_state(t)
     t.flush()  # Ensure drawing is visible, especially if speed is 0
 
 
@@ -278,10 +842,8 @@ def draw_circle(t, r):
     assert is_valid_turtlemode(t), report_error('Invalid turtle mode', t)
     assert is_valid_length(r), report_error('Invalid radius', r)
 
-    # Save the current color and speed for restoration later
-    col = t.color
-    t.color = 'red'  # Set the color for the circle
-    spd = t.speed
+    # Save the current color and speed, and set the color for the circle
+    push_state(t, ('color', 'speed'), color='red')
 
     # Draw the circle by approximating it with many small steps
     circumference = 2 * math.pi * r  # Calculate the circumference
@@ -294,8 +856,7 @@ def draw_circle(t, r):
         t.left(angle)  # Turn the turtle to form the next step of the circle
 
     # Restore the turtle's original color and speed
-    t.color = col
-    t.speed = spd
+    pop_state(t)
     t.flush()  # Ensure drawing is visible, especially if speed is 0
 
 
@@ -328,19 +889,20 @@ def draw_hex(t, s):
     assert is_valid_turtlemode(t), report_error('Invalid turtle mode', t)
     assert is_valid_length(s), report_error('Invalid side length', s)
 
-    # Store the turtle's current color and speed to restore later
-    col = t.color
-    t.color = 'cyan'  # Set color to cyan for the hexagon drawing
-    spd = t.speed  # Store the current speed of the turtle
+    # Store the turtle's current color and speed, and set color to cyan
+    push_state(t, ('color', 'speed'), color='cyan')
 
-    # Draw six equilateral triangles to form the hexagon
-    for j in range(6):
-        draw_triangle(t, s, 'cyan')  # Draw one triangle
-        t.left(60)  # Rotate the turtle by 60 degrees for the next triangle
+    if t.speed == 0:
+        # Nothing to animate, so draw each shared spoke only once
+        draw_geometry(t, hex_geometry(s, t.x, t.y, t.heading))
+    else:
+        # Draw six equilateral triangles to form the hexagon
+        for j in range(6):
+            draw_triangle(t, s, 'cyan')  # Draw one triangle
+            t.left(60)  # Rotate the turtle by 60 degrees for the next triangle
 
     # Restore the turtle's original attributes
-    t.color = col
-    t.speed = spd
+    pop_state(t)
     t.flush()  # Ensure the drawing is rendered if speed is 0
 
 #################### TASK 3A: Spirals ####################
@@ -377,7 +939,7 @@ def draw_spiral(w, side, ang, n, sp):
 
     # Clear the window and create a new turtle
     w.clear()
-    t = Turtle(w)
+    t = _turtle.Turtle(w)
     t.heading = 270  # Position the turtle to face south
     draw_spiral_helper(t, side, ang, n, sp)  # Draw the spiral using the helper function
     t.visible = False  # Hide the turtle after drawing is complete
@@ -422,23 +984,29 @@ def draw_spiral_helper(t, side, ang, n, sp):
     assert is_number(ang), report_error('ang is not a valid angle', ang)
 
     # Store the turtle's initial color and speed to restore after drawing
-    savedColor = t.color
-    savedSpeed = t.speed
+    push_state(t, ('color', 'speed'), speed=sp)
     col = ['blue', 'magenta', 'red']  # Color sequence for the lines
     myIndex = 0  # Index to track the current color
 
-    # Draw each line of the spiral
-    for i in range(n):
-        t.color = col[myIndex]  # Set the color for the current line
-        myIndex = (myIndex + 1) % 3  # Move to the next color in the sequence
+    if sp == 0:
+        # Nothing to animate, so draw the precomputed lines directly
+        geom = spiral_geometry(side, ang, n, t.x, t.y, t.heading)
+        draw_geometry(t, geom)
+        end = geom.segments[-1, 2:].tolist()
+        t.move(end[0], end[1])
+        t.heading = t.heading + n * ang
+    else:
+        # Draw each line of the spiral
+        for i in range(n):
+            t.color = col[myIndex]  # Set the color for the current line
+            myIndex = (myIndex + 1) % 3  # Move to the next color in the sequence
 
-        # Draw the line with increasing length
-        t.forward((i + 1) * side)
-        t.left(ang)  # Turn by the specified angle after each line
+            # Draw the line with increasing length
+            t.forward((i + 1) * side)
+            t.left(ang)  # Turn by the specified angle after each line
 
     # Restore the turtle's original color and speed
-    t.color = savedColor
-    t.speed = savedSpeed
+    pop_state(t)
 
 
 #################### TASK 3B: Polygons ####################
@@ -484,7 +1052,7 @@ def multi_polygons(w, side, k, n, sp):
     w.clear()
 
     # Initialize the turtle object at the center, facing north
-    t = Turtle(w)
+    t = _turtle.Turtle(w)
     t.heading = 90
 
     # Call the helper function to draw the polygons
@@ -533,33 +1101,33 @@ def multi_polygons_helper(t, side, k, n, sp):
     assert type(n) == int, report_error('n is not an int', n)
     assert n >= 3, report_error('n is not a valid number of sides', n)
 
-    # Save the turtle's original color and speed settings to restore them later
-    savedColor = t.color
-    savedSpeed = t.speed
-
     # Define alternating colors for the polygons
     col = ['blue', 'orange']
 
-    # Set the initial color to blue
-    t.color = col[0]
+    # Save the turtle's original color and speed, then set the speed and
+    # the initial color (blue)
+    push_state(t, ('color', 'speed'), speed=sp, color=col[0])
 
     # Calculate the angle for rotation after each polygon
     ang = 360.0 / k
 
-    # Draw the k polygons
-    for i in range(k):
-        # Alternate the colors between blue and orange
-        t.color = col[(i - 1) % 2]
+    if sp == 0:
+        # Nothing to animate, so draw the precomputed polygons directly
+        draw_geometry(t, polygons_geometry(side, k, n, t.x, t.y, t.heading))
+    else:
+        # Draw the k polygons
+        for i in range(k):
+            # Alternate the colors between blue and orange
+            t.color = col[(i - 1) % 2]
 
-        # Draw a polygon using the helper function
-        draw_polygon(t, side, n)
+            # Draw a polygon using the helper function
+            draw_polygon(t, side, n)
 
-        # Turn the turtle left by the calculated angle
-        t.left(ang)
+            # Turn the turtle left by the calculated angle
+            t.left(ang)
 
     # Restore the turtle's original speed and color settings
-    t.speed = savedSpeed
-    t.color = savedColor
+    pop_state(t)
 
 
 # DO NOT MODIFY
@@ -625,17 +1193,8 @@ def draw_diamond(t, length, width):
     assert is_valid_length(length), report_error('length is not a valid length', length)
     assert is_valid_length(width), report_error('width is not a valid length', width)
 
-    # Calculate the next position to go to, based on the major axis and minor axis
-    angle1 = t.heading * math.pi / 180.0
-    x2 = t.x + math.cos(angle1) * length / 2
-    y2 = t.y + math.sin(angle1) * length / 2
-    x2 -= math.sin(angle1) * width / 2
-    y2 += math.cos(angle1) * width / 2
-
-    # Calculate the angle and edge length for the diamond
-    angle2 = math.atan2(y2 - t.y, x2 - t.x) * 180.0 / math.pi
-    angle3 = angle2 - t.heading
-    edgesz = math.sqrt((x2 - t.x) ** 2 + (y2 - t.y) ** 2)
+    # The turn angle and edge length only depend on the shape, not the heading
+    angle3, edgesz = _diamond_shape(length, width)
 
     # Draw the diamond by moving the turtle forward and turning as necessary
     t.right(angle3)
@@ -649,8 +1208,109 @@ def draw_diamond(t, length, width):
     t.right(angle3)
 
 
+#################### TASK 3C: Radiating Petals ####################
+def radiate_petals(w, radius, width, n, sp):
+    """
+    Draws a color flower with n petals, using radiate_petals_helper.
+
+    This function clears the window and makes a new turtle. The turtle starts
+    in the middle of the window facing north. It then calls the helper
+    radiate_petals_helper(t, radius, width, n, sp). When done, the turtle is
+    left hidden (visible is False).
+
+    REMEMBER: You need to flush the turtle if the speed is 0.
+
+    This procedure asserts all preconditions.
+
+    Parameter w: The window to draw upon.
+    Precondition: w is a introcs Window object.
+
+    Parameter radius: The length of each petal (the flower radius)
+    Precondition: radius is a valid side length (number >= 0)
+
+    Parameter width: The width of each petal
+    Precondition: width is a valid side length (number >= 0)
+
+    Parameter n: The number of petals
+    Precondition: n is an int >= 1
+
+    Parameter sp: The turtle speed.
+    Precondition: sp is a valid turtle speed.
+    """
+    # Assert the preconditions to ensure valid inputs
+    assert is_window(w), report_error('w is not a valid window', w)
+    assert is_valid_length(radius), report_error('radius is not a valid length', radius)
+    assert is_valid_length(width), report_error('width is not a valid length', width)
+    assert is_valid_iteration(n), report_error('n is not a valid number of petals', n)
+    assert is_valid_speed(sp), report_error('sp is not a valid speed', sp)
+
+    # Clear the window and create a new turtle facing north
+    w.clear()
+    t = _turtle.Turtle(w)
+    t.heading = 90
+    radiate_petals_helper(t, radius, width, n, sp)
+    t.visible = False
+
+    # Flush the turtle if the speed is set to 0
+    if sp == 0:
+        t.flush()
+
+
+def radiate_petals_helper(t, length, width, n, sp):
+    """
+    Draws a color flower of n diamond petals radiating from the turtle position.
+
+    Each petal is drawn with draw_diamond, starting at the current heading and
+    turning 360/n degrees to the left after each one. The color of a petal is
+    the HSV color whose hue is the turtle heading (mod 360) when the petal is
+    drawn, with saturation and value 1.
+
+    WHEN DONE, THE FOLLOWING TURTLE ATTRIBUTES ARE THE SAME AS IT STARTED:
+    position (x and y, within round-off errors), heading, color, speed,
+    visible, and drawmode.
+
+    This procedure asserts all preconditions.
+
+    Parameter t: The drawing Turtle
+    Precondition: t is a Turtle with drawmode True.
+
+    Parameter length: The length of each petal
+    Precondition: length is a valid side length (number >= 0)
+
+    Parameter width: The width of each petal
+    Precondition: width is a valid side length (number >= 0)
+
+    Parameter n: The number of petals
+    Precondition: n is an int >= 1
+
+    Parameter sp: The turtle speed.
+    Precondition: sp is a valid turtle speed.
+    """
+    # Assert the preconditions to ensure valid inputs
+    assert is_valid_turtlemode(t), report_error('Invalid turtle mode', t)
+    assert is_valid_length(length), report_error('length is not a valid length', length)
+    assert is_valid_length(width), report_error('width is not a valid length', width)
+    assert is_valid_iteration(n), report_error('n is not a valid number of petals', n)
+    assert is_valid_speed(sp), report_error('sp is not a valid speed', sp)
+
+    # Save the current color and speed, and set the speed
+    push_state(t, ('color', 'speed'), speed=sp)
+
+    if sp == 0:
+        # Nothing to animate, so compute every petal at once and draw them
+        draw_geometry(t, petals_geometry(length, width, n, t.x, t.y, t.heading))
+    else:
+        for i in range(n):
+            t.color = introcs.HSV(t.heading % 360, 1, 1)
+            draw_diamond(t, length, width)
+            t.left(360.0 / n)
+
+    # Restore the turtle's original color and speed
+    pop_state(t)
+
+
 #################### TASK 4A: Sierpinski Triangle ####################
-def triangle(w, side, d, sp):
+def triangle(w, side, d, sp, deadline=None, pipeline=False):
     """
     Draws a Sierpinski triangle with the given side length and depth d.
 
@@ -671,19 +1331,49 @@ def triangle(w, side, d, sp):
         - Precondition: d is a valid depth (int >= 0).
     sp (int): The drawing speed (0 is the slowest, 10 is the fastest).
         - Precondition: sp is a valid turtle/pen speed.
+    deadline (float): The time budget in seconds, or None for no limit.
+        - Precondition: deadline is None or a number > 0.
+
+    pipeline (bool): Whether to compute and draw the triangle at the same time.
+        - Precondition: pipeline is a bool.
+
+    If deadline is given, the triangle is drawn without animation, at the
+    deepest depth (at most d) that fits the budget, and the function returns
+    a RenderReport (see render_within). Otherwise it returns None. A
+    deadline requires sp to be 0 and pipeline to be False.
+
+    If pipeline is True, the triangle is drawn without animation, a subtree
+    at a time, while the next subtree is computed (see draw_pipelined).
+
+    If sp is 0, there is nothing to animate, so the triangle is computed at
+    once and drawn with draw_geometry, which draws deep triangles as a single
+    image (see RENDER_MODE).
     """
     # Ensure all preconditions are met before starting the drawing
     assert is_window(w), report_error('w is not a valid window', w)
     assert is_valid_length(side), report_error('side is not a valid length', side)
     assert is_valid_speed(sp), report_error('sp is not a valid speed', sp)
     assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    assert type(pipeline) == bool, report_error('pipeline is not a bool', pipeline)
+    timed = deadline is not None
+    assert not timed or (is_number(deadline) and deadline > 0), report_error('Invalid deadline', deadline)
+    assert not timed or sp == 0, report_error('A deadline needs speed 0', sp)
+    assert not (timed and pipeline), report_error('A deadline cannot be pipelined', pipeline)
+
+    if timed:
+        return render_within(w, 'triangle', lambda depth: triangle_geometry(side, depth), d, deadline)
 
     # Clear the window and set up the drawing pen
     w.clear()
-    p = Pen(w, (0, 0), 'black', 'magenta', 10)  # Create a Pen object with specified attributes
+    p = _turtle.Pen(w, (0, 0), 'black', 'magenta', 10)  # Create a Pen object with specified attributes
     p.visible = True  # Make the pen visible
     p.solid = False  # Set the pen to not draw solid shapes
-    triangle_helper(p, 0, 0, side, d)  # Call the helper function to draw the triangle
+    if pipeline:
+        draw_pipelined(p, triangle_chunks(side, d))  # Compute the next subtree while drawing
+    elif sp == 0:
+        draw_geometry(p, triangle_geometry(side, d))  # Nothing to animate
+    else:
+        triangle_helper(p, 0, 0, side, d)  # Call the helper function to draw the triangle
 
     # If speed is 0, flush the drawing buffer to ensure visibility
     if sp == 0:
@@ -807,7 +1497,7 @@ def fill_rect(p, x, y, side, hght):
 
 
 #################### TASK 5: Minkowski Island ####################
-def island(w, side, d, sp):
+def island(w, side, d, sp, filled=False, fillcolor='green', deadline=None, pipeline=False):
     """
     Draws a Minkowski island with the given side length and depth d.
 
@@ -816,6 +1506,10 @@ def island(w, side, d, sp):
     'side'. It draws the island recursively by calling the function island_edge(t, side, d)
     four times, rotating the turtle left after each call to form a square.
 
+    If filled is True, the inside of the island is painted with fillcolor
+    before the outline is drawn. The fill is computed off-screen from the
+    island vertices (see fill_mask), so it is fast even at large depths.
+
     REMEMBER: You need to flush the turtle if the speed is 0.
 
     Parameters:
@@ -827,26 +1521,75 @@ def island(w, side, d, sp):
         - Precondition: d is a valid depth (int >= 0).
     sp (int): The drawing speed (0 is the slowest, 10 is the fastest).
         - Precondition: sp is a valid turtle/pen speed.
+    filled (bool): Whether to fill the island.
+        - Precondition: filled is a bool.
+    fillcolor: The color of the inside of the island.
+        - Precondition: fillcolor is a valid turtle color.
+    deadline (float): The time budget in seconds, or None for no limit.
+        - Precondition: deadline is None or a number > 0.
+
+    pipeline (bool): Whether to compute and draw the island at the same time.
+        - Precondition: pipeline is a bool.
+
+    If deadline is given, the island outline is drawn without animation, at
+    the deepest depth (at most d) that fits the budget, and the function
+    returns a RenderReport (see render_within). Otherwise it returns None.
+    A deadline requires sp to be 0, and filled and pipeline to be False.
+
+    If pipeline is True, the outline is drawn without animation, a part at
+    a time, while the next part is computed (see draw_pipelined).
     """
     # Ensure all preconditions are met before starting the drawing
     assert is_window(w), report_error('w is not a valid window', w)
     assert is_valid_length(side), report_error('side is not a valid length', side)
     assert is_valid_speed(sp), report_error('sp is not a valid speed', sp)
     assert is_valid_depth(d), report_error('d is not a valid depth', d)
-
-    # Clear the window and create a turtle for drawing
+    assert type(filled) == bool, report_error('filled is not a bool', filled)
+    assert is_valid_color(fillcolor), report_error('fillcolor is not a valid color', fillcolor)
+    assert type(pipeline) == bool, report_error('pipeline is not a bool', pipeline)
+    timed = deadline is not None
+    assert not timed or (is_number(deadline) and deadline > 0), report_error('Invalid deadline', deadline)
+    assert not timed or sp == 0, report_error('A deadline needs speed 0', sp)
+    assert not (timed and filled), report_error('A deadline cannot be filled', filled)
+    assert not (timed and pipeline), report_error('A deadline cannot be pipelined', pipeline)
+
+    if timed:
+        return render_within(w, 'island', lambda depth: island_geometry(side, depth), d, deadline)
+
+    # Clear the window and create a turtle at the lower right corner, facing north
     w.clear()
-    t = Pen(w, (0, 0), 'black', 'green', 5)
-    t.visible = True  # Set the pen to visible
+    t = _turtle.Turtle(w)
+    t.speed = sp
+    t.move(side / 2, -side / 2)
+    t.heading = 90
+
+    fast = sp == 0 and d > 0 and not pipeline
+    path = island_path(side, d) if filled or fast else None
+    if filled:
+        # Paint the inside first, so that the outline goes on top
+        screen = _screen_coords(path, w.width / 2, w.height / 2)
+        mask = fill_mask(screen, w.width, w.height)
+        image = np.zeros(mask.shape + (4,), dtype=np.uint8)
+        image[mask] = color_rgb(fillcolor) + (255,)
+        from PIL import Image
+        _blit_image(t, Image.fromarray(image, 'RGBA'))
+
+    if pipeline:
+        # Compute the next part of the outline while the window draws the last
+        draw_pipelined(t, island_chunks(side, d, t.color))
+    elif fast:
+        # The four edges are rotated copies of one, so compute it only once
+        draw_geometry(t, Geometry(segments=path_segments(path), palette=[t.color]))
+    else:
+        for _ in range(4):
+            island_edge(t, side, d)  # Draw one side of the square
+            t.left(90)  # Turn to the next side
 
-    # Draw the island by recursively drawing the square shape at different depths
-    island_edge(t, side, d)  # Start drawing the island
+    t.visible = False  # Hide the turtle after drawing the island
 
     # Flush the drawing buffer if speed is set to 0
     if sp == 0:
         t.flush()
-
-    t.visible = False  # Hide the pen after drawing the island
     
 
 def island_edge(t, side, d):
@@ -871,7 +1614,12 @@ def island_edge(t, side, d):
     assert is_number(side), report_error('side is not a valid number', side)
     assert is_valid_depth(d), report_error('d is not a valid depth', d)
 
-    if d == 0:
+    if t.speed == 0 and d > 0:
+        # Nothing to animate, so draw the whole edge as one connected line
+        path = island_edge_path(t.x, t.y, t.heading, side, d)
+        draw_geometry(t, Geometry(segments=path_segments(path), palette=[t.color]))
+        t.move(float(path[-1, 0]), float(path[-1, 1]))
+    elif d == 0:
         t.forward(side)
     else:
         side = side / 4
@@ -889,3 +1637,3492 @@ def island_edge(t, side, d):
         island_edge(t, side, d - 1)  # Recursively draw the seventh part
         t.left(90)  # Turn left by 90 degrees
         island_edge(t, side, d - 1)  # Recursively draw the eighth part
+
+
+#################### Recorded Geometry ####################
+# The largest stored coordinate of each storage precision (None if not quantized)
+GEOMETRY_PRECISIONS = {'float64': None, 'float32': None, 'int32': 2 ** 31 - 1, 'int16': 32767}
+
+# The storage precision of the geometry computed by island_geometry,
+# triangle_geometry and spiral_geometry (see Geometry)
+GEOMETRY_PRECISION = 'float64'
+
+
+class Geometry(object):
+    """
+    A recorded a4 figure: the lines and filled triangles that make up a drawing.
+
+    Each color is stored once in the palette. The segments and triangles
+    refer to their color by its position in the palette, so that large
+    figures do not store a color per shape.
+
+    Coordinates may be stored with less precision than they are read. They
+    are stored as given, and read as stored*scale + origin, in float64 (or
+    as stored, if that is a float array and there is no scale or origin).
+    Storing in float32 halves the size of a figure, and storing integers
+    quantized to the figure bounds (see quantize_coords) halves or quarters
+    it, with far less error than a pixel.
+
+    Reading segments or triangles of an integer figure decodes a new float64
+    array each time, as large as the float figure it replaced. Code that reads
+    them more than once should read them from decoded() instead.
+
+    Attribute segments: The line segments, one row (x0, y0, x1, y1) per segment
+    Invariant: segments is a numpy float array of shape (m, 4) (read-only)
+
+    Attribute segcolors: The palette index of each line segment
+    Invariant: segcolors is a numpy uint16 array of length m
+
+    Attribute triangles: The filled triangles, one row (x0, y0, x1, y1, x2, y2)
+    per triangle
+    Invariant: triangles is a numpy float array of shape (k, 6) (read-only)
+
+    Attribute tricolors: The palette index of each triangle
+    Invariant: tricolors is a numpy uint16 array of length k
+
+    Attribute palette: The colors used by the figure
+    Invariant: palette is a list of valid turtle colors
+
+    Attribute scale: The size of a unit of the stored coordinates
+    Invariant: scale is a float > 0
+
+    Attribute origin: The point at stored coordinates (0, 0)
+    Invariant: origin is a tuple of two floats
+    """
+    # HIDDEN ATTRIBUTES:
+    #    _segments  : The stored segments, a numpy array of shape (m, 4)
+    #    _triangles : The stored triangles, a numpy array of shape (k, 6)
+
+    @property
+    def segments(self):
+        """
+        The line segments, decoded from their stored coordinates.
+
+        Each read of an integer figure makes a new float64 array (see decoded).
+        """
+        return self._decode(self._segments)
+
+    @property
+    def triangles(self):
+        """
+        The filled triangles, decoded from their stored coordinates.
+
+        Each read of an integer figure makes a new float64 array (see decoded).
+        """
+        return self._decode(self._triangles)
+
+    def __init__(self, segments=None, segcolors=None, triangles=None,
+                 tricolors=None, palette=None, scale=1.0, origin=(0.0, 0.0)):
+        """
+        Initializes a recorded figure.
+
+        Any attribute that is not given starts empty.
+
+        Parameter segments: The line segments
+        Precondition: segments is None or an array-like of shape (m, 4)
+
+        Parameter segcolors: The palette index of each segment
+        Precondition: segcolors is None or an array-like of m ints
+
+        Parameter triangles: The filled triangles
+        Precondition: triangles is None or an array-like of shape (k, 6)
+
+        Parameter tricolors: The palette index of each triangle
+        Precondition: tricolors is None or an array-like of k ints
+
+        Parameter palette: The colors used by the figure
+        Precondition: palette is None or a list of valid turtle colors
+
+        Parameter scale: The size of a unit of the stored coordinates
+        Precondition: scale is a number > 0
+
+        Parameter origin: The point at stored coordinates (0, 0)
+        Precondition: origin is a pair of numbers
+        """
+        assert is_number(scale) and scale > 0, report_error('Invalid scale', scale)
+        self._segments = (np.zeros((0, 4)) if segments is None
+                          else np.asarray(segments).reshape(-1, 4))
+        self.segcolors = (np.zeros(len(self._segments), dtype=np.uint16)
+                          if segcolors is None else np.asarray(segcolors, dtype=np.uint16))
+        self._triangles = (np.zeros((0, 6)) if triangles is None
+                           else np.asarray(triangles).reshape(-1, 6))
+        self.tricolors = (np.zeros(len(self._triangles), dtype=np.uint16)
+                          if tricolors is None else np.asarray(tricolors, dtype=np.uint16))
+        self.palette = ['black'] if palette is None else list(palette)
+        self.scale = float(scale)
+        self.origin = (float(origin[0]), float(origin[1]))
+
+    def precision(self):
+        """
+        Returns: the storage precision of the coordinates, a key of GEOMETRY_PRECISIONS.
+        """
+        stored = self._triangles if len(self._triangles) and not len(self._segments) else self._segments
+        return stored.dtype.name
+
+    def nbytes(self):
+        """
+        Returns: the size of the stored coordinates and color indices in bytes.
+        """
+        return (self._segments.nbytes + self._triangles.nbytes +
+                self.segcolors.nbytes + self.tricolors.nbytes)
+
+    def decoded(self):
+        """
+        Returns: this figure with its coordinates decoded once, or this figure if
+        reading them needs no decoding.
+
+        The copy holds float64 coordinates, so while it is alive an int16 figure
+        takes five times its stored size (four for int32). Drawing functions call
+        this once and then read the copy as often as they need.
+        """
+        stored = [self._segments.dtype.kind, self._triangles.dtype.kind]
+        if self.scale == 1 and self.origin == (0, 0) and stored == ['f', 'f']:
+            return self
+        return Geometry(segments=self.segments, segcolors=self.segcolors,
+                        triangles=self.triangles, tricolors=self.tricolors, palette=self.palette)
+
+    def _decode(self, stored):
+        """
+        Returns: the coordinates of the stored points.
+
+        Parameter stored: The stored coordinates
+        Precondition: stored is a numpy array of (x, y) pairs along its last axis
+        """
+        if self.scale == 1 and self.origin == (0, 0) and stored.dtype.kind == 'f':
+            return stored
+        width = stored.shape[-1]
+        return stored * self.scale + np.tile(self.origin, width // 2)
+
+
+def quantize_coords(coords, precision=None):
+    """
+    Returns: the tuple (stored, scale, origin) storing coords in the given precision.
+
+    Float precisions are a plain conversion (scale 1, origin (0, 0)). Integer
+    precisions map the bounding box of coords onto the full integer range,
+    with one scale for both axes; the rounding error is at most scale/2.
+
+    Parameter coords: The coordinates to store
+    Precondition: coords is a numpy float array of (x, y) pairs along its last axis
+
+    Parameter precision: The storage precision (GEOMETRY_PRECISION if None)
+    Precondition: precision is None or a key of GEOMETRY_PRECISIONS
+    """
+    precision = GEOMETRY_PRECISION if precision is None else precision
+    assert precision in GEOMETRY_PRECISIONS, report_error('Invalid precision', precision)
+    limit = GEOMETRY_PRECISIONS[precision]
+    if limit is None:
+        return (coords.astype(precision, copy=False), 1.0, (0.0, 0.0))
+    if coords.size == 0:
+        return (coords.astype(precision), 1.0, (0.0, 0.0))
+
+    points = coords.reshape(-1, 2)
+    low = points.min(axis=0)
+    high = points.max(axis=0)
+    origin = (low + high) / 2
+    scale = float((high - low).max()) / 2 / limit or 1.0
+    stored = np.empty(coords.shape, dtype=precision)
+    np.rint((coords - np.tile(origin, coords.shape[-1] // 2)) / scale, out=stored, casting='unsafe')
+    return (stored, scale, (float(origin[0]), float(origin[1])))
+
+
+def quantize_geometry(geom, precision=None):
+    """
+    Returns: a copy of geom with its coordinates stored in the given precision.
+
+    Parameter geom: The figure to store
+    Precondition: geom is a Geometry object
+
+    Parameter precision: The storage precision (GEOMETRY_PRECISION if None)
+    Precondition: precision is None or a key of GEOMETRY_PRECISIONS
+    """
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+    segments = geom.segments
+    coords = np.concatenate([segments.ravel(), geom.triangles.ravel()])
+    stored, scale, origin = quantize_coords(coords, precision)
+    return Geometry(segments=stored[:segments.size], segcolors=geom.segcolors,
+                    triangles=stored[segments.size:], tricolors=geom.tricolors,
+                    palette=geom.palette, scale=scale, origin=origin)
+
+
+def path_segments(path):
+    """
+    Returns: the line segments of a path, one row (x0, y0, x1, y1) per line.
+
+    Parameter path: the path vertices
+    Precondition: path is a numpy array of shape (m+1, 2), with m >= 0
+    """
+    return np.hstack([path[:-1], path[1:]])
+
+
+# A step in each direction, starting north and turning left
+_ISLAND_UNITS = [[0, 1], [-1, 0], [0, -1], [1, 0]]
+
+# The turns of the eight parts of a Minkowski edge (see _island_edge_turns)
+_ISLAND_BASE = [0, 3, 0, 1, 1, 0, 3, 0]
+
+
+def _island_edge_turns(d):
+    """
+    Returns: the heading of every step of a depth-d Minkowski edge.
+
+    Headings are in units of 90 degrees (0 is the starting heading, 1 is a
+    left turn, 3 is a right turn), in the order island_edge draws them. A
+    depth-d edge is eight depth-(d-1) edges, turned by the headings of a
+    depth-1 edge.
+
+    Parameter d: the recursive depth
+    Precondition: d is a valid depth (int >= 0)
+    """
+    turns = np.zeros(1, dtype=np.uint8)
+    base = np.array(_ISLAND_BASE, dtype=np.uint8)
+    for _ in range(d):
+        turns = ((base[:, None] + turns[None, :]) % 4).ravel()
+    return turns
+
+
+def island_edge_path(x, y, heading, side, d):
+    """
+    Returns: the vertices of the Minkowski edge drawn by island_edge.
+
+    The result is a numpy array of shape (8**d+1, 2), with the points visited
+    by a turtle at (x, y) with the given heading as it draws the edge.
+
+    Parameter x: the starting x-coordinate
+    Precondition: x is a number
+
+    Parameter y: the starting y-coordinate
+    Precondition: y is a number
+
+    Parameter heading: the starting heading in degrees
+    Precondition: heading is a number
+
+    Parameter side: The length of the edge.
+    Precondition: side is a number.
+
+    Parameter d: The recursive depth of the edge.
+    Precondition: d is a valid depth (int >= 0).
+    """
+    step = side / 4 ** d
+    units = heading_steps(heading, 90, 4) * step
+    return _walk(x, y, units[_island_edge_turns(d)])
+
+
+def island_path(side, d, x=0, y=0, workers=None):
+    """
+    Returns: the vertices of the Minkowski island drawn by island.
+
+    The result is a numpy array of shape (4*8**d+1, 2). The island is traced
+    counter clockwise from the lower right corner of the square centered at
+    (x, y), starting north, and ends where it started.
+
+    Only the first edge is generated. The other three are the same edge
+    rotated by 90, 180 and 270 degrees. Vertices are computed in whole steps
+    (side/4**d) so that the rotations are exact swaps and negations.
+
+    Parameter side: The side length of the island.
+    Precondition: side is a valid side length (number >= 0).
+
+    Parameter d: The recursive depth of the island.
+    Precondition: d is a valid depth (int >= 0).
+
+    Parameter x: The x-coordinate of the island center
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the island center
+    Precondition: y is a number
+
+    Parameter workers: The number of processes to use (PARALLEL_WORKERS if None)
+    Precondition: workers is None or an int >= 1
+    """
+    workers = PARALLEL_WORKERS if workers is None else workers
+    assert type(workers) == int and workers >= 1, report_error('Invalid workers', workers)
+    if workers > 1 and d >= PARALLEL_DEPTH:
+        return _parallel_island_path(side, d, x, y, workers)
+
+    units = np.array(_ISLAND_UNITS, dtype=np.int32)
+    edge = np.cumsum(units[_island_edge_turns(d)], axis=0, dtype=np.int32)
+
+    n = len(edge)
+    steps = np.zeros((4 * n + 1, 2), dtype=np.int32)
+    for k in range(4):
+        # Each edge starts at the end of the previous one
+        np.add(edge, steps[k * n], out=steps[k * n + 1:(k + 1) * n + 1])
+        edge = edge[:, ::-1] * np.array([-1, 1], dtype=np.int32)
+
+    path = steps * (side / 4 ** d)
+    path += (x + side / 2, y - side / 2)
+    return path
+
+
+def island_geometry(side, d, color='black', workers=None, precision=None):
+    """
+    Returns: the Geometry of a Minkowski island with the given side length and depth d.
+
+    The island is the one drawn by island: a square of side length side,
+    centered at (0, 0), with each of its four sides replaced by a depth-d
+    Minkowski edge. It is traced counter clockwise from the lower right
+    corner, starting north.
+
+    Parameter side: The side length of the island.
+    Precondition: side is a valid side length (number >= 0).
+
+    Parameter d: The recursive depth of the island.
+    Precondition: d is a valid depth (int >= 0).
+
+    Parameter color: The island color
+    Precondition: color is a valid turtle color
+
+    Parameter workers: The number of processes to use (PARALLEL_WORKERS if None)
+    Precondition: workers is None or an int >= 1
+
+    Parameter precision: The storage precision (GEOMETRY_PRECISION if None)
+    Precondition: precision is None or a key of GEOMETRY_PRECISIONS
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    assert is_valid_color(color), report_error('color is not a valid color', color)
+
+    # Store the path before it is doubled into segments
+    path, scale, origin = quantize_coords(island_path(side, d, workers=workers), precision)
+    return Geometry(segments=path_segments(path), palette=[color], scale=scale, origin=origin)
+
+
+def spiral_geometry(side, ang, n, x=0, y=0, heading=270, precision=None):
+    """
+    Returns: the Geometry of the spiral drawn by draw_spiral.
+
+    Line i has length (i+1)*side and color blue, magenta or red (for i % 3
+    equal to 0, 1 or 2). By default the spiral starts at the center facing
+    south, as in draw_spiral.
+
+    Parameter side: The length of the first line
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter ang: The angle to turn after each line
+    Precondition: ang is a number
+
+    Parameter n: The number of lines
+    Precondition: n is an int >= 1
+
+    Parameter x: The starting x-coordinate
+    Precondition: x is a number
+
+    Parameter y: The starting y-coordinate
+    Precondition: y is a number
+
+    Parameter heading: The starting heading in degrees
+    Precondition: heading is a number
+
+    Parameter precision: The storage precision (GEOMETRY_PRECISION if None)
+    Precondition: precision is None or a key of GEOMETRY_PRECISIONS
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_number(ang), report_error('ang is not a valid angle', ang)
+    assert is_valid_iteration(n), report_error('n is not a valid number of iterations', n)
+
+    path = spiral_path(x, y, heading, side, ang, n)
+    path, scale, origin = quantize_coords(path, precision)
+    return Geometry(segments=path_segments(path), segcolors=np.arange(n) % 3,
+                    palette=['blue', 'magenta', 'red'], scale=scale, origin=origin)
+
+
+def petals_geometry(length, width, n, x=0, y=0, heading=0):
+    """
+    Returns: the Geometry of the petals drawn by radiate_petals_helper.
+
+    Petal i is the diamond of petal_paths, with the color of the hue of its
+    heading (heading+i*360/n), as in radiate_petals_helper.
+
+    Parameter length: The size of each petal major axis
+    Precondition: length is a valid length (number >= 0)
+
+    Parameter width: The size of each petal minor axis
+    Precondition: width is a valid length (number >= 0)
+
+    Parameter n: The number of petals
+    Precondition: n is an int >= 1
+
+    Parameter x: The x-coordinate of the flower center
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the flower center
+    Precondition: y is a number
+
+    Parameter heading: The heading of the first petal in degrees
+    Precondition: heading is a number
+    """
+    assert is_valid_length(length), report_error('length is not a valid length', length)
+    assert is_valid_length(width), report_error('width is not a valid length', width)
+    assert is_valid_iteration(n), report_error('n is not a valid number of petals', n)
+
+    points = petal_paths(x, y, heading, length, width, n).reshape(n, 5, 2)
+    segments = np.concatenate([points[:, :-1], points[:, 1:]], axis=2).reshape(-1, 4)
+    names, inverse = _web_palette(hsv_rgb((heading + np.arange(n) * (360.0 / n)) % 360))
+    return Geometry(segments=segments, segcolors=np.repeat(inverse, 4), palette=names)
+
+
+def polygons_geometry(side, k, n, x=0, y=0, heading=90, dedupe=None, order=None):
+    """
+    Returns: the Geometry of the k polygons drawn by multi_polygons.
+
+    Polygon i has n sides, starts at (x, y) with heading heading+i*360/k, and
+    alternates between orange and blue (starting with orange), as in
+    multi_polygons_helper.
+
+    Parameter side: The length of each polygon side
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter k: The number of polygons
+    Precondition: k is an int >= 1
+
+    Parameter n: The number of sides of each polygon
+    Precondition: n is an int >= 3
+
+    Parameter x: The starting x-coordinate
+    Precondition: x is a number
+
+    Parameter y: The starting y-coordinate
+    Precondition: y is a number
+
+    Parameter heading: The heading of the first polygon in degrees
+    Precondition: heading is a number
+
+    Parameter dedupe: Whether to remove repeated edges (DEDUPE if None)
+    Precondition: dedupe is None or a bool
+
+    Parameter order: The curve to sort the segments along (ORDER if None),
+    or False for drawing order (see order_geometry)
+    Precondition: order is None, False, 'hilbert' or 'morton'
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_iteration(k), report_error('k is not a valid number of polygons', k)
+    assert type(n) == int and n >= 3, report_error('n is not a valid number of sides', n)
+
+    # Polygon i is the first one turned by i*360/k degrees about (x, y)
+    shape = polygon_path(0, 0, heading, side, n)
+    turns = heading_steps(0, 360.0 / k, k)
+    cos = turns[:, 0, None]
+    sin = turns[:, 1, None]
+    paths = np.stack([x + cos * shape[:, 0] - sin * shape[:, 1],
+                      y + sin * shape[:, 0] + cos * shape[:, 1]], axis=2)
+    segments = np.concatenate([paths[:, :-1], paths[:, 1:]], axis=2).reshape(-1, 4)
+    colors = np.repeat((np.arange(k) + 1) % 2, n)
+    geom = Geometry(segments=segments, segcolors=colors,
+                    palette=['blue', 'orange'])
+    geom = _dedupe_figure('polygons_geometry', geom, dedupe)
+    return _order_figure('polygons_geometry', geom, order)
+
+
+def hex_geometry(s, x=0, y=0, heading=0, color='cyan', dedupe=None):
+    """
+    Returns: the Geometry of the hexagon drawn by draw_hex.
+
+    The hexagon is made of the six triangles drawn by draw_hex, from a turtle
+    at (x, y) with the given heading. Every inner spoke is an edge of two of
+    these triangles, so the figure has 18 segments but only 12 unique ones.
+
+    Parameter s: The length of each triangle side
+    Precondition: s is a valid side length (number >= 0)
+
+    Parameter x: The x-coordinate of the hexagon center
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the hexagon center
+    Precondition: y is a number
+
+    Parameter heading: The heading of the first triangle in degrees
+    Precondition: heading is a number
+
+    Parameter color: The hexagon color
+    Precondition: color is a valid turtle color
+
+    Parameter dedupe: Whether to remove repeated edges (DEDUPE if None)
+    Precondition: dedupe is None or a bool
+    """
+    assert is_valid_length(s), report_error('Invalid side length', s)
+    assert is_valid_color(color), report_error('Invalid color', color)
+
+    # Triangle j goes out along heading+60*j and turns right twice, so its
+    # sides use the headings of triangles j, j-2 and j-4
+    steps = heading_steps(heading, 60, 6) * s
+    turns = (np.arange(6)[:, None] + [0, 4, 2]) % 6
+    corners = np.cumsum(steps[turns], axis=1) + (x, y)
+    starts = np.concatenate([np.tile((x, y), (6, 1, 1)), corners[:, :2]], axis=1)
+    segments = np.concatenate([starts, corners], axis=2).reshape(-1, 4)
+    geom = Geometry(segments=segments, palette=[color])
+    return _dedupe_figure('hex_geometry', geom, dedupe)
+
+
+def triangle_geometry(side, d, x=0, y=0, fill='magenta', edge='black', workers=None,
+                      precision=None, order=None):
+    """
+    Returns: the Geometry of a Sierpinski triangle with the given side length and depth d.
+
+    The triangles are the ones filled by triangle_helper(p, x, y, side, d),
+    computed a level at a time instead of by recursion. Each triangle is
+    filled with fill and outlined (as three line segments) with edge.
+
+    Parameter side: The side length of the triangle.
+    Precondition: side is a valid side length (number >= 0).
+
+    Parameter d: The recursive depth of the triangle.
+    Precondition: d is a valid depth (int >= 0).
+
+    Parameter x: The x-coordinate of the triangle center.
+    Precondition: x is a number.
+
+    Parameter y: The y-coordinate of the triangle center.
+    Precondition: y is a number.
+
+    Parameter fill: The fill color
+    Precondition: fill is a valid turtle color
+
+    Parameter edge: The outline color
+    Precondition: edge is a valid turtle color
+
+    Parameter workers: The number of processes to use (PARALLEL_WORKERS if None)
+    Precondition: workers is None or an int >= 1
+
+    Parameter precision: The storage precision (GEOMETRY_PRECISION if None)
+    Precondition: precision is None or a key of GEOMETRY_PRECISIONS
+
+    Parameter order: The curve to sort the shapes along (ORDER if None),
+    or False for drawing order (see order_geometry)
+    Precondition: order is None, False, 'hilbert' or 'morton'
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    assert is_number(x), report_error('x is not a valid number', x)
+    assert is_number(y), report_error('y is not a valid number', y)
+    assert is_valid_color(fill), report_error('fill is not a valid color', fill)
+    assert is_valid_color(edge), report_error('edge is not a valid color', edge)
+    workers = PARALLEL_WORKERS if workers is None else workers
+    assert type(workers) == int and workers >= 1, report_error('Invalid workers', workers)
+
+    if workers > 1 and d >= PARALLEL_DEPTH:
+        triangles = _parallel_triangles(side, d, x, y, workers)
+    else:
+        centers, side = _triangle_centers(np.array([[x, y]], dtype=float), side, d)
+        triangles = _triangle_rows(centers, side)
+    # Store the triangles before their outlines are copied out of them
+    triangles, scale, origin = quantize_coords(triangles, precision)
+    segments = triangles[:, [0, 1, 2, 3, 2, 3, 4, 5, 4, 5, 0, 1]].reshape(-1, 4)
+    geom = Geometry(segments=segments, segcolors=np.ones(len(segments)),
+                    triangles=triangles, palette=[fill, edge], scale=scale, origin=origin)
+    return _order_figure('triangle_geometry', geom, order)
+
+
+def _triangle_centers(centers, side, d):
+    """
+    Returns: a pair (centers2, side2) for the depth-d triangles below centers.
+
+    centers2 are the centers of the triangles filled by triangle_helper
+    for each of the given centers, in the same order, and side2 is their
+    side length.
+
+    Parameter centers: The triangle centers, one row (x, y) per triangle
+    Precondition: centers is a numpy float array of shape (k, 2)
+
+    Parameter side: The side length of these triangles
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter d: The number of levels to go down
+    Precondition: d is a valid depth (int >= 0)
+    """
+    # Each level replaces every center with the three centers of its children
+    for _ in range(d):
+        h = (math.sqrt(3) / 2) * side
+        offsets = np.array([[0, 0], [side / 2, 0], [side / 4, h / 2]])
+        centers = (centers[:, None, :] + offsets[None, :, :]).reshape(-1, 2)
+        side = side / 2
+    return centers, side
+
+
+def _triangle_rows(centers, side):
+    """
+    Returns: the triangles filled by fill_triangle at each center.
+
+    The result has one row (x0, y0, x1, y1, x2, y2) per center.
+
+    Parameter centers: The triangle centers, one row (x, y) per triangle
+    Precondition: centers is a numpy float array of shape (k, 2)
+
+    Parameter side: The side length of the triangles
+    Precondition: side is a valid side length (number >= 0)
+    """
+    h = side * math.sqrt(0.75)
+    cx = centers[:, 0:1]
+    cy = centers[:, 1:2]
+    return np.hstack([cx - side / 2, cy - h / 2, cx + side / 2, cy - h / 2,
+                      cx, cy + h / 2])
+
+
+#################### Chain Codes ####################
+class ChainCode(object):
+    """
+    A rectilinear path of equal steps, stored in 2 bits per step.
+
+    Each step goes one of four directions: 0 is north, 1 west, 2 south and
+    3 east (as in _ISLAND_UNITS). Four steps are packed in each byte, the
+    first in the lowest two bits. A depth-8 island is 4*8**8 steps, so it
+    takes 16 MB this way instead of 1 GB as float coordinate pairs.
+
+    Attribute data: The packed steps
+    Invariant: data is a bytes object of length (count+3)//4
+
+    Attribute count: The number of steps
+    Invariant: count is an int >= 0
+
+    Attribute x: The x-coordinate of the start
+    Invariant: x is a number
+
+    Attribute y: The y-coordinate of the start
+    Invariant: y is a number
+
+    Attribute step: The length of each step
+    Invariant: step is a number >= 0
+    """
+
+    def __init__(self, data, count, x=0, y=0, step=1):
+        """
+        Initializes a chain code from its packed steps.
+
+        Parameter data: The packed steps
+        Precondition: data is a bytes object of length (count+3)//4
+
+        Parameter count: The number of steps
+        Precondition: count is an int >= 0
+
+        Parameter x: The x-coordinate of the start
+        Precondition: x is a number
+
+        Parameter y: The y-coordinate of the start
+        Precondition: y is a number
+
+        Parameter step: The length of each step
+        Precondition: step is a number >= 0
+        """
+        assert type(count) == int and count >= 0, report_error('Invalid count', count)
+        assert len(data) == (count + 3) // 4, report_error('data does not match count', count)
+        self.data = bytes(data)
+        self.count = count
+        self.x = x
+        self.y = y
+        self.step = step
+
+    def nbytes(self):
+        """
+        Returns: the size of the packed steps in bytes.
+        """
+        return len(self.data)
+
+    def directions(self):
+        """
+        Returns: the direction of every step, as a numpy uint8 array.
+        """
+        packed = np.frombuffer(self.data, dtype=np.uint8)
+        codes = (packed[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+        return codes.ravel()[:self.count]
+
+    def path(self):
+        """
+        Returns: the vertices of this path, as a numpy array of shape (count+1, 2).
+
+        All steps are decoded in one pass. The vertices are found on the
+        integer lattice first, so that they are exact multiples of step.
+        """
+        units = np.array(_ISLAND_UNITS, dtype=np.int32)
+        steps = np.zeros((self.count + 1, 2), dtype=np.int32)
+        np.cumsum(units[self.directions()], axis=0, out=steps[1:])
+        path = steps * float(self.step)
+        path += (self.x, self.y)
+        return path
+
+
+def chain_encode(directions, x=0, y=0, step=1):
+    """
+    Returns: the ChainCode of the given step directions.
+
+    Parameter directions: The direction of every step (see ChainCode)
+    Precondition: directions is an array-like of ints in 0..3
+
+    Parameter x: The x-coordinate of the start
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the start
+    Precondition: y is a number
+
+    Parameter step: The length of each step
+    Precondition: step is a number >= 0
+    """
+    codes = np.asarray(directions, dtype=np.uint8)
+    count = len(codes)
+    padded = np.zeros(4 * ((count + 3) // 4), dtype=np.uint8)
+    padded[:count] = codes & 3
+    quads = padded.reshape(-1, 4)
+    packed = quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+    return ChainCode(packed.tobytes(), count, x, y, step)
+
+
+def path_chain(path):
+    """
+    Returns: the ChainCode of a rectilinear path of equal steps.
+
+    Parameter path: The path vertices
+    Precondition: path is a numpy array of shape (m+1, 2), with m >= 1, where
+    every step has the same length and is horizontal or vertical
+    """
+    path = np.asarray(path, dtype=float)
+    delta = np.diff(path, axis=0)
+    step = float(np.abs(delta[0]).max())
+    assert step > 0, report_error('path does not move', step)
+    units = np.rint(delta / step).astype(int)
+    codes = np.select([units[:, 1] == 1, units[:, 0] == -1, units[:, 1] == -1], [0, 1, 2], 3)
+    expected = np.array(_ISLAND_UNITS)[codes] * step
+    assert np.allclose(delta, expected), report_error('path is not rectilinear', path)
+    return chain_encode(codes, float(path[0, 0]), float(path[0, 1]), step)
+
+
+def island_chain(side, d, x=0, y=0):
+    """
+    Returns: the ChainCode of the Minkowski island drawn by island.
+
+    The steps come straight from the production rules (see
+    _island_edge_turns), and are never turned into coordinates. Decoding
+    the result gives the same vertices as island_path(side, d, x, y).
+
+    Parameter side: The side length of the island.
+    Precondition: side is a valid side length (number >= 0).
+
+    Parameter d: The recursive depth of the island.
+    Precondition: d is a valid depth (int >= 0).
+
+    Parameter x: The x-coordinate of the island center
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the island center
+    Precondition: y is a number
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    edge = _island_edge_turns(d)
+    directions = np.concatenate([(edge + k) % 4 for k in range(4)])
+    return chain_encode(directions, x + side / 2, y - side / 2, side / 4 ** d)
+
+
+#################### Color Ramps ####################
+def color_ramp(geom, start=0, stop=360, groups=None, s=1, v=1,
+               segments=True, triangles=True):
+    """
+    Returns: a copy of geom colored with a ramp of HSV hues.
+
+    The hue goes from start (at the first shape) towards stop (at the last),
+    by the order the shapes are drawn. If groups is given, the shapes are
+    split into that many equal runs, and each run gets a single hue. For a
+    recursive figure this colors by recursion level: 4*8**k groups give
+    every depth-k part of an island its own color, and 3**k groups do the
+    same for the triangles of a Sierpinski triangle.
+
+    Every hue is converted in one numpy pass, and the colors are stored in
+    the figure palette, so a ramped figure is drawn the same way as a one
+    color figure. Neighboring segments that round to the same color are
+    still drawn as one line.
+
+    Parameter geom: The figure to color
+    Precondition: geom is a Geometry object
+
+    Parameter start: The first hue in degrees
+    Precondition: start is a number
+
+    Parameter stop: The hue the ramp goes towards in degrees
+    Precondition: stop is a number
+
+    Parameter groups: The number of single hue runs, or None for a smooth ramp
+    Precondition: groups is None or an int >= 1
+
+    Parameter s: the saturation
+    Precondition: s is a number in the range 0..1
+
+    Parameter v: the value (brightness)
+    Precondition: v is a number in the range 0..1
+
+    Parameter segments: Whether to color the line segments
+    Precondition: segments is a bool
+
+    Parameter triangles: Whether to color the triangles
+    Precondition: triangles is a bool
+    """
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+    assert is_number(start), report_error('start is not a valid hue', start)
+    assert is_number(stop), report_error('stop is not a valid hue', stop)
+    assert groups is None or is_valid_iteration(groups), report_error('Invalid groups', groups)
+    assert is_number(s) and 0 <= s <= 1, report_error('s is not a valid saturation', s)
+    assert is_number(v) and 0 <= v <= 1, report_error('v is not a valid value', v)
+
+    result = Geometry(segments=geom._segments, segcolors=geom.segcolors,
+                      triangles=geom._triangles, tricolors=geom.tricolors,
+                      palette=geom.palette, scale=geom.scale, origin=geom.origin)
+    if segments and len(geom.segcolors):
+        result.segcolors = _ramp_colors(result, len(geom.segcolors), start, stop, groups, s, v)
+    if triangles and len(geom.tricolors):
+        result.tricolors = _ramp_colors(result, len(geom.triangles), start, stop, groups, s, v)
+    return result
+
+
+def _ramp_colors(geom, m, start, stop, groups, s, v):
+    """
+    Returns: the palette indices of a ramp of m colors, adding them to the palette of geom.
+
+    Parameter geom: The figure whose palette gets the colors
+    Precondition: geom is a Geometry object
+
+    Parameter m: The number of shapes
+    Precondition: m is an int >= 1
+
+    Other parameters are as in color_ramp.
+    """
+    steps = np.arange(m)
+    if groups is not None:
+        steps = (steps * groups) // m * (m / groups)
+    hues = (start + (stop - start) * steps / m) % 360
+    names, inverse = _web_palette(hsv_rgb(hues, s, v))
+    assert len(geom.palette) + len(names) <= 65536, report_error('Too many colors', len(names))
+    first = len(geom.palette)
+    geom.palette = geom.palette + names
+    return (inverse + first).astype(np.uint16)
+
+
+#################### Parallel Generation ####################
+# The number of processes island_path and triangle_geometry use by default,
+# and the smallest depth worth splitting across them. Starting processes
+# costs tens of milliseconds, so only very deep figures gain from it.
+PARALLEL_WORKERS = 1
+PARALLEL_DEPTH = 8
+
+
+def _run_parallel(shape, workers, task, jobs):
+    """
+    Returns: a float array of the given shape, filled in by task(*job) for every job.
+
+    The array is allocated in shared memory, and every job runs in a pool of
+    worker processes. Each job gets the name of the shared memory block as
+    its first argument, and writes its part of the array directly into
+    it, so no results are sent back. The finished array is copied out once.
+
+    Parameter shape: The array shape
+    Precondition: shape is a tuple of ints > 0
+
+    Parameter workers: The number of processes
+    Precondition: workers is an int > 1
+
+    Parameter task: The function to run for each job
+    Precondition: task is a module-level function (so it can be pickled)
+
+    Parameter jobs: The arguments to task, after the block name
+    Precondition: jobs is a list of tuples
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    size = int(np.prod(shape)) * 8
+    block = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(task, block.name, shape, *job) for job in jobs]
+            for future in futures:
+                future.result()  # Raises any error from the worker
+        shared = np.ndarray(shape, dtype=float, buffer=block.buf)
+        result = shared.copy()
+        del shared  # The block cannot close while an array uses it
+    finally:
+        block.close()
+        block.unlink()
+    return result
+
+
+def _parallel_island_path(side, d, x, y, workers):
+    """
+    Returns: island_path(side, d, x, y), computed by worker processes.
+
+    The island is 32 depth-(d-1) edges: eight per side, each turned by the
+    base turns of an edge and the turn of its side. Every one of them ends
+    exactly 4**(d-1) steps in its own direction from where it starts, so
+    where each one starts is known before any of them is computed.
+
+    Parameters are as in island_path, with workers > 1 and d >= 1.
+    """
+    length = 8 ** (d - 1)
+    step = side / 4 ** d
+    origin = (x + side / 2, y - side / 2)
+    jobs = [(1 + pos * length, turn, start, d - 1, step, origin)
+            for pos, (turn, start) in enumerate(_island_parts(d, 1))]
+    path = _run_parallel((4 * 8 ** d + 1, 2), workers, _island_part, jobs)
+    path[0] = origin
+    return path
+
+
+def _island_parts(d, level):
+    """
+    Returns: the direction and start of each part of a depth-d island, split at level.
+
+    The island is 4*8**level parts, each a depth-(d-level) edge. The result
+    is a list of (turn, start) pairs, in drawing order, where turn is the
+    direction of the part (in units of 90 degrees, 0 is north) and start is
+    its first lattice point, a tuple of two ints.
+
+    Parameter d: The island depth
+    Precondition: d is a valid depth (int >= 0)
+
+    Parameter level: The level to split at
+    Precondition: level is an int, 0 <= level <= d
+    """
+    units = np.array(_ISLAND_UNITS, dtype=np.int64)
+    turns = np.concatenate([(_island_edge_turns(level) + k) % 4 for k in range(4)])
+    starts = np.zeros((len(turns), 2), dtype=np.int64)
+    np.cumsum(units[turns[:-1]] * 4 ** (d - level), axis=0, out=starts[1:])
+    return list(zip(turns.tolist(), [tuple(start) for start in starts.tolist()]))
+
+
+def _island_part_steps(turn, start, d):
+    """
+    Returns: the lattice points of one depth-d part of an island, after its start.
+
+    The result is a numpy int array of shape (8**d, 2).
+
+    Parameter turn: The direction of this part (in units of 90 degrees)
+    Precondition: turn is an int in 0..3
+
+    Parameter start: The lattice point where this part starts
+    Precondition: start is a tuple of two ints
+
+    Parameter d: The depth of this part
+    Precondition: d is a valid depth (int >= 0)
+    """
+    units = np.array(_ISLAND_UNITS, dtype=np.int64)
+    steps = np.cumsum(units[(_island_edge_turns(d) + turn) % 4], axis=0)
+    steps += start
+    return steps
+
+
+def _island_part(name, shape, first, turn, start, d, step, origin):
+    """
+    Writes the vertices of one depth-d part of an island into shared memory.
+
+    Parameter name: The name of the shared memory block
+    Precondition: name is a string
+
+    Parameter shape: The shape of the path in the block
+    Precondition: shape is a tuple (m, 2)
+
+    Parameter first: The row of the first vertex of this part
+    Precondition: first is an int >= 1
+
+    Parameter turn: The direction of this part (in units of 90 degrees)
+    Precondition: turn is an int in 0..3
+
+    Parameter start: The lattice point where this part starts
+    Precondition: start is a tuple of two ints
+
+    Parameter d: The depth of this part
+    Precondition: d is a valid depth (int >= 0)
+
+    Parameter step: The length of one lattice step
+    Precondition: step is a number
+
+    Parameter origin: The point at lattice point (0, 0)
+    Precondition: origin is a tuple of two numbers
+    """
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        path = np.ndarray(shape, dtype=float, buffer=block.buf)
+        steps = _island_part_steps(turn, start, d)
+        part = path[first:first + len(steps)]
+        np.multiply(steps, step, out=part)
+        part += origin
+        del path, part
+    finally:
+        block.close()
+
+
+def _parallel_triangles(side, d, x, y, workers):
+    """
+    Returns: the triangles of triangle_geometry(side, d, x, y), computed by worker processes.
+
+    The top levels are expanded here until there are at least as many
+    subtrees as workers. Every subtree then has the same number of
+    triangles, so each is written at a fixed offset.
+
+    Parameters are as in triangle_geometry, with workers > 1 and d >= 1.
+    """
+    top = 1
+    while top < d and 3 ** top < workers:
+        top += 1
+    roots, child = _triangle_centers(np.array([[x, y]], dtype=float), side, top)
+    length = 3 ** (d - top)
+    jobs = [(pos * length, tuple(root), child, d - top) for pos, root in enumerate(roots.tolist())]
+    return _run_parallel((3 ** d, 6), workers, _triangle_part, jobs)
+
+
+def _triangle_part(name, shape, first, root, side, d):
+    """
+    Writes the triangles of one Sierpinski subtree into shared memory.
+
+    Parameter name: The name of the shared memory block
+    Precondition: name is a string
+
+    Parameter shape: The shape of the triangle array in the block
+    Precondition: shape is a tuple (k, 6)
+
+    Parameter first: The row of the first triangle of this subtree
+    Precondition: first is an int >= 0
+
+    Parameter root: The center of the subtree
+    Precondition: root is a tuple of two numbers
+
+    Parameter side: The side length of the subtree
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter d: The depth of the subtree
+    Precondition: d is a valid depth (int >= 0)
+    """
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        triangles = np.ndarray(shape, dtype=float, buffer=block.buf)
+        centers, side = _triangle_centers(np.array([root], dtype=float), side, d)
+        triangles[first:first + len(centers)] = _triangle_rows(centers, side)
+        del triangles
+    finally:
+        block.close()
+
+
+#################### Tilings ####################
+# Tilings are computed on an integer lattice, in units of half a side across
+# and a triangle height up. The corners of both tilings are lattice points, so
+# shared edges are found exactly.
+_HEX_CORNERS = [(2, 0), (1, 1), (-1, 1), (-2, 0), (-1, -1), (1, -1)]
+
+
+def hex_tiling(cols, rows, side, x=0, y=0, color='cyan'):
+    """
+    Returns: the Geometry of a honeycomb of cols x rows hexagons.
+
+    Only the outline of each hexagon is in the figure; unlike draw_hex,
+    there are no spokes from the center to the corners. Each hexagon has six
+    corners at distance side from its center, the first one due east.
+    Every other column is shifted up by half a hexagon. The honeycomb is
+    centered at (x, y), and every edge shared by two hexagons is only in the
+    figure once.
+
+    Parameter cols: The number of columns
+    Precondition: cols is an int >= 1
+
+    Parameter rows: The number of hexagons in each column
+    Precondition: rows is an int >= 1
+
+    Parameter side: The length of each hexagon side
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter x: The x-coordinate of the honeycomb center
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the honeycomb center
+    Precondition: y is a number
+
+    Parameter color: The edge color
+    Precondition: color is a valid turtle color
+    """
+    assert is_valid_iteration(cols), report_error('cols is not a valid number of columns', cols)
+    assert is_valid_iteration(rows), report_error('rows is not a valid number of rows', rows)
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_color(color), report_error('color is not a valid color', color)
+
+    q, r = np.meshgrid(np.arange(cols), np.arange(rows), indexing='ij')
+    centers = np.column_stack([3 * q.ravel(), 2 * r.ravel() + q.ravel() % 2])
+    corners = np.array(_HEX_CORNERS)
+    starts = centers[:, None, :] + corners[None, :, :]
+    ends = centers[:, None, :] + np.roll(corners, -1, axis=0)[None, :, :]
+    edges = np.concatenate([starts, ends], axis=2).reshape(-1, 4)
+    return _lattice_geometry(edges, side, x, y, color)
+
+
+def triangle_tiling(cols, rows, side, x=0, y=0, color='cyan'):
+    """
+    Returns: the Geometry of a grid of cols x rows equilateral triangles.
+
+    Each row has cols triangles, alternately pointing up and down, and
+    the first triangle of the bottom row points up. The grid is centered at
+    (x, y), and every edge shared by two triangles is only in the figure once.
+
+    Parameter cols: The number of triangles in each row
+    Precondition: cols is an int >= 1
+
+    Parameter rows: The number of rows
+    Precondition: rows is an int >= 1
+
+    Parameter side: The length of each triangle side
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter x: The x-coordinate of the grid center
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the grid center
+    Precondition: y is a number
+
+    Parameter color: The edge color
+    Precondition: color is a valid turtle color
+    """
+    assert is_valid_iteration(cols), report_error('cols is not a valid number of columns', cols)
+    assert is_valid_iteration(rows), report_error('rows is not a valid number of rows', rows)
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_color(color), report_error('color is not a valid color', color)
+
+    i, j = np.meshgrid(np.arange(cols), np.arange(rows), indexing='ij')
+    i, j = i.ravel(), j.ravel()
+    up = (i + j) % 2 == 0
+
+    # The base is on the bottom row of an up triangle, and the top of a down one
+    base = np.where(up, j, j + 1)
+    apex = np.where(up, j + 1, j)
+    a = np.column_stack([i, base])
+    b = np.column_stack([i + 2, base])
+    c = np.column_stack([i + 1, apex])
+    edges = np.concatenate([np.hstack([a, b]), np.hstack([b, c]), np.hstack([c, a])])
+    return _lattice_geometry(edges, side, x, y, color)
+
+
+def _lattice_geometry(edges, side, x, y, color):
+    """
+    Returns: the Geometry of the unique lattice edges, centered at (x, y).
+
+    Parameter edges: The edges, one row (i0, j0, i1, j1) of lattice points per edge
+    Precondition: edges is a numpy int array of shape (m, 4)
+
+    Parameter side: The side length of a tile
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter x: The x-coordinate of the figure center
+    Precondition: x is a number
+
+    Parameter y: The y-coordinate of the figure center
+    Precondition: y is a number
+
+    Parameter color: The edge color
+    Precondition: color is a valid turtle color
+    """
+    # Edges are shared in opposite directions, so point them all the same way
+    flip = (edges[:, 0] > edges[:, 2]) | ((edges[:, 0] == edges[:, 2]) & (edges[:, 1] > edges[:, 3]))
+    edges[flip] = edges[flip][:, [2, 3, 0, 1]]
+    edges = np.unique(edges, axis=0)
+
+    low = edges.reshape(-1, 2).min(axis=0)
+    high = edges.reshape(-1, 2).max(axis=0)
+    scale = np.array([side / 2, side * math.sqrt(0.75)] * 2)
+    center = np.tile((low + high) / 2, 2)
+    segments = (edges - center) * scale + [x, y, x, y]
+    return Geometry(segments=segments, palette=[color])
+
+
+def tiling(w, shape, cols, rows, side, sp):
+    """
+    Draws a tiling of hexagons or triangles, centered on the window.
+
+    This function clears the window and makes a new turtle. It then draws
+    the tiling hex_tiling(cols, rows, side) or triangle_tiling(cols, rows, side)
+    in a single batch, with each shared edge drawn only once. Drawing a
+    grid of thousands of cells this way costs about as much as drawing one.
+    When done, the turtle is left hidden (visible is False).
+
+    Parameter w: The window to draw upon.
+    Precondition: w is a introcs Window object.
+
+    Parameter shape: The tile shape
+    Precondition: shape is 'hex' or 'triangle'
+
+    Parameter cols: The number of columns
+    Precondition: cols is an int >= 1
+
+    Parameter rows: The number of rows
+    Precondition: rows is an int >= 1
+
+    Parameter side: The length of each tile side
+    Precondition: side is a valid side length (number >= 0)
+
+    Parameter sp: The turtle speed.
+    Precondition: sp is a valid turtle speed.
+    """
+    assert is_window(w), report_error('w is not a valid window', w)
+    assert shape in ['hex', 'triangle'], report_error('shape is not a valid tile shape', shape)
+    assert is_valid_speed(sp), report_error('sp is not a valid speed', sp)
+
+    figure = hex_tiling if shape == 'hex' else triangle_tiling
+    geom = figure(cols, rows, side)
+
+    w.clear()
+    t = _turtle.Turtle(w)
+    t.speed = sp
+    draw_geometry(t, geom)
+    t.visible = False
+    t.flush()
+
+
+#################### Repeated Edges ####################
+# Whether each figure removes its repeated edges by default (see dedupe_geometry).
+# Only figures that retrace their own edges are worth the extra pass.
+DEDUPE = {'hex_geometry': True, 'polygons_geometry': True}
+
+# Endpoints closer than this are treated as the same point
+DEDUPE_QUANTUM = 1e-6
+
+# The number of strokes saved the last time each figure was deduplicated
+DEDUPE_SAVED = {}
+
+
+def dedupe_geometry(geom, quantum=None):
+    """
+    Returns: a pair (geom2, saved), where geom2 is geom without repeated edges.
+
+    Segments are compared without regard to direction, after rounding their
+    endpoints to multiples of quantum. Where two segments are the same, only
+    the one drawn last is kept (it is the one on top). Segments of the same
+    color that lie on the same line and overlap or touch are then merged into
+    a single segment. saved is the number of segments removed.
+
+    The kept segments are in the order they were drawn, so that shared edges
+    of different colors look as before. The triangles are unchanged.
+
+    Parameter geom: The figure to deduplicate
+    Precondition: geom is a Geometry object
+
+    Parameter quantum: The rounding for endpoints (DEDUPE_QUANTUM if None)
+    Precondition: quantum is None or a number > 0
+    """
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+    quantum = DEDUPE_QUANTUM if quantum is None else quantum
+    assert is_number(quantum) and quantum > 0, report_error('Invalid quantum', quantum)
+
+    segments = np.asarray(geom.segments, dtype=float)
+    colors = geom.segcolors
+    if len(segments) == 0:
+        return geom, 0
+
+    # Put every segment in a canonical direction, and drop empty segments
+    keys = np.round(segments / quantum).astype(np.int64)
+    flip = (keys[:, 0] > keys[:, 2]) | ((keys[:, 0] == keys[:, 2]) & (keys[:, 1] > keys[:, 3]))
+    keys[flip] = keys[flip][:, [2, 3, 0, 1]]
+    points = segments.copy()
+    points[flip] = points[flip][:, [2, 3, 0, 1]]
+    keep = np.flatnonzero((keys[:, 0] != keys[:, 2]) | (keys[:, 1] != keys[:, 3]))
+
+    # Keep the last copy of every segment
+    _, last = np.unique(keys[keep][::-1], axis=0, return_index=True)
+    keep = np.sort(keep[::-1][last])
+    keys, points, colors = keys[keep], points[keep], colors[keep]
+
+    # Group the segments by line (direction and offset) and color
+    delta = (keys[:, 2:] - keys[:, :2]).astype(float)
+    unit = delta / np.hypot(delta[:, 0], delta[:, 1])[:, None]
+    offset = unit[:, 0] * keys[:, 1] - unit[:, 1] * keys[:, 0]
+    lines = np.column_stack([np.round(unit * 1e9), np.round(offset), colors]).astype(np.int64)
+    _, group = np.unique(lines, axis=0, return_inverse=True)
+    group = group.ravel()
+
+    # Position along the line, with groups laid end to end so one sort does all
+    t0 = np.round(np.einsum('ij,ij->i', unit, keys[:, :2])).astype(np.int64)
+    t1 = np.round(np.einsum('ij,ij->i', unit, keys[:, 2:])).astype(np.int64)
+    span = 2 * (max(t1.max(), -t0.min()) + 2)
+    t0 = t0 + group * span
+    t1 = t1 + group * span
+    order = np.lexsort((t0, group))
+    t0, t1 = t0[order], t1[order]
+
+    # A merged segment starts wherever a segment begins past all earlier ends
+    reach = np.maximum.accumulate(t1)
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = t0[1:] > reach[:-1]
+    first = np.flatnonzero(starts)
+    run = np.cumsum(starts) - 1
+
+    # The merged segment ends at the furthest end in its run
+    ends = np.flatnonzero(t1 == reach[np.append(first[1:], len(order)) - 1][run])
+    _, pick = np.unique(run[ends], return_index=True)
+    last = ends[pick]
+
+    merged = np.hstack([points[order[first], :2], points[order[last], 2:]])
+    drawn = np.maximum.reduceat(order, first)  # Drawn where its last piece was
+    place = np.argsort(drawn, kind='stable')
+    result = Geometry(segments=merged[place], segcolors=colors[order[first]][place],
+                      triangles=geom.triangles, tricolors=geom.tricolors,
+                      palette=geom.palette)
+    return result, len(segments) - len(merged)
+
+
+def _dedupe_figure(name, geom, dedupe):
+    """
+    Returns: geom with its repeated edges removed if dedupe (or DEDUPE) says so.
+
+    The number of strokes saved is recorded in DEDUPE_SAVED.
+
+    Parameter name: The figure function name
+    Precondition: name is a string
+
+    Parameter geom: The figure
+    Precondition: geom is a Geometry object
+
+    Parameter dedupe: Whether to remove repeated edges (DEDUPE if None)
+    Precondition: dedupe is None or a bool
+    """
+    dedupe = DEDUPE.get(name, False) if dedupe is None else dedupe
+    assert type(dedupe) == bool, report_error('dedupe is not a bool', dedupe)
+    if not dedupe:
+        return geom
+    geom, DEDUPE_SAVED[name] = dedupe_geometry(geom)
+    return geom
+
+
+#################### Segment Ordering ####################
+# The space-filling curve each figure sorts its shapes along by default (see
+# order_geometry), or None to keep them in drawing order. Sorting costs a
+# pass over the figure, so it is only worth it for figures that are saved
+# or rasterized more than once.
+ORDER = {'polygons_geometry': None, 'triangle_geometry': None}
+
+# The number of bits of each coordinate in a curve key
+ORDER_BITS = 16
+
+
+def curve_keys(points, curve='hilbert', bits=None):
+    """
+    Returns: the position of each point along a space-filling curve, as a uint64 array.
+
+    The bounding box of the points is divided into a 2**bits by 2**bits grid
+    (with square cells), and each point is numbered by the cell it is in.
+    Points close on the curve are close in space. The Hilbert curve keeps
+    that promise better; the Morton (Z-order) curve is cheaper.
+
+    Parameter points: The points
+    Precondition: points is a numpy float array of shape (m, 2)
+
+    Parameter curve: The space-filling curve
+    Precondition: curve is 'hilbert' or 'morton'
+
+    Parameter bits: The bits of each coordinate (ORDER_BITS if None)
+    Precondition: bits is None or an int in 1..31
+    """
+    assert curve in ['hilbert', 'morton'], report_error('Invalid curve', curve)
+    bits = ORDER_BITS if bits is None else bits
+    assert type(bits) == int and 1 <= bits <= 31, report_error('Invalid bits', bits)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    low = points.min(axis=0)
+    size = float((points.max(axis=0) - low).max()) or 1.0
+    cells = np.minimum((points - low) * ((1 << bits) / size), (1 << bits) - 1)
+    x = cells[:, 0].astype(np.uint64)
+    y = cells[:, 1].astype(np.uint64)
+
+    if curve == 'morton':
+        return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
+
+    # The Hilbert curve, a bit of each coordinate at a time, from the top
+    keys = np.zeros(len(points), dtype=np.uint64)
+    last = np.uint64((1 << bits) - 1)
+    for level in range(bits - 1, -1, -1):
+        s = np.uint64(1 << level)
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += (s * s) * ((3 * rx.astype(np.uint64)) ^ ry.astype(np.uint64))
+        # Turn the quadrant so that the curve inside it starts and ends right
+        flip = rx & ~ry
+        x[flip] = last - x[flip]
+        y[flip] = last - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+    return keys
+
+
+def _spread_bits(v):
+    """
+    Returns: v with a 0 bit put after each of its lower 32 bits.
+
+    Parameter v: The values to spread
+    Precondition: v is a numpy uint64 array of values below 2**32
+    """
+    v = v & np.uint64(0xFFFFFFFF)
+    for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                        (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                        (1, 0x5555555555555555)]:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def order_geometry(geom, curve='hilbert', overdraw=True, bits=None):
+    """
+    Returns: a copy of geom with its shapes sorted along a space-filling curve.
+
+    Triangles are sorted by their centers, and segments by the midpoint of
+    the first segment of each polyline (see polyline_runs), on one grid (see
+    curve_keys), so that shapes drawn one after another are close together.
+    Polylines are moved whole, so they are still drawn as one line each.
+    This keeps a rasterizer working on one part of the image at a time.
+    Figures made by recursion (like triangle) are mostly in such an order
+    already; this helps most with figures whose shapes jump around.
+
+    Sorting changes which shape is on top where shapes overlap. If overdraw
+    is True, shapes only move within runs of the same color, so that
+    overlaps look as before. Shapes with the same key keep their drawing
+    order. If curve is None, geom is returned as it is.
+
+    Parameter geom: The figure to sort
+    Precondition: geom is a Geometry object
+
+    Parameter curve: The space-filling curve, or None for drawing order
+    Precondition: curve is None, 'hilbert' or 'morton'
+
+    Parameter overdraw: Whether to keep the order of shapes of different colors
+    Precondition: overdraw is a bool
+
+    Parameter bits: The bits of each coordinate (ORDER_BITS if None)
+    Precondition: bits is None or an int in 1..31
+    """
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+    assert curve in [None, 'hilbert', 'morton'], report_error('Invalid curve', curve)
+    assert type(overdraw) == bool, report_error('overdraw is not a bool', overdraw)
+    if curve is None:
+        return geom
+
+    # Sort the stored coordinates, which have the same layout as the real ones
+    stored = [geom._segments, geom._triangles]
+    segcolors = geom.segcolors
+    joined = np.zeros(len(segcolors), dtype=bool)
+    joined[1:] = ((segcolors[1:] == segcolors[:-1]) &
+                  np.all(stored[0][1:, :2] == stored[0][:-1, 2:], axis=1))
+    first = np.flatnonzero(~joined)
+    centers = [(stored[0][first, :2] + stored[0][first, 2:]) / 2,
+               (stored[1][:, 0:2] + stored[1][:, 2:4] + stored[1][:, 4:6]) / 3]
+    keys = curve_keys(np.vstack(centers).astype(float), curve, bits)
+    split = len(first)
+
+    orders = []
+    for part, colors in [(keys[:split], segcolors[first]), (keys[split:], geom.tricolors)]:
+        if overdraw and len(colors):
+            runs = np.cumsum(np.append(0, colors[1:] != colors[:-1]))
+            orders.append(np.lexsort((part, runs)))
+        else:
+            orders.append(np.argsort(part, kind='stable'))
+
+    # Put the segments of each polyline back after its first one
+    lengths = np.diff(np.append(first, len(segcolors)))[orders[0]]
+    starts = np.repeat(first[orders[0]] - (np.cumsum(lengths) - lengths), lengths)
+    orders[0] = starts + np.arange(len(segcolors))
+    return Geometry(segments=stored[0][orders[0]], segcolors=geom.segcolors[orders[0]],
+                    triangles=stored[1][orders[1]], tricolors=geom.tricolors[orders[1]],
+                    palette=geom.palette, scale=geom.scale, origin=geom.origin)
+
+
+def _order_figure(name, geom, order):
+    """
+    Returns: geom sorted along the curve order (or ORDER) names.
+
+    Parameter name: The figure function name
+    Precondition: name is a string
+
+    Parameter geom: The figure
+    Precondition: geom is a Geometry object
+
+    Parameter order: The curve to sort along (ORDER if None), or False
+    for drawing order
+    Precondition: order is None, False, 'hilbert' or 'morton'
+    """
+    order = ORDER.get(name) if order is None else order
+    return order_geometry(geom, order or None)
+
+
+#################### Geometry Files ####################
+# A geometry file is a 56 byte header, followed by the palette (one RGBA
+# entry of 4 bytes per color), the stored segments and triangles (little-
+# endian, in the type named by the header), and finally the segment and
+# triangle palette indices (little-endian uint16). The header ends with the
+# scale and origin of the stored coordinates. Every block starts on a 4 byte
+# boundary. Version 1 files have a 32 byte header and float32 coordinates.
+GEOMETRY_MAGIC = b'A4GEOM'
+GEOMETRY_VERSION = 2
+_GEOMETRY_HEADER = struct.Struct('<6sHIIIB7xddd4x')
+_GEOMETRY_HEADER_V1 = struct.Struct('<6sHIII12x')
+
+# The stored coordinate types of a geometry file, by their code in the header
+_GEOMETRY_TYPES = ['<f4', '<i4', '<i2']
+
+
+def color_rgb(c):
+    """
+    Returns: the tuple (red, green, blue) of the color c, each in 0..255.
+
+    Parameter c: the color to convert
+    Precondition: c is a valid turtle color
+    """
+    return _COLOR_RGB[color_index(c)]
+
+
+def _geometry_layout(nseg, ntri, npal, header=_GEOMETRY_HEADER.size, itemsize=4):
+    """
+    Returns: the byte offsets of the blocks of a geometry file, and its size.
+
+    The result is the tuple (palette, segments, triangles, segcolors,
+    tricolors, size).
+
+    Parameter nseg: the number of segments
+    Precondition: nseg is an int >= 0
+
+    Parameter ntri: the number of triangles
+    Precondition: ntri is an int >= 0
+
+    Parameter npal: the number of palette colors
+    Precondition: npal is an int >= 0
+
+    Parameter header: the size of the header
+    Precondition: header is an int >= 0
+
+    Parameter itemsize: the size of a stored coordinate
+    Precondition: itemsize is 2 or 4
+    """
+    palette = header
+    segments = palette + 4 * npal
+    triangles = segments + 4 * itemsize * nseg
+    segcolors = triangles + 6 * itemsize * ntri
+    tricolors = segcolors + 2 * nseg
+    size = tricolors + 2 * ntri
+    return (palette, segments, triangles, segcolors, tricolors, size)
+
+
+def save_geometry(geom, path):
+    """
+    Writes the Geometry geom to the file path in the a4 geometry format.
+
+    Coordinates are stored as float32, which is more than enough precision
+    for the screen, unless geom stores them as quantized integers. Those are
+    written as they are stored.
+
+    Parameter geom: The figure to save
+    Precondition: geom is a Geometry object
+
+    Parameter path: The file to write
+    Precondition: path is a string
+    """
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+    assert type(path) == str, report_error('path is not a string', path)
+
+    nseg = len(geom.segcolors)
+    ntri = len(geom.tricolors)
+    precision = geom.precision()
+    if GEOMETRY_PRECISIONS.get(precision) is None:
+        code, segments, triangles, scale, origin = 0, geom.segments, geom.triangles, 1.0, (0.0, 0.0)
+    else:
+        code = 1 if precision == 'int32' else 2
+        segments, triangles, scale, origin = geom._segments, geom._triangles, geom.scale, geom.origin
+    with open(path, 'wb') as file:
+        file.write(_GEOMETRY_HEADER.pack(GEOMETRY_MAGIC, GEOMETRY_VERSION, nseg, ntri,
+                                         len(geom.palette), code, scale, *origin))
+        for color in geom.palette:
+            file.write(bytes(color_rgb(color) + (255,)))
+        file.write(np.ascontiguousarray(segments, dtype=_GEOMETRY_TYPES[code]).tobytes())
+        file.write(np.ascontiguousarray(triangles, dtype=_GEOMETRY_TYPES[code]).tobytes())
+        file.write(np.ascontiguousarray(geom.segcolors, dtype='<u2').tobytes())
+        file.write(np.ascontiguousarray(geom.tricolors, dtype='<u2').tobytes())
+
+
+def load_geometry(path):
+    """
+    Returns: the Geometry stored in the a4 geometry file path.
+
+    The file is memory-mapped, not read. The arrays of the result are
+    read-only views of the mapped file, so opening a file costs the same
+    whatever its size, and only the parts a renderer touches are ever read
+    from disk. The palette colors are web colors (e.g. '#ff00ff'). The
+    coordinates keep the precision they were stored in.
+
+    A file that is not a complete geometry file of a known version is not a
+    precondition violation (files can be damaged or left by other versions
+    of a4), so it raises a ValueError, even when assertions are off.
+
+    Parameter path: The file to read
+    Precondition: path is a string naming a file
+    """
+    assert type(path) == str, report_error('path is not a string', path)
+    with open(path, 'rb') as file:
+        header = file.read(_GEOMETRY_HEADER.size)
+    if len(header) < _GEOMETRY_HEADER_V1.size:
+        raise ValueError('Not a geometry file: ' + repr(path))
+    magic, version = struct.unpack_from('<6sH', header)
+    if magic != GEOMETRY_MAGIC:
+        raise ValueError('Not a geometry file: ' + repr(path))
+    if version not in [1, GEOMETRY_VERSION]:
+        raise ValueError('Unsupported geometry version: ' + repr(version))
+    if version == 1:
+        nseg, ntri, npal = _GEOMETRY_HEADER_V1.unpack(header[:_GEOMETRY_HEADER_V1.size])[2:]
+        code, scale, origin = 0, 1.0, (0.0, 0.0)
+        size = _GEOMETRY_HEADER_V1.size
+    else:
+        if len(header) != _GEOMETRY_HEADER.size:
+            raise ValueError('Truncated geometry file: ' + repr(path))
+        nseg, ntri, npal, code, scale, ox, oy = _GEOMETRY_HEADER.unpack(header)[2:]
+        if code >= len(_GEOMETRY_TYPES) or not scale > 0:
+            raise ValueError('Invalid geometry header: ' + repr(path))
+        origin = (ox, oy)
+        size = _GEOMETRY_HEADER.size
+
+    dtype = _GEOMETRY_TYPES[code]
+    layout = _geometry_layout(nseg, ntri, npal, size, np.dtype(dtype).itemsize)
+    if os.path.getsize(path) < layout[-1]:
+        raise ValueError('Truncated geometry file: ' + repr(path))
+
+    def block(offset, dtype, shape):
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    rgba = block(layout[0], np.uint8, (npal, 4))
+    palette = ['#%02x%02x%02x' % tuple(entry[:3]) for entry in rgba.tolist()]
+    return Geometry(segments=block(layout[1], dtype, (nseg, 4)),
+                    segcolors=block(layout[3], '<u2', (nseg,)),
+                    triangles=block(layout[2], dtype, (ntri, 6)),
+                    tricolors=block(layout[4], '<u2', (ntri,)),
+                    palette=palette, scale=scale, origin=origin)
+
+
+#################### Geometry Cache ####################
+# Computed figures are cached on disk as geometry files, so that short-lived
+# processes can share them. Files are named by a hash of the figure function,
+# its parameters, the module settings that change figures, and the source of
+# this module (so that editing a4 makes old entries unreachable). The cache
+# directory can be set with A4_CACHE_DIR.
+GEOMETRY_CACHE_DIR = os.environ.get('A4_CACHE_DIR',
+                                    os.path.join(os.path.expanduser('~'), '.cache', 'a4'))
+
+# The cache evicts the least recently used files when it grows past this size
+GEOMETRY_CACHE_BYTES = 256 * 1024 * 1024
+
+# Temporary files older than this many seconds were left by interrupted writes
+GEOMETRY_CACHE_TEMP_AGE = 3600
+
+# The hash of the source of this module (computed when first needed)
+_MODULE_HASH = None
+
+
+def _module_hash():
+    """
+    Returns: a hash of the source code of this module, as a hex string.
+    """
+    import hashlib
+    global _MODULE_HASH
+    if _MODULE_HASH is None:
+        with open(__file__, 'rb') as file:
+            _MODULE_HASH = hashlib.sha256(file.read()).hexdigest()
+    return _MODULE_HASH
+
+
+def _cache_key(name, params):
+    """
+    Returns: the cache file name for the figure name(**params).
+
+    Every value is keyed by its type as well as its value, so 3 and 3.0 are
+    different entries: a figure may accept one and reject the other. The
+    parameters are sorted so that their order does not matter. The module
+    settings that parameters default to (see _cache_settings) are part of
+    the key.
+
+    Parameter name: The qualified name of the figure function
+    Precondition: name is a string
+
+    Parameter params: The keyword arguments of the figure function
+    Precondition: params is a dictionary with string keys
+    """
+    items = []
+    for key in sorted(params):
+        value = params[key]
+        items.append(key + '=' + type(value).__name__ + ':' + repr(value))
+    import hashlib
+    text = '\n'.join([_module_hash(), name] + items + _cache_settings())
+    return hashlib.sha256(text.encode('utf-8')).hexdigest() + '.a4g'
+
+
+def _cache_settings():
+    """
+    Returns: the module settings that change computed figures, as strings.
+    """
+    return ['GEOMETRY_PRECISION=' + repr(GEOMETRY_PRECISION),
+            'DEDUPE=' + repr(sorted(DEDUPE.items())),
+            'DEDUPE_QUANTUM=' + repr(float(DEDUPE_QUANTUM)),
+            'ORDER=' + repr(sorted(ORDER.items())),
+            'ORDER_BITS=' + repr(ORDER_BITS)]
+
+
+def cached_geometry(figure, **params):
+    """
+    Returns: the Geometry figure(**params), from the disk cache if possible.
+
+    On a miss, the figure is computed and written to the cache. Writes go to
+    a temporary file that is renamed into place, so that processes sharing
+    the cache never see a partial file. The result is always the memory-
+    mapped file (see load_geometry), hit or miss, and so has float32 (or
+    quantized) coordinates. A damaged cache file is computed again.
+
+    Parameter figure: The function computing the figure
+    Precondition: figure is a module-level function returning a Geometry,
+    such as island_geometry or triangle_geometry. It is keyed by its
+    qualified name, so it cannot be a lambda, a nested function or a
+    functools.partial (which have no name of their own).
+
+    Parameter params: The keyword arguments to figure
+    Precondition: params are valid arguments for figure
+    """
+    assert callable(figure), report_error('figure is not a function', figure)
+    module = getattr(figure, '__module__', None)
+    qualname = getattr(figure, '__qualname__', '<')
+    assert module and '<' not in qualname, report_error('figure has no stable name', figure)
+    path = os.path.join(GEOMETRY_CACHE_DIR, _cache_key(module + '.' + qualname, params))
+    try:
+        geom = load_geometry(path)
+        os.utime(path)  # Mark as recently used
+        return geom
+    except (OSError, ValueError):
+        pass  # A miss (or an entry evicted by another process)
+
+    import tempfile
+    geom = figure(**params)
+    os.makedirs(GEOMETRY_CACHE_DIR, exist_ok=True)
+    fd, temp = tempfile.mkstemp(suffix='.tmp', dir=GEOMETRY_CACHE_DIR)
+    os.close(fd)
+    try:
+        save_geometry(geom, temp)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)  # The write failed or was interrupted
+    trim_geometry_cache()
+    try:
+        return load_geometry(path)
+    except (OSError, ValueError):
+        # Evicted by another process already, so return what the file held
+        return geom if GEOMETRY_PRECISIONS.get(geom.precision()) else quantize_geometry(geom, 'float32')
+
+
+def trim_geometry_cache(limit=None):
+    """
+    Deletes the least recently used cache files until the cache fits in limit bytes.
+
+    Files that are in use by another process (on platforms that lock them)
+    are skipped. Temporary files older than GEOMETRY_CACHE_TEMP_AGE seconds
+    (left by writes that were interrupted) are always deleted.
+
+    Parameter limit: The cache size in bytes (GEOMETRY_CACHE_BYTES if None)
+    Precondition: limit is None or an int >= 0
+    """
+    limit = GEOMETRY_CACHE_BYTES if limit is None else limit
+    entries = []
+    stale = time.time() - GEOMETRY_CACHE_TEMP_AGE
+    try:
+        with os.scandir(GEOMETRY_CACHE_DIR) as scan:
+            for entry in scan:
+                if entry.name.endswith('.a4g'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith('.tmp') and entry.stat().st_mtime < stale:
+                    entries.append((0, 0, entry.path))
+    except OSError:
+        return
+
+    total = sum(entry[1] for entry in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= limit and mtime:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def clear_geometry_cache():
+    """
+    Deletes every file in the geometry cache (except for recent temporary
+    files, which may still be being written).
+    """
+    trim_geometry_cache(0)
+
+
+#################### Drawing Recorded Geometry ####################
+# How draw_geometry puts a figure on the window. In 'vector' mode every run of
+# lines and every triangle becomes a canvas item. In 'raster' mode the figure
+# is drawn off-screen into an image the size of the window, and the canvas
+# only gets that one image. In 'auto' mode, figures with more than
+# RASTER_THRESHOLD segments and triangles are drawn as a raster. Every figure
+# drawn at speed 0 goes through draw_geometry, and so follows this mode.
+RENDER_MODE = 'auto'
+RASTER_THRESHOLD = 20000
+
+# The images drawn by each tool (Tkinter does not keep them alive on its own)
+_RASTERS = weakref.WeakKeyDictionary()
+
+# The canvas items drawn by redraw_geometry on each window
+_POOLS = weakref.WeakKeyDictionary()
+
+def polyline_runs(segments, colors):
+    """
+    Returns: the connected runs of segments, as a list of (path, color index).
+
+    A run is a sequence of consecutive segments of the same color where
+    each segment starts where the one before it ends. Each path is a flat
+    list [x0, y0, x1, y1, ...] with one more point than the run has segments.
+    Runs are split after RUN_LIMIT segments.
+
+    Parameter segments: The line segments, one row (x0, y0, x1, y1) per segment
+    Precondition: segments is a numpy array of shape (m, 4)
+
+    Parameter colors: The palette index of each segment
+    Precondition: colors is a numpy int array of length m
+    """
+    m = len(segments)
+    if m == 0:
+        return []
+
+    # A run breaks wherever the next segment is elsewhere or another color
+    breaks = np.ones(m, dtype=bool)
+    breaks[1:] = ((segments[1:, 0] != segments[:-1, 2]) |
+                  (segments[1:, 1] != segments[:-1, 3]) |
+                  (colors[1:] != colors[:-1]))
+    starts = np.flatnonzero(breaks).tolist() + [m]
+
+    runs = []
+    for first, last in zip(starts[:-1], starts[1:]):
+        for pos in range(first, last, RUN_LIMIT):
+            end = min(pos + RUN_LIMIT, last)
+            path = np.empty(2 * (end - pos) + 2)
+            path[:2] = segments[pos, :2]
+            path[2:] = segments[pos:end, 2:].ravel()
+            runs.append((path.tolist(), int(colors[pos])))
+    return runs
+
+
+def draw_geometry(t, geom, mode=None):
+    """
+    Draws the recorded figure geom with the tool t, without animation.
+
+    The triangles are drawn first (as filled polygons), and then the line
+    segments. Connected segments of the same color are drawn as a single
+    multi-point canvas line (see polyline_runs), so a figure with a few long
+    paths creates a few canvas items instead of one per segment. That makes
+    both drawing and clearing the window proportionally faster.
+
+    Very dense figures are instead drawn off-screen and shown as a single
+    image, so their cost depends on the window size and not on the number of
+    segments. The mode is chosen as described for RENDER_MODE.
+
+    The tool is not moved. REMEMBER: You need to flush the tool if its speed
+    is 0.
+
+    Parameter t: The drawing tool
+    Precondition: t is a Turtle or a Pen
+
+    Parameter geom: The figure to draw
+    Precondition: geom is a Geometry object
+
+    Parameter mode: The render mode (RENDER_MODE if None)
+    Precondition: mode is None, 'auto', 'vector' or 'raster'
+    """
+    assert type(t) in [_turtle.Turtle, _turtle.Pen], report_error('t is not a drawing tool', t)
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+
+    mode = RENDER_MODE if mode is None else mode
+    assert mode in ['auto', 'vector', 'raster'], report_error('Invalid render mode', mode)
+    if mode == 'auto':
+        size = len(geom.segcolors) + len(geom.tricolors)
+        mode = 'raster' if size > RASTER_THRESHOLD else 'vector'
+
+    geom = geom.decoded()
+    window = t._window
+    log = _recording_log(t)
+    if mode == 'raster':
+        if log is not None:
+            _record_geometry(log, geom, t._width)  # Replays the same, without the image
+        image = rasterize_geometry(geom, window.width, window.height, t._width)
+        _blit_image(t, image)
+        return
+
+    colors = [palette_web(color_index(c)) for c in geom.palette]
+    for tri, k in zip(geom.triangles.tolist(), geom.tricolors.tolist()):
+        if log is not None:
+            log.polygon(tri, colors[k], None, t._width)
+        window._draw_polygon(t, None, tri, fill=colors[k], outline='',
+                             block=False, noicon=True)
+    for path, k in polyline_runs(geom.segments, geom.segcolors):
+        if log is not None:
+            log.path(path, colors[k], t._width)
+        window._draw_line(t, None, path, fill=colors[k], width=t._width,
+                          block=False, noicon=True)
+
+
+def _record_geometry(log, geom, width):
+    """
+    Records the lines and polygons of geom in log, as draw_geometry draws them.
+
+    Parameter log: The log to record in
+    Precondition: log is a CommandLog
+
+    Parameter geom: The figure drawn
+    Precondition: geom is a Geometry object
+
+    Parameter width: The line width
+    Precondition: width is a number
+    """
+    colors = [palette_web(color_index(c)) for c in geom.palette]
+    for tri, k in zip(geom.triangles.tolist(), geom.tricolors.tolist()):
+        log.polygon(tri, colors[k], None, width)
+    for path, k in polyline_runs(geom.segments, geom.segcolors):
+        log.path(path, colors[k], width)
+
+
+def _screen_coords(coords, cx, cy):
+    """
+    Returns: a copy of coords converted from turtle space to screen space.
+
+    In screen space, (cx, cy) is the turtle origin and y increases downwards.
+
+    Parameter coords: The coordinates, one (x, y) pair after another in each row
+    Precondition: coords is a 2d numpy array with an even number of columns
+
+    Parameter cx: The screen x-coordinate of the turtle origin
+    Precondition: cx is a number
+
+    Parameter cy: The screen y-coordinate of the turtle origin
+    Precondition: cy is a number
+    """
+    screen = np.array(coords, dtype=float)
+    screen[:, 0::2] += cx
+    screen[:, 1::2] *= -1
+    screen[:, 1::2] += cy
+    return screen
+
+
+def rasterize_geometry(geom, width, height, stroke=1):
+    """
+    Returns: a PIL image of the recorded figure geom, the size of a window.
+
+    The image has a transparent background. Turtle coordinates are converted
+    to pixels as on the window: (0, 0) is the center of the image and y
+    increases upwards. Anything outside of the image is clipped.
+
+    Parameter geom: The figure to draw
+    Precondition: geom is a Geometry object
+
+    Parameter width: The image width in pixels
+    Precondition: width is an int > 0
+
+    Parameter height: The image height in pixels
+    Precondition: height is an int > 0
+
+    Parameter stroke: The line width in pixels
+    Precondition: stroke is a number > 0
+    """
+    from PIL import Image, ImageDraw
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+    assert type(width) == int and width > 0, report_error('Invalid width', width)
+    assert type(height) == int and height > 0, report_error('Invalid height', height)
+
+    image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    colors = [color_rgb(c) + (255,) for c in geom.palette]
+    stroke = max(1, int(round(stroke)))
+
+    # Convert from turtle space to image space, all at once
+    triangles = _screen_coords(geom.triangles, width / 2, height / 2)
+    segments = _screen_coords(geom.segments, width / 2, height / 2)
+
+    for tri, k in zip(triangles.tolist(), geom.tricolors.tolist()):
+        draw.polygon(tri, fill=colors[k])
+    for path, k in polyline_runs(segments, geom.segcolors):
+        draw.line(path, fill=colors[k], width=stroke)
+    return image
+
+
+def _blit_image(t, image):
+    """
+    Shows the PIL image on the window of tool t, as a single canvas item.
+
+    The image is centered on the window (as made by rasterize_geometry). It
+    belongs to the tool, so it is removed with the rest of its drawing.
+
+    Parameter t: The drawing tool
+    Precondition: t is a Turtle or a Pen
+
+    Parameter image: The image to show
+    Precondition: image is a PIL image
+    """
+    from PIL import ImageTk
+    window = t._window
+    photo = ImageTk.PhotoImage(image)
+    _RASTERS.setdefault(t, []).append(photo)
+    pos = window._convert_coords(0, 0)
+    window._queue_command(t._tkkey, None, pos, window._canvas.create_image, list(pos),
+                          {'image': photo, 'block': False, 'noicon': True})
+
+
+#################### Redrawing in Place ####################
+class _CanvasPool(object):
+    """
+    The canvas items drawn by redraw_geometry on one window, kept for reuse.
+
+    Items are listed in the order they were drawn. The options of each item
+    are remembered, so that unchanged colors are not sent to Tkinter again.
+    These attributes are only used by the Tkinter thread.
+
+    Attribute lines: The line items, each a list [canvas id, options]
+    Invariant: lines is a list
+
+    Attribute polygons: The polygon items, each a list [canvas id, options]
+    Invariant: polygons is a list
+
+    Attribute image: The raster image item, or None
+    Invariant: image is None or a list [canvas id, PhotoImage]
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty pool.
+        """
+        self.lines = []
+        self.polygons = []
+        self.image = None
+
+    def ids(self):
+        """
+        Returns: the canvas ids of all the items in this pool.
+        """
+        ids = [item[0] for item in self.lines + self.polygons]
+        return ids + [self.image[0]] if self.image else ids
+
+
+def redraw_geometry(w, geom, stroke=1, mode=None):
+    """
+    Draws the recorded figure geom on w, replacing the last figure it drew there.
+
+    This is for redrawing nearly identical figures (a parameter sweep, or an
+    animation), and is used in place of clearing the window. The canvas items
+    of the previous figure are updated in place: their coordinates are moved
+    and their colors changed only if they differ. Items are only deleted or
+    created when the number of items changes.
+
+    The figure is drawn as in draw_geometry, with its own render mode. It
+    does not belong to any turtle or pen, but clearing w erases it.
+
+    Parameter w: The window to draw upon.
+    Precondition: w is a introcs Window object.
+
+    Parameter geom: The figure to draw
+    Precondition: geom is a Geometry object
+
+    Parameter stroke: The line width in pixels
+    Precondition: stroke is a number > 0
+
+    Parameter mode: The render mode (RENDER_MODE if None)
+    Precondition: mode is None, 'auto', 'vector' or 'raster'
+    """
+    assert is_window(w), report_error('w is not a valid window', w)
+    assert type(geom) == Geometry, report_error('geom is not a Geometry', geom)
+    assert is_number(stroke) and stroke > 0, report_error('Invalid stroke', stroke)
+    mode = RENDER_MODE if mode is None else mode
+    assert mode in ['auto', 'vector', 'raster'], report_error('Invalid render mode', mode)
+    if mode == 'auto':
+        size = len(geom.segcolors) + len(geom.tricolors)
+        mode = 'raster' if size > RASTER_THRESHOLD else 'vector'
+
+    geom = geom.decoded()
+    pool = _POOLS.get(w)
+    if pool is None:
+        pool = _CanvasPool()
+        _POOLS[w] = pool
+
+    lines = []
+    polygons = []
+    photo = None
+    if mode == 'raster':
+        from PIL import ImageTk
+        photo = ImageTk.PhotoImage(rasterize_geometry(geom, w.width, w.height, stroke))
+    else:
+        colors = [palette_web(color_index(c)) for c in geom.palette]
+        for tri, k in zip(geom.triangles.tolist(), geom.tricolors.tolist()):
+            polygons.append((tri, {'fill': colors[k], 'outline': ''}))
+        for path, k in polyline_runs(geom.segments, geom.segcolors):
+            lines.append((path, {'fill': colors[k], 'width': stroke}))
+
+    w._queue_command(None, None, (0, 0), _tk_update_pool, [w, pool, lines, polygons, photo],
+                     {'block': True})
+
+
+def _tk_update_pool(w, pool, lines, polygons, photo):
+    """
+    Updates the items of pool to show the given shapes. Runs in the Tkinter thread.
+
+    Parameter w: The window to draw upon.
+    Precondition: w is a introcs Window object.
+
+    Parameter pool: The items on the window
+    Precondition: pool is the _CanvasPool of w
+
+    Parameter lines: The lines, as (turtle space path, options) pairs
+    Precondition: lines is a list
+
+    Parameter polygons: The polygons, as (turtle space path, options) pairs
+    Precondition: polygons is a list
+
+    Parameter photo: The raster image to show, or None
+    Precondition: photo is None or a PhotoImage
+    """
+    canvas = w._canvas
+    ids = pool.ids()
+    if ids and not canvas.type(ids[0]):
+        # The window was cleared since the last redraw
+        pool.__init__()
+
+    cx = canvas._currw / 2
+    cy = canvas._currh / 2
+    _tk_update_items(canvas, pool.polygons, polygons, canvas.create_polygon, cx, cy)
+    _tk_update_items(canvas, pool.lines, lines, canvas.create_line, cx, cy)
+
+    if photo is None and pool.image:
+        canvas.delete(pool.image[0])
+        pool.image = None
+    elif photo is not None and pool.image:
+        canvas.coords(pool.image[0], cx, cy)
+        canvas.itemconfigure(pool.image[0], image=photo)
+        pool.image[1] = photo
+    elif photo is not None:
+        pool.image = [canvas.create_image(cx, cy, image=photo), photo]
+
+    # Lines go over polygons, even if the polygons were created later
+    for item in pool.lines:
+        canvas.tag_raise(item[0])
+
+
+def _tk_update_items(canvas, items, shapes, create, cx, cy):
+    """
+    Makes the canvas items show the given shapes, reusing as many as possible.
+
+    Parameter canvas: The window canvas
+    Precondition: canvas is a Tkinter canvas
+
+    Parameter items: The existing items, each a list [canvas id, options]
+    Precondition: items is a list (it is modified)
+
+    Parameter shapes: The shapes to show, as (turtle space path, options) pairs
+    Precondition: shapes is a list
+
+    Parameter create: The canvas method creating an item of this kind
+    Precondition: create is canvas.create_line or canvas.create_polygon
+
+    Parameter cx: The screen x-coordinate of the turtle origin
+    Precondition: cx is a number
+
+    Parameter cy: The screen y-coordinate of the turtle origin
+    Precondition: cy is a number
+    """
+    for pos in range(len(shapes)):
+        path, options = shapes[pos]
+        coords = [v + cx if i % 2 == 0 else cy - v for i, v in enumerate(path)]
+        if pos < len(items):
+            canvas.coords(items[pos][0], coords)
+            if items[pos][1] != options:
+                canvas.itemconfigure(items[pos][0], **options)
+                items[pos][1] = options
+        else:
+            items.append([create(coords, **options), options])
+
+    if len(items) > len(shapes):
+        canvas.delete(*[item[0] for item in items[len(shapes):]])
+        del items[len(shapes):]
+
+
+#################### Scanline Fill ####################
+def fill_mask(path, width, height):
+    """
+    Returns: the pixels inside the closed polygon path, as a boolean array.
+
+    The result has shape (height, width), and pixel (row, col) is True if its
+    center (col+0.5, row+0.5) is inside the polygon by the even-odd rule.
+    The path is in image space (as made by _screen_coords), and anything
+    outside of the image is clipped.
+
+    The polygon is filled one scanline at a time. Every edge is crossed with
+    every scanline it spans, the crossings are sorted by row and then by x,
+    and each row is filled between consecutive pairs of crossings. All of
+    this is done with whole-array operations, so a polygon with a million
+    edges takes well under a second.
+
+    Parameter path: The polygon vertices, with the first vertex repeated at the end
+    Precondition: path is a numpy array of shape (m+1, 2)
+
+    Parameter width: The image width in pixels
+    Precondition: width is an int > 0
+
+    Parameter height: The image height in pixels
+    Precondition: height is an int > 0
+    """
+    assert type(width) == int and width > 0, report_error('Invalid width', width)
+    assert type(height) == int and height > 0, report_error('Invalid height', height)
+    path = np.asarray(path, dtype=float)
+    x0, y0 = path[:-1, 0], path[:-1, 1]
+    x1, y1 = path[1:, 0], path[1:, 1]
+
+    # The edge table: the rows whose centers are in [ymin, ymax) of each edge
+    first = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, height).astype(np.int64)
+    last = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, height).astype(np.int64)
+    count = last - first
+    spans = np.flatnonzero(count > 0)
+    count = count[spans]
+
+    # One crossing for every row of every edge
+    edges = np.repeat(spans, count)
+    offset = np.arange(len(edges)) - np.repeat(np.cumsum(count) - count, count)
+    rows = first[edges] + offset
+    dy = y1[edges] - y0[edges]
+    xs = x0[edges] + (rows + 0.5 - y0[edges]) * (x1[edges] - x0[edges]) / dy
+
+    # Sort by row, then x, and pair the crossings up within each row
+    order = np.lexsort((xs, rows))
+    rows = rows[order][0::2]
+    cols = np.clip(np.ceil(xs[order] - 0.5), 0, width).astype(np.int64)
+    starts, ends = cols[0::2], cols[1::2]
+
+    # Mark where each span starts and stops, and sum along the rows
+    marks = np.zeros((height, width + 1), dtype=np.int32)
+    np.add.at(marks, (rows, starts), 1)
+    np.add.at(marks, (rows, ends), -1)
+    return np.cumsum(marks, axis=1)[:, :width] > 0
+
+
+#################### Extents ####################
+def extents(figure, **params):
+    """
+    Returns: the bounding box (left, bottom, right, top) of figure(w, **params, sp).
+
+    The figure is not drawn (so there is no w or sp argument). The box is
+    computed directly from the parameters: in O(1) time for island and
+    tiling, O(d) for triangle, and O(n) (or O(k*n)) for the other figures,
+    which is what it takes to find the vertices of their outer lines. The
+    box is exact, up to round-off, for the lines and filled shapes of the
+    figure; it does not include the line width.
+
+    Parameter figure: The figure to measure
+    Precondition: figure is one of draw_spiral, multi_polygons, radiate_petals,
+    triangle, island or tiling
+
+    Parameter params: The arguments to figure, other than w and sp
+    Precondition: params are valid arguments for figure, by keyword
+    """
+    measures = {draw_spiral: _spiral_extents, multi_polygons: _polygons_extents,
+                radiate_petals: _petals_extents, triangle: _triangle_extents,
+                island: _island_extents, tiling: _tiling_extents}
+    assert figure in measures, report_error('figure has no extents', figure)
+    return measures[figure](**params)
+
+
+def _box(points):
+    """
+    Returns: the bounding box (left, bottom, right, top) of points.
+
+    Parameter points: The points
+    Precondition: points is a numpy array of shape (m, 2), with m >= 1
+    """
+    low = points.min(axis=0)
+    high = points.max(axis=0)
+    return (float(low[0]), float(low[1]), float(high[0]), float(high[1]))
+
+
+def _spiral_extents(side, ang, n):
+    """
+    Returns: the bounding box of draw_spiral(w, side, ang, n, sp).
+
+    Parameters are as in draw_spiral.
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_number(ang), report_error('ang is not a valid angle', ang)
+    assert is_valid_iteration(n), report_error('n is not a valid number of iterations', n)
+    rad = (270 + np.arange(n) * ang) * (math.pi / 180.0)
+    steps = np.column_stack([np.cos(rad), np.sin(rad)]) * (side * np.arange(1, n + 1))[:, None]
+    return _box(np.vstack([[0, 0], np.cumsum(steps, axis=0)]))
+
+
+def _polygons_extents(side, k, n):
+    """
+    Returns: the bounding box of multi_polygons(w, side, k, n, sp).
+
+    Parameters are as in multi_polygons.
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_iteration(k), report_error('k is not a valid number of polygons', k)
+    assert type(n) == int and n >= 3, report_error('n is not a valid number of sides', n)
+
+    # The vertices of the first polygon, rotated for each of the others
+    rad = np.arange(n) * (2 * math.pi / n)
+    steps = np.column_stack([np.cos(rad), np.sin(rad)]) * side
+    vertices = np.cumsum(steps, axis=0)
+    turns = (90 + np.arange(k) * (360.0 / k)) * (math.pi / 180.0)
+    cos = np.cos(turns)[:, None]
+    sin = np.sin(turns)[:, None]
+    xs = cos * vertices[:, 0] - sin * vertices[:, 1]
+    ys = sin * vertices[:, 0] + cos * vertices[:, 1]
+    return _box(np.column_stack([xs.ravel(), ys.ravel()]))
+
+
+def _petals_extents(radius, width, n):
+    """
+    Returns: the bounding box of radiate_petals(w, radius, width, n, sp).
+
+    Parameters are as in radiate_petals.
+    """
+    assert is_valid_length(radius), report_error('radius is not a valid length', radius)
+    assert is_valid_length(width), report_error('width is not a valid length', width)
+    assert is_valid_iteration(n), report_error('n is not a valid number of petals', n)
+    return _box(petal_paths(0, 0, 90, radius, width, n).reshape(-1, 2))
+
+
+def _triangle_extents(side, d):
+    """
+    Returns: the bounding box of triangle(w, side, d, sp).
+
+    Every level shifts its three children by (0, 0), (side/2, 0) and
+    (side/4, h/2), so the box of a level is the box of a child, stretched
+    right and up by the largest of those shifts.
+
+    Parameters are as in triangle.
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    right = 0.0
+    top = 0.0
+    for _ in range(d):
+        right += side / 2
+        top += side * math.sqrt(3) / 4
+        side = side / 2
+    h = side * math.sqrt(0.75)
+    return (-side / 2, -h / 2, right + side / 2, top + h / 2)
+
+
+def _island_extents(side, d):
+    """
+    Returns: the bounding box of island(w, side, d, sp).
+
+    Each level of a Minkowski edge bulges out by a quarter of the level
+    before, starting at side/4, for a total of side/3 * (1 - 4**-d).
+
+    Parameters are as in island (filled does not change the box).
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    reach = side / 2 + side / 3 * (1 - 4.0 ** -d)
+    return (-reach, -reach, reach, reach)
+
+
+def _tiling_extents(shape, cols, rows, side):
+    """
+    Returns: the bounding box of tiling(w, shape, cols, rows, side, sp).
+
+    Parameters are as in tiling.
+    """
+    assert shape in ['hex', 'triangle'], report_error('shape is not a valid tile shape', shape)
+    assert is_valid_iteration(cols), report_error('cols is not a valid number of columns', cols)
+    assert is_valid_iteration(rows), report_error('rows is not a valid number of rows', rows)
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+
+    # Sizes in lattice units (see hex_tiling and triangle_tiling)
+    if shape == 'hex':
+        across = 3 * cols + 1
+        up = 2 * rows + (1 if cols > 1 else 0)
+    else:
+        across = cols + 1
+        up = rows
+    halfw = across * side / 4
+    halfh = up * side * math.sqrt(0.75) / 2
+    return (-halfw, -halfh, halfw, halfh)
+
+
+#################### Deadlines ####################
+# The estimated seconds to compute and draw one segment or triangle of each
+# figure. These are rough defaults; record_cost (and the calibrate function
+# of a4bench) replace them with measurements from this machine.
+COST_MODEL = {'island': 2e-7, 'triangle': 1e-6}
+
+
+class RenderReport(object):
+    """
+    What render_within drew, and how long it took.
+
+    Attribute figure: The figure name
+    Invariant: figure is a key of COST_MODEL
+
+    Attribute requested: The depth asked for
+    Invariant: requested is an int >= 0
+
+    Attribute depth: The deepest depth drawn
+    Invariant: depth is an int, 0 <= depth <= requested
+
+    Attribute deadline: The time budget in seconds
+    Invariant: deadline is a number > 0
+
+    Attribute elapsed: The total time taken in seconds
+    Invariant: elapsed is a float >= 0
+
+    Attribute levels: The depths drawn, in order, as (depth, seconds) pairs
+    Invariant: levels is a list of tuples
+    """
+
+    def __init__(self, figure, requested, deadline):
+        """
+        Initializes an empty report.
+
+        Parameter figure: The figure name
+        Precondition: figure is a key of COST_MODEL
+
+        Parameter requested: The depth asked for
+        Precondition: requested is an int >= 0
+
+        Parameter deadline: The time budget in seconds
+        Precondition: deadline is a number > 0
+        """
+        self.figure = figure
+        self.requested = requested
+        self.depth = 0
+        self.deadline = deadline
+        self.elapsed = 0.0
+        self.levels = []
+
+    def met(self):
+        """
+        Returns: True if everything was drawn within the deadline.
+        """
+        return self.elapsed <= self.deadline
+
+    def __repr__(self):
+        """
+        Returns: a readable summary of this report.
+        """
+        return ('RenderReport(%s, depth %d of %d, %.1f ms of %.1f ms)' %
+                (self.figure, self.depth, self.requested,
+                 1000 * self.elapsed, 1000 * self.deadline))
+
+
+def figure_size(figure, d):
+    """
+    Returns: the number of segments and triangles in figure at depth d.
+
+    Parameter figure: The figure name
+    Precondition: figure is a key of COST_MODEL
+
+    Parameter d: The depth
+    Precondition: d is a valid depth (int >= 0)
+    """
+    if figure == 'island':
+        return 4 * 8 ** d
+    return 4 * 3 ** d  # Each triangle also has 3 outline segments
+
+
+def estimate_cost(figure, d):
+    """
+    Returns: the estimated seconds to compute and draw figure at depth d.
+
+    Parameter figure: The figure name
+    Precondition: figure is a key of COST_MODEL
+
+    Parameter d: The depth
+    Precondition: d is a valid depth (int >= 0)
+    """
+    return COST_MODEL[figure] * figure_size(figure, d)
+
+
+def record_cost(figure, d, seconds):
+    """
+    Updates COST_MODEL with the time taken to compute and draw figure at depth d.
+
+    The new estimate is the average of the old one and the measurement, so
+    that one slow frame does not throw off the model. Very small figures
+    are mostly overhead, so they are not recorded.
+
+    Parameter figure: The figure name
+    Precondition: figure is a key of COST_MODEL
+
+    Parameter d: The depth
+    Precondition: d is a valid depth (int >= 0)
+
+    Parameter seconds: The time taken
+    Precondition: seconds is a number >= 0
+    """
+    assert figure in COST_MODEL, report_error('figure has no cost model', figure)
+    assert is_number(seconds) and seconds >= 0, report_error('Invalid time', seconds)
+    size = figure_size(figure, d)
+    if size >= 1000:
+        COST_MODEL[figure] = (COST_MODEL[figure] + seconds / size) / 2
+
+
+def render_within(w, figure, make, d, deadline):
+    """
+    Returns: a RenderReport, after drawing figure on w as deep as deadline allows.
+
+    This function clears the window and draws make(depth) for the deepest
+    depth (at most d) whose estimated cost fits the deadline, or depth 0
+    if none does. Every depth drawn is timed and fed back into the cost
+    model. If that shows the estimate was too high, and the next depth now
+    fits in the time remaining, the drawing is refined one depth at a time,
+    redrawing it in place (see redraw_geometry).
+
+    Parameter w: The window to draw upon.
+    Precondition: w is a introcs Window object.
+
+    Parameter figure: The figure name
+    Precondition: figure is a key of COST_MODEL
+
+    Parameter make: The function computing the figure at a given depth
+    Precondition: make is a function taking a depth and returning a Geometry
+
+    Parameter d: The deepest depth to draw
+    Precondition: d is a valid depth (int >= 0)
+
+    Parameter deadline: The time budget in seconds
+    Precondition: deadline is a number > 0
+    """
+    assert figure in COST_MODEL, report_error('figure has no cost model', figure)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    assert is_number(deadline) and deadline > 0, report_error('Invalid deadline', deadline)
+
+    start = time.perf_counter()
+    report = RenderReport(figure, d, deadline)
+    depth = 0
+    while depth < d and estimate_cost(figure, depth + 1) <= deadline:
+        depth += 1
+
+    w.clear()
+    while True:
+        began = time.perf_counter()
+        redraw_geometry(w, make(depth))
+        took = time.perf_counter() - began
+        record_cost(figure, depth, took)
+        report.levels.append((depth, took))
+        report.depth = depth
+
+        remaining = deadline - (time.perf_counter() - start)
+        if depth == d or estimate_cost(figure, depth + 1) > remaining:
+            break
+        depth += 1
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+#################### Pipelined Drawing ####################
+# The most chunks computed ahead of the drawing (more only use more memory)
+PIPELINE_DEPTH = 4
+
+# About how many segments or triangles go in each chunk
+PIPELINE_CHUNK = 4096
+
+
+def island_chunks(side, d, color='black'):
+    """
+    Yields: the island of island_geometry(side, d, color), as a sequence of smaller Geometry objects.
+
+    Each chunk is one connected part of the island outline, with about
+    PIPELINE_CHUNK segments. Drawing every chunk draws the whole island.
+
+    Parameter side: The side length of the island.
+    Precondition: side is a valid side length (number >= 0).
+
+    Parameter d: The recursive depth of the island.
+    Precondition: d is a valid depth (int >= 0).
+
+    Parameter color: The island color
+    Precondition: color is a valid turtle color
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    assert is_valid_color(color), report_error('color is not a valid color', color)
+
+    level = d
+    while level > 0 and 8 ** (d - level + 1) <= PIPELINE_CHUNK:
+        level -= 1
+    step = side / 4 ** d
+    origin = np.array([side / 2, -side / 2])
+    for turn, start in _island_parts(d, level):
+        steps = _island_part_steps(turn, start, d - level)
+        path = np.vstack([[start], steps]) * step + origin
+        yield Geometry(segments=path_segments(path), palette=[color])
+
+
+def triangle_chunks(side, d, fill='magenta', edge='black'):
+    """
+    Yields: the triangle of triangle_geometry(side, d), as a sequence of smaller Geometry objects.
+
+    Each chunk is one Sierpinski subtree, with about PIPELINE_CHUNK
+    triangles. Drawing every chunk draws the whole triangle.
+
+    Parameter side: The side length of the triangle.
+    Precondition: side is a valid side length (number >= 0).
+
+    Parameter d: The recursive depth of the triangle.
+    Precondition: d is a valid depth (int >= 0).
+
+    Parameter fill: The fill color
+    Precondition: fill is a valid turtle color
+
+    Parameter edge: The outline color
+    Precondition: edge is a valid turtle color
+    """
+    assert is_valid_length(side), report_error('side is not a valid length', side)
+    assert is_valid_depth(d), report_error('d is not a valid depth', d)
+    assert is_valid_color(fill), report_error('fill is not a valid color', fill)
+    assert is_valid_color(edge), report_error('edge is not a valid color', edge)
+
+    top = 0
+    while top < d and 3 ** (d - top) > PIPELINE_CHUNK:
+        top += 1
+    roots, child = _triangle_centers(np.zeros((1, 2)), side, top)
+    for root in roots:
+        centers, size = _triangle_centers(root[None, :], child, d - top)
+        triangles = _triangle_rows(centers, size)
+        segments = triangles[:, [0, 1, 2, 3, 2, 3, 4, 5, 4, 5, 0, 1]].reshape(-1, 4)
+        yield Geometry(segments=segments, segcolors=np.ones(len(segments)),
+                       triangles=triangles, palette=[fill, edge])
+
+
+def draw_pipelined(t, chunks):
+    """
+    Draws every Geometry in chunks with the tool t, computing and drawing at the same time.
+
+    A background thread computes the chunks and puts them in a queue of at
+    most PIPELINE_DEPTH chunks. This thread takes them off the queue and
+    hands them to the window as it goes, without waiting for each one to
+    be drawn. So the next chunk is computed while the window draws the last
+    one, and the total time is close to the larger of the two, not their
+    sum. Any error in computing a chunk is raised here.
+
+    The tool is not moved. REMEMBER: You need to flush the tool if its speed
+    is 0.
+
+    Parameter t: The drawing tool
+    Precondition: t is a Turtle or a Pen
+
+    Parameter chunks: The figure, in pieces
+    Precondition: chunks is an iterable of Geometry objects
+    """
+    import queue
+    assert type(t) in [_turtle.Turtle, _turtle.Pen], report_error('t is not a drawing tool', t)
+
+    pending = queue.Queue(maxsize=PIPELINE_DEPTH)
+    done = object()  # Marks the end of the chunks
+    stop = threading.Event()
+
+    def offer(item):
+        # Waits for room in the queue, but gives up once the drawing stops
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not offer(chunk):
+                    return
+            offer(done)
+        except BaseException as error:
+            offer(error)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            chunk = pending.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            draw_geometry(t, chunk, 'vector')
+    finally:
+        stop.set()  # Lets the producer give up if drawing failed
+        producer.join()
+
+
+#################### Scenes ####################
+class Scene(object):
+    """
+    A composite drawing of several figures on one window.
+
+    Figures are added as recorded geometry functions (like spiral_geometry
+    or polygons_geometry, placed with their x and y arguments). When the
+    scene is drawn, every figure is computed in a pool of worker threads,
+    and drawn one at a time by the thread that called draw.
+
+    Drawing is never concurrent. The workers do not touch the window: each
+    finished figure goes on a queue, and the calling thread takes it off
+    and draws it with a turtle of its own, so the canvas state stays
+    consistent. Computing is not truly parallel either, as the workers are
+    threads and hold the GIL for most of the time they spend in Python.
+    What the threads buy is ordering: a figure is drawn as soon as it is
+    ready, so a slow figure does not hold up the others, and drawing one
+    figure overlaps with numpy code computing the next. For computing on
+    several cores, use the workers argument of island_path or
+    triangle_geometry, which runs in separate processes.
+
+    Attribute window: The window to draw upon.
+    Invariant: window is a introcs Window object.
+
+    Attribute figures: The figures, as (function, keyword arguments) pairs
+    Invariant: figures is a list
+
+    Attribute turtles: The turtle that drew each figure, after draw
+    Invariant: turtles is a list of Turtles (or None where not drawn yet)
+    """
+
+    def __init__(self, w):
+        """
+        Initializes an empty scene on the window w.
+
+        Parameter w: The window to draw upon.
+        Precondition: w is a introcs Window object.
+        """
+        assert is_window(w), report_error('w is not a valid window', w)
+        self.window = w
+        self.figures = []
+        self.turtles = []
+
+    def add(self, figure, **params):
+        """
+        Returns: the position of the new figure figure(**params) in this scene.
+
+        Parameter figure: The function computing the figure
+        Precondition: figure is a function returning a Geometry. It must not
+        draw anything, as it runs in a worker thread.
+
+        Parameter params: The keyword arguments to figure
+        Precondition: params are valid arguments for figure
+        """
+        assert callable(figure), report_error('figure is not a function', figure)
+        self.figures.append((figure, params))
+        self.turtles.append(None)
+        return len(self.figures) - 1
+
+    def draw(self, workers=None, mode=None):
+        """
+        Draws every figure of this scene, computing them in worker threads.
+
+        The figures are drawn one at a time on this thread, which must be the
+        thread that made the window. Each figure gets a new hidden turtle,
+        which is kept in turtles. Any error in computing a figure is raised
+        here, once the other figures are done.
+
+        Parameter workers: The number of worker threads (one per figure if None)
+        Precondition: workers is None or an int >= 1
+
+        Parameter mode: The render mode (RENDER_MODE if None)
+        Precondition: mode is None, 'auto', 'vector' or 'raster'
+        """
+        import queue
+        from concurrent.futures import ThreadPoolExecutor
+        workers = max(1, len(self.figures)) if workers is None else workers
+        assert type(workers) == int and workers >= 1, report_error('Invalid workers', workers)
+
+        finished = queue.Queue()
+
+        def compute(pos):
+            figure, params = self.figures[pos]
+            try:
+                finished.put((pos, figure(**params), None))
+            except BaseException as error:
+                finished.put((pos, None, error))
+
+        failure = None
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for pos in range(len(self.figures)):
+                pool.submit(compute, pos)
+            for _ in range(len(self.figures)):
+                pos, geom, error = finished.get()
+                if error is not None:
+                    failure = failure or error
+                    continue
+                t = _turtle.Turtle(self.window)
+                t.visible = False
+                t.speed = 0
+                draw_geometry(t, geom, mode)
+                self.turtles[pos] = t
+
+        for t in self.turtles:
+            if t is not None:
+                t.flush()
+        if failure is not None:
+            raise failure
+
+
+#################### Command Logs ####################
+# The operations of a command log, each followed by its arguments
+OP_TOOL = 0      # A new tool: kind (0 turtle, 1 pen), x, y, heading, color, fill, mode
+OP_SELECT = 1    # Switch to a tool: its position in the log
+OP_FORWARD = 2   # Turtle forward (backward is negative): distance
+OP_LEFT = 3      # Turtle turn (right is negative): degrees
+OP_HEADING = 4   # Turtle heading: degrees
+OP_MOVE = 5      # Move without drawing: x, y
+OP_COLOR = 6     # Turtle color or pen edge color: color
+OP_FILL = 7      # Pen fill color: color
+OP_MODE = 8      # Turtle drawmode or pen solid: 0 or 1
+OP_DRAWTO = 9    # Pen line: x, y
+OP_PATH = 10     # A batched line: color, width, n, then n points
+OP_POLYGON = 11  # A batched polygon: fill, outline, width, n, then n points
+
+# How many arguments each operation has (None if it says in its arguments)
+_OP_ARGS = [7, 1, 1, 1, 1, 2, 1, 1, 1, 2, None, None]
+
+# The command logs being recorded (only the last one records)
+_RECORDING = []
+
+# Held while the drawing tools are patched for recording (see record)
+_RECORDING_LOCK = threading.RLock()
+
+
+class CommandLog(object):
+    """
+    A compact recording of everything the a4 drawing tools did.
+
+    Each command is one operation byte (see OP_TOOL and the constants after
+    it) and its arguments, packed one after another in a float array. Colors
+    are stored as positions in the log color list (-1 for no color). The
+    log only holds what was drawn, not how it was computed, so it can be
+    replayed without any of the recursion or precondition checks.
+
+    Attribute ops: The operations, in order
+    Invariant: ops is a bytearray
+
+    Attribute args: The arguments of all the operations, in order
+    Invariant: args is an array of doubles
+
+    Attribute colors: The web colors used, as referred to by the arguments
+    Invariant: colors is a list of strings
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty command log.
+        """
+        self.ops = bytearray()
+        self.args = array.array('d')
+        self.colors = []
+        self._colors = {}
+        self._tools = {}
+        self._current = None
+        self._busy = False
+        self._thread = None
+        self._windows = []
+
+    def __len__(self):
+        """
+        Returns: the number of commands in this log.
+        """
+        return len(self.ops)
+
+    def nbytes(self):
+        """
+        Returns: the size of this log in bytes (not counting the color list).
+        """
+        return len(self.ops) + self.args.itemsize * len(self.args)
+
+    def add(self, op, args):
+        """
+        Adds the operation op with the given arguments to this log.
+
+        Parameter op: The operation
+        Precondition: op is one of the OP constants
+
+        Parameter args: The arguments
+        Precondition: args is a list of numbers, as described for op
+        """
+        self.ops.append(op)
+        self.args.extend(args)
+
+    def color(self, c):
+        """
+        Returns: the position of the color c in colors, adding it if needed.
+
+        Parameter c: The color
+        Precondition: c is None (no color) or a valid turtle color
+        """
+        if c is None:
+            return -1
+        web = palette_web(color_index(c))
+        pos = self._colors.get(web)
+        if pos is None:
+            pos = len(self.colors)
+            self.colors.append(web)
+            self._colors[web] = pos
+        return pos
+
+    def use(self, tool):
+        """
+        Records that the following commands are by tool.
+
+        Parameter tool: The drawing tool
+        Precondition: tool is a Turtle or Pen
+        """
+        if self._current is tool:
+            return
+        if tool in self._tools:
+            self.add(OP_SELECT, [self._tools[tool]])
+        else:
+            self._tools[tool] = len(self._tools)
+            if type(tool) == _turtle.Pen:
+                state = [1, tool.x, tool.y, 0, self.color(tool.edgecolor),
+                         self.color(tool.fillcolor), int(tool.solid)]
+            else:
+                state = [0, tool.x, tool.y, tool.heading, self.color(tool.color),
+                         -1, int(tool.drawmode)]
+            self.add(OP_TOOL, state)
+        self._current = tool
+
+    def path(self, coords, color, width):
+        """
+        Records a batched line through the points coords.
+
+        Parameter coords: The path as a flat list [x0, y0, x1, y1, ...]
+        Precondition: coords has even length >= 4
+
+        Parameter color: The line color
+        Precondition: color is a valid turtle color
+
+        Parameter width: The line width
+        Precondition: width is a number
+        """
+        self.add(OP_PATH, [self.color(color), width, len(coords) // 2])
+        self.args.extend(coords)
+
+    def polygon(self, coords, fill, outline, width):
+        """
+        Records a batched polygon through the points coords.
+
+        Parameter coords: The polygon as a flat list [x0, y0, x1, y1, ...]
+        Precondition: coords has even length >= 6
+
+        Parameter fill: The fill color
+        Precondition: fill is None or a valid turtle color
+
+        Parameter outline: The outline color
+        Precondition: outline is None or a valid turtle color
+
+        Parameter width: The line width
+        Precondition: width is a number
+        """
+        self.add(OP_POLYGON, [self.color(fill), self.color(outline), width, len(coords) // 2])
+        self.args.extend(coords)
+
+
+def record(figure, *args, **kwargs):
+    """
+    Returns: the CommandLog of everything drawn by figure(*args, **kwargs).
+
+    While figure runs, every Turtle and Pen command (forward, backward,
+    turns, moves, colors, drawmode and solid changes, and pen lines) is
+    recorded, along with the lines and polygons that the fast drawing
+    paths give the window directly. A figure that draw_geometry draws as
+    an image is recorded as the lines and polygons in it.
+
+    Only the tools drawing on the windows given to figure (as a window, or
+    as the window of a Turtle or Pen argument) are recorded, and only on the
+    thread that called record. Turtles on other windows or threads are left
+    alone. If figure is given no window, tools on any window are recorded.
+
+    The tools are recorded by patching the Turtle and Pen classes while
+    figure runs, and the patches are removed when it returns or raises. So
+    only one thread can record at a time: a second call waits for the first
+    one to finish. A call made by the recorded figure itself records into
+    its own log, and not the outer one.
+
+    The island fill is not recorded. It is drawn as an image of the mask
+    of the island (see fill_mask), which has no lines or polygons, so a
+    replay of a filled island shows only its outline.
+
+    Parameter figure: The function to record, such as island or draw_spiral
+    Precondition: figure is callable
+
+    Parameter args: The positional arguments to figure
+    Precondition: args are valid for figure
+
+    Parameter kwargs: The keyword arguments to figure
+    Precondition: kwargs are valid for figure
+    """
+    assert callable(figure), report_error('figure is not a function', figure)
+    return _record(figure, args, kwargs)[0]
+
+
+def _record(figure, args, kwargs):
+    """
+    Returns: the tuple (log, result) of recording figure(*args, **kwargs), as in record.
+
+    Parameter figure: The function to record
+    Precondition: figure is callable
+
+    Parameter args: The positional arguments to figure
+    Precondition: args is a tuple of arguments valid for figure
+
+    Parameter kwargs: The keyword arguments to figure
+    Precondition: kwargs is a dictionary of arguments valid for figure
+    """
+    log = CommandLog()
+    log._thread = threading.get_ident()
+    for value in list(args) + list(kwargs.values()):
+        if is_window(value):
+            log._windows.append(value)
+        elif type(value) in [_turtle.Turtle, _turtle.Pen]:
+            log._windows.append(value._window)
+
+    with _RECORDING_LOCK:
+        patches = _recording_patches()
+        saved = [(cls, name, cls.__dict__[name]) for cls, name, _ in patches]
+        _RECORDING.append(log)
+        try:
+            for cls, name, value in patches:
+                setattr(cls, name, value)
+            result = figure(*args, **kwargs)
+        finally:
+            for cls, name, value in saved:
+                setattr(cls, name, value)
+            _RECORDING.remove(log)
+            log._tools = {}
+            log._current = None
+    return (log, result)
+
+
+def _recording_log(tool=None):
+    """
+    Returns: the CommandLog recording tool, or None if tool is not recorded.
+
+    Parameter tool: The drawing tool, or None for any tool on this thread
+    Precondition: tool is None, a Turtle or a Pen
+    """
+    log = _RECORDING[-1] if _RECORDING else None
+    if log is None or log._thread != threading.get_ident():
+        return None
+    if tool is not None and log._windows and not any(tool._window is w for w in log._windows):
+        return None
+    return log
+
+
+def _recording_patches():
+    """
+    Returns: the (class, name, replacement) triples that record the drawing tools.
+
+    Each replacement calls the original and logs it. Calls made from inside
+    another recorded call (like drawLine calling drawTo) are not logged again.
+    """
+    def recorded(method, op, convert):
+        def wrapper(self, *args):
+            log = _recording_log(self)
+            if log is None or log._busy:
+                return method(self, *args)
+            log._busy = True
+            try:
+                result = method(self, *args)
+            finally:
+                log._busy = False
+            log.use(self)
+            log.add(op, convert(self, log, *args))
+            return result
+        return wrapper
+
+    def setter(prop, op, convert):
+        def fset(self, value):
+            recorded(prop.fset, op, convert)(self, value)
+        return property(prop.fget, fset, prop.fdel, prop.__doc__)
+
+    def created(init):
+        def wrapper(self, *args, **kwargs):
+            log = _recording_log()
+            if log is None or log._busy:
+                return init(self, *args, **kwargs)
+            log._busy = True
+            try:
+                init(self, *args, **kwargs)
+            finally:
+                log._busy = False
+            if _recording_log(self) is log:
+                log.use(self)
+        return wrapper
+
+    turtle = _turtle.Turtle
+    pen = _turtle.Pen
+    value = lambda self, log, v: [v]
+    flag = lambda self, log, v: [int(v)]
+    place = lambda self, log, x, y: [x, y]
+    paint = lambda self, log, c: [log.color(c)]
+    return [(turtle, '__init__', created(turtle.__init__)),
+            (turtle, 'forward', recorded(turtle.forward, OP_FORWARD, value)),
+            (turtle, 'backward', recorded(turtle.backward, OP_FORWARD, lambda self, log, v: [-v])),
+            (turtle, 'left', recorded(turtle.left, OP_LEFT, value)),
+            (turtle, 'right', recorded(turtle.right, OP_LEFT, lambda self, log, v: [-v])),
+            (turtle, 'move', recorded(turtle.move, OP_MOVE, place)),
+            (turtle, 'heading', setter(turtle.heading, OP_HEADING, value)),
+            (turtle, 'color', setter(turtle.color, OP_COLOR, paint)),
+            (turtle, 'drawmode', setter(turtle.drawmode, OP_MODE, flag)),
+            (pen, '__init__', created(pen.__init__)),
+            (pen, 'move', recorded(pen.move, OP_MOVE, place)),
+            (pen, 'drawLine', recorded(pen.drawLine, OP_DRAWTO,
+                                       lambda self, log, dx, dy: [self.x, self.y])),
+            (pen, 'drawTo', recorded(pen.drawTo, OP_DRAWTO, place)),
+            (pen, 'edgecolor', setter(pen.edgecolor, OP_COLOR, paint)),
+            (pen, 'fillcolor', setter(pen.fillcolor, OP_FILL, paint)),
+            (pen, 'solid', setter(pen.solid, OP_MODE, flag))]
+
+
+def replay(log, w=None, fps=None, frame=1000):
+    """
+    Returns: the Geometry of everything drawn in log, after drawing it on w.
+
+    The log is interpreted directly: turtle and pen commands become line
+    segments (and filled triangles, for solid pens), without running any
+    of the original code. If w is None, nothing is drawn, which is the
+    headless backend (the Geometry can be rasterized or saved).
+
+    If fps is None, the whole log is drawn at once with a hidden turtle.
+    Otherwise it is drawn frame commands at a time, at fps frames a second.
+
+    Parameter log: The commands to replay
+    Precondition: log is a CommandLog
+
+    Parameter w: The window to draw upon, or None
+    Precondition: w is None or a introcs Window object.
+
+    Parameter fps: The frame rate, or None to draw all at once
+    Precondition: fps is None or a number > 0
+
+    Parameter frame: The number of commands in each frame
+    Precondition: frame is an int >= 1
+    """
+    assert type(log) == CommandLog, report_error('log is not a CommandLog', log)
+    assert w is None or is_window(w), report_error('w is not a valid window', w)
+    assert fps is None or (is_number(fps) and fps > 0), report_error('Invalid fps', fps)
+    assert is_valid_iteration(frame), report_error('Invalid frame', frame)
+
+    t = None
+    if w is not None:
+        t = _turtle.Turtle(w)
+        t.visible = False
+        t.speed = 0
+
+    parts = []
+    for geom in _replay_frames(log, frame if fps else max(1, len(log))):
+        parts.append(geom)
+        if t is not None and fps:
+            began = time.perf_counter()
+            draw_geometry(t, geom, 'vector')
+            t.flush()
+            time.sleep(max(0.0, 1.0 / fps - (time.perf_counter() - began)))
+
+    palette = log.colors or ['black']
+    result = Geometry(segments=np.vstack([g.segments for g in parts] + [np.zeros((0, 4))]),
+                      segcolors=np.concatenate([g.segcolors for g in parts] + [[]]),
+                      triangles=np.vstack([g.triangles for g in parts] + [np.zeros((0, 6))]),
+                      tricolors=np.concatenate([g.tricolors for g in parts] + [[]]),
+                      palette=palette)
+    if t is not None and not fps:
+        draw_geometry(t, result)
+        t.flush()
+    return result
+
+
+def _replay_frames(log, frame):
+    """
+    Yields: the Geometry drawn by each run of frame commands in log.
+
+    Parameter log: The commands to replay
+    Precondition: log is a CommandLog
+
+    Parameter frame: The number of commands in each frame
+    Precondition: frame is an int >= 1
+    """
+    args = log.args
+    palette = log.colors or ['black']
+    tools = []
+    tool = None
+    pos = 0
+    segments = []
+    segcolors = []
+    triangles = []
+    tricolors = []
+
+    for count, op in enumerate(log.ops):
+        size = _OP_ARGS[op]
+        if size is None:
+            size = 3 + 2 * int(args[pos + 2]) if op == OP_PATH else 4 + 2 * int(args[pos + 3])
+        a = args[pos:pos + size]
+        pos += size
+
+        if op == OP_TOOL:
+            # kind, x, y, heading, color, fill, mode, and the points of a solid shape
+            tool = list(a) + [[]]
+            tools.append(tool)
+        elif op == OP_SELECT:
+            tool = tools[int(a[0])]
+        elif op == OP_FORWARD:
+            rad = math.radians(tool[3])
+            x = tool[1] + math.cos(rad) * a[0]
+            y = tool[2] + math.sin(rad) * a[0]
+            if tool[6]:
+                segments.append((tool[1], tool[2], x, y))
+                segcolors.append(tool[4])
+            tool[1], tool[2] = x, y
+        elif op == OP_LEFT:
+            tool[3] += a[0]
+        elif op == OP_HEADING:
+            tool[3] = a[0]
+        elif op == OP_MOVE:
+            if tool[0] and tool[6]:
+                _replay_fill(tool, triangles, tricolors)
+            tool[1], tool[2] = a[0], a[1]
+        elif op == OP_COLOR:
+            tool[4] = a[0]
+        elif op == OP_FILL:
+            tool[5] = a[0]
+        elif op == OP_MODE:
+            if tool[0] and tool[6] and not a[0]:
+                _replay_fill(tool, triangles, tricolors)
+            tool[6] = a[0]
+        elif op == OP_DRAWTO:
+            segments.append((tool[1], tool[2], a[0], a[1]))
+            segcolors.append(tool[4])
+            if tool[0] and tool[6]:
+                if not tool[7]:
+                    tool[7] += [tool[1], tool[2]]
+                tool[7] += [a[0], a[1]]
+            tool[1], tool[2] = a[0], a[1]
+        elif op == OP_PATH:
+            points = np.asarray(a[3:]).reshape(-1, 2)
+            segments.extend(path_segments(points).tolist())
+            segcolors.extend([a[0]] * (len(points) - 1))
+        elif op == OP_POLYGON:
+            points = list(a[4:])
+            if a[0] >= 0:
+                _replay_fan(points, a[0], triangles, tricolors)
+            if a[1] >= 0:
+                closed = np.asarray(points + points[:2]).reshape(-1, 2)
+                segments.extend(path_segments(closed).tolist())
+                segcolors.extend([a[1]] * (len(closed) - 1))
+
+        if (count + 1) % frame == 0 or count + 1 == len(log.ops):
+            yield Geometry(segments=segments, segcolors=segcolors, triangles=triangles,
+                           tricolors=tricolors, palette=palette)
+            segments, segcolors, triangles, tricolors = [], [], [], []
+
+
+def _replay_fill(tool, triangles, tricolors):
+    """
+    Fills the solid shape traced by a replayed pen, and starts a new one.
+
+    Parameter tool: The replayed pen state
+    Precondition: tool is a list as made by _replay_frames
+
+    Parameter triangles: The triangles drawn so far
+    Precondition: triangles is a list
+
+    Parameter tricolors: The color of each triangle drawn so far
+    Precondition: tricolors is a list
+    """
+    _replay_fan(tool[7], tool[5], triangles, tricolors)
+    tool[7] = []
+
+
+def _replay_fan(points, color, triangles, tricolors):
+    """
+    Adds the polygon through points as a fan of triangles (enough for convex shapes).
+
+    Parameter points: The polygon as a flat list [x0, y0, x1, y1, ...]
+    Precondition: points is a list of numbers of even length
+
+    Parameter color: The fill color
+    Precondition: color is a position in the log colors
+
+    Parameter triangles: The triangles drawn so far
+    Precondition: triangles is a list
+
+    Parameter tricolors: The color of each triangle drawn so far
+    Precondition: tricolors is a list
+    """
+    if len(points) > 6 and abs(points[-2] - points[0]) + abs(points[-1] - points[1]) < 1e-9:
+        points = points[:-2]  # A closed shape repeats its first point
+    for i in range(2, len(points) - 3, 2):
+        triangles.append(points[:2] + points[i:i + 4])
+        tricolors.append(color)
+
+
+#################### Memory Reports ####################
+# The files whose allocations belong to the drawing backend
+_BACKEND_FILES = ['*introcs*', '*tkinter*']
+
+
+class MemoryReport(object):
+    """
+    How much memory an a4 entry point used, as measured by memory_report.
+
+    All sizes are in bytes. The peak and retained memory count everything
+    Python allocated while the figure ran (see tracemalloc), including its
+    recording; memory held by Tk itself is not visible to Python.
+
+    Attribute figure: The name of the entry point
+    Invariant: figure is a string
+
+    Attribute peak: The most memory allocated at once
+    Invariant: peak is an int >= 0
+
+    Attribute retained: The memory still allocated when the figure was done
+    Invariant: retained is an int >= 0
+
+    Attribute backend: The retained memory allocated by the turtle and Tkinter
+    Invariant: backend is an int >= 0
+
+    Attribute geometry: The size of the geometry buffers of the figure
+    Invariant: geometry is an int >= 0
+
+    Attribute log: The size of the command log, if the figure was drawn
+    Invariant: log is an int >= 0
+
+    Attribute segments: The number of line segments in the figure
+    Invariant: segments is an int >= 0
+
+    Attribute triangles: The number of filled triangles in the figure
+    Invariant: triangles is an int >= 0
+
+    Attribute items: The number of canvas items the figure drew
+    Invariant: items is an int >= 0 (0 if the figure was not drawn)
+    """
+
+    def __init__(self, figure):
+        """
+        Initializes an empty report.
+
+        Parameter figure: The name of the entry point
+        Precondition: figure is a string
+        """
+        self.figure = figure
+        self.peak = 0
+        self.retained = 0
+        self.backend = 0
+        self.geometry = 0
+        self.log = 0
+        self.segments = 0
+        self.triangles = 0
+        self.items = 0
+
+    def per_shape(self):
+        """
+        Returns: the peak memory per segment and triangle (0 if there are none).
+        """
+        shapes = self.segments + self.triangles
+        return self.peak / shapes if shapes else 0.0
+
+    def asdict(self):
+        """
+        Returns: this report as a dictionary, for saving or comparing reports.
+        """
+        return dict(self.__dict__, per_shape=self.per_shape())
+
+    def __repr__(self):
+        """
+        Returns: a readable summary of this report.
+        """
+        return ('MemoryReport(%s, peak %.1f KB, %.1f B/shape, geometry %.1f KB, '
+                'backend %.1f KB in %d items)' %
+                (self.figure, self.peak / 1024, self.per_shape(), self.geometry / 1024,
+                 self.backend / 1024, self.items))
+
+
+def memory_report(figure, *args, **kwargs):
+    """
+    Returns: a MemoryReport of running figure(*args, **kwargs).
+
+    Memory is only traced while the report is made, so this costs nothing
+    otherwise. If figure returns a Geometry (like island_geometry), that is
+    the geometry measured. Otherwise figure is recorded (see record), and
+    the geometry and canvas items are those of its command log.
+
+    Parameter figure: The entry point, such as triangle or island_geometry
+    Precondition: figure is callable
+
+    Parameter args: The positional arguments to figure
+    Precondition: args are valid for figure
+
+    Parameter kwargs: The keyword arguments to figure
+    Precondition: kwargs are valid for figure
+    """
+    assert callable(figure), report_error('figure is not a function', figure)
+    report = MemoryReport(getattr(figure, '__name__', repr(figure)))
+    for module in [np, introcs, _turtle]:
+        module._load()  # Deferred imports are not part of the figure
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        log, result = _record(figure, args, kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+        filters = [tracemalloc.Filter(True, name) for name in _BACKEND_FILES]
+        backend = tracemalloc.take_snapshot().filter_traces(filters)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    report.peak = max(0, peak - before)
+    report.retained = max(0, current - before)
+    report.backend = sum(stat.size for stat in backend.statistics('filename'))
+    if type(result) == Geometry:
+        geom = result
+    else:
+        geom = replay(log)
+        report.log = log.nbytes()
+        report.items = _canvas_items(log)
+    report.geometry = geom.nbytes()
+    report.segments = len(geom.segcolors)
+    report.triangles = len(geom.tricolors)
+    return report
+
+
+def _canvas_items(log):
+    """
+    Returns: the number of canvas items drawn by the commands in log.
+
+    Every turtle step with the pen down and every pen line is an item, as is
+    every batched line or polygon, and every filled pen shape.
+
+    Parameter log: The commands to count
+    Precondition: log is a CommandLog
+    """
+    args = log.args
+    modes = []
+    tool = None
+    pos = 0
+    items = 0
+    for op in log.ops:
+        size = _OP_ARGS[op]
+        if size is None:
+            size = 3 + 2 * int(args[pos + 2]) if op == OP_PATH else 4 + 2 * int(args[pos + 3])
+        if op == OP_TOOL:
+            tool = len(modes)
+            modes.append([args[pos], args[pos + 6]])
+        elif op == OP_SELECT:
+            tool = int(args[pos])
+        elif op == OP_FORWARD:
+            items += bool(modes[tool][1])
+        elif op == OP_MODE:
+            items += bool(modes[tool][0] and modes[tool][1] and not args[pos])
+            modes[tool][1] = args[pos]
+        elif op in (OP_DRAWTO, OP_PATH, OP_POLYGON):
+            items += 1
+        pos += size
+    return items
@@ -0,0 +1,224 @@
+"""
+Benchmark script for Turtle Graphics
+
+This script times the a4 figures, and uses the timings to calibrate the
+cost model that a4 uses to draw within a deadline. The figures are drawn on
+a window when there is a display, and rendered off-screen otherwise. It also
+measures the memory each figure takes. Run it as a script to print the
+timings and memory, or call calibrate() before drawing.
+"""
+import math
+import time
+import tkinter
+import a4
+
+
+def open_window():
+    """
+    Returns: a new introcs Window, or None if there is no display.
+
+    The window starts Tk on a thread of its own, where a missing display
+    cannot be caught, so the display is checked here first.
+    """
+    try:
+        tkinter.Tk().destroy()
+    except tkinter.TclError:
+        return None
+    from introcs.turtle import Window
+    return Window()
+
+
+def time_figure(figure, d, repeat=3, width=700, height=700, w=None):
+    """
+    Returns: the best time in seconds to compute and render figure at depth d.
+
+    If w is given, the figure is drawn on it the way render_within draws it
+    (see redraw_geometry), starting from a cleared window each time. This is
+    the time the cost model predicts. Otherwise the figure is rendered
+    off-screen (see rasterize_geometry), which is only a stand-in for
+    drawing it on a window.
+
+    Parameter figure: The figure name
+    Precondition: figure is 'island' or 'triangle'
+
+    Parameter d: The depth
+    Precondition: d is a valid depth (int >= 0)
+
+    Parameter repeat: The number of times to run it
+    Precondition: repeat is an int >= 1
+
+    Parameter width: The image width in pixels (ignored if w is given)
+    Precondition: width is an int > 0
+
+    Parameter height: The image height in pixels (ignored if w is given)
+    Precondition: height is an int > 0
+
+    Parameter w: The window to draw upon, or None to render off-screen
+    Precondition: w is None or a introcs Window object
+    """
+    make = a4.island_geometry if figure == 'island' else a4.triangle_geometry
+    best = None
+    for _ in range(repeat):
+        if w is not None:
+            w.clear()
+        start = time.perf_counter()
+        if w is None:
+            a4.rasterize_geometry(make(300, d), width, height)
+        else:
+            a4.redraw_geometry(w, make(300, d))
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best
+
+
+def calibrate(depths=None, w=None):
+    """
+    Returns: the calibrated a4.COST_MODEL, after timing each figure.
+
+    Every figure is timed at the given depths, and every timing is fed into
+    the cost model with a4.record_cost. The timings only match what the
+    model predicts if the figures are drawn on a window w.
+
+    Parameter depths: The depths to time each figure at, by figure name
+    Precondition: depths is None or a dictionary of lists of depths
+
+    Parameter w: The window to draw upon, or None to render off-screen
+    Precondition: w is None or a introcs Window object
+    """
+    if depths is None:
+        depths = {'island': [3, 4, 5], 'triangle': [5, 6, 7]}
+    for figure in depths:
+        for d in depths[figure]:
+            a4.record_cost(figure, d, time_figure(figure, d, w=w))
+    return dict(a4.COST_MODEL)
+
+
+def report_figure(figure, depths, w=None):
+    """
+    Prints the time and throughput of figure at each of the given depths.
+
+    Parameter figure: The figure name
+    Precondition: figure is 'island' or 'triangle'
+
+    Parameter depths: The depths to time
+    Precondition: depths is a list of valid depths
+
+    Parameter w: The window to draw upon, or None to render off-screen
+    Precondition: w is None or a introcs Window object
+    """
+    for d in depths:
+        took = time_figure(figure, d, w=w)
+        size = a4.figure_size(figure, d)
+        print('%-8s depth %d: %10d shapes %9.2f ms %8.1f ns/shape' %
+              (figure, d, size, 1000 * took, 1e9 * took / size))
+
+
+def spiral_per_step(x, y, heading, side, ang, n):
+    """
+    Returns: the vertices of a4.spiral_path(x, y, heading, side, ang, n), one step at a time.
+
+    This does the trig of every line in the loop, the way a turtle does. It
+    is the baseline that time_headings compares a4.spiral_path against.
+
+    Parameters are as in a4.spiral_path.
+    """
+    path = [(x, y)]
+    for i in range(n):
+        rad = math.radians(heading + i * ang)
+        x += math.cos(rad) * (i + 1) * side
+        y += math.sin(rad) * (i + 1) * side
+        path.append((x, y))
+    return path
+
+
+def time_headings(n=1000, repeat=200):
+    """
+    Returns: the tuple (per_step, table) of seconds to compute a spiral of n lines repeat times.
+
+    per_step is the time of spiral_per_step, and table is the time of
+    a4.spiral_path, which computes the trig of all n headings in one numpy
+    pass (see a4.heading_steps). Each numpy call has a fixed overhead, so
+    the table only wins once a drawing has more than about a hundred lines.
+
+    Parameter n: The number of lines in the spiral
+    Precondition: n is an int >= 1
+
+    Parameter repeat: The number of spirals to compute
+    Precondition: repeat is an int >= 1
+    """
+    a4.spiral_path(0, 0, 270, 2, 83, n)  # Imports numpy before the timing
+    start = time.perf_counter()
+    for _ in range(repeat):
+        spiral_per_step(0, 0, 270, 2, 83, n)
+    per_step = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        a4.spiral_path(0, 0, 270, 2, 83, n)
+    table = time.perf_counter() - start
+    return (per_step, table)
+
+
+def report_headings(sizes):
+    """
+    Prints the time to compute spirals of each size, one step at a time and with a4.spiral_path.
+
+    Parameter sizes: The numbers of lines to time
+    Precondition: sizes is a list of ints >= 1
+    """
+    for n in sizes:
+        per_step, table = time_headings(n)
+        print('spiral   %5d lines: %9.2f ms per step %9.2f ms table %6.1fx' %
+              (n, 1000 * per_step, 1000 * table, per_step / table))
+
+
+def memory_figure(figure, d):
+    """
+    Returns: the a4.MemoryReport of computing figure at depth d.
+
+    Parameter figure: The figure name
+    Precondition: figure is 'island' or 'triangle'
+
+    Parameter d: The depth
+    Precondition: d is a valid depth (int >= 0)
+    """
+    make = a4.island_geometry if figure == 'island' else a4.triangle_geometry
+    return a4.memory_report(make, 300, d)
+
+
+def report_memory(figure, depths):
+    """
+    Prints the peak memory and geometry size of figure at each of the given depths.
+
+    Parameter figure: The figure name
+    Precondition: figure is 'island' or 'triangle'
+
+    Parameter depths: The depths to measure
+    Precondition: depths is a list of valid depths
+    """
+    for d in depths:
+        report = memory_figure(figure, d)
+        print('%-8s depth %d: %10d shapes %9.1f KB peak %8.1f B/shape %9.1f KB geometry' %
+              (figure, d, report.segments + report.triangles, report.peak / 1024,
+               report.per_shape(), report.geometry / 1024))
+
+
+def main():
+    """
+    Times and measures every figure, and prints the calibrated cost model.
+
+    The figures are drawn on a window if there is a display.
+    """
+    report_headings([100, 1000, 10000])
+    w = open_window()
+    if w is None:
+        print('No display: rendering off-screen')
+    report_figure('island', [2, 3, 4, 5], w)
+    report_figure('triangle', [4, 5, 6, 7], w)
+    report_memory('island', [2, 3, 4, 5])
+    report_memory('triangle', [4, 5, 6, 7])
+    print('Cost model:', calibrate(w=w))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 """
 Test script for Turtle Graphics
 """
+import sys
 import a4
 import introcs
 from introcs.turtle import Window, Turtle, Pen
@@ -542,6 +543,902 @@ def test_island(w,sp):
     input('Press [return]')
 
 
+#################### Headless Tests ####################
+# These tests check the geometry behind the figures, and need no window or
+# speed. Run them with 'python a4test.py headless'.
+
+def test_heading_steps():
+    """
+    Tests the function heading_steps and the paths built with it
+    """
+    print('Testing heading_steps')
+    import math
+    np = a4.np
+    steps = a4.heading_steps(30, 45.5, 10)
+    introcs.assert_equals((10, 2), steps.shape)
+    for i in range(10):
+        rad = math.radians(30 + 45.5 * i)
+        introcs.assert_float_lists_equal([math.cos(rad), math.sin(rad)], steps[i].tolist())
+    introcs.assert_equals((0, 2), a4.heading_steps(0, 90, 0).shape)
+
+    # A polygon comes back to its start
+    path = a4.polygon_path(10, -20, 90, 50, 6)
+    introcs.assert_equals((7, 2), path.shape)
+    introcs.assert_float_lists_equal([10, -20], path[0].tolist())
+    introcs.assert_float_lists_equal([10, -20], path[-1].tolist())
+    lengths = np.hypot(*np.diff(path, axis=0).T)
+    introcs.assert_float_lists_equal([50.0] * 6, lengths.tolist())
+
+    # Spiral line i has length (i+1)*side, turning ang each time
+    path = a4.spiral_path(0, 0, 270, 2, 90, 4)
+    introcs.assert_true(np.allclose([[0, 0], [0, -2], [4, -2], [4, 4], [-4, 4]], path))
+
+
+def test_petal_paths():
+    """
+    Tests the functions petal_paths and hsv_webcolors
+    """
+    print('Testing petal_paths')
+    paths = a4.petal_paths(10, -20, 45, 100, 30, 8)
+    introcs.assert_equals((8, 10), paths.shape)
+    for i in range(8):
+        diamond = a4.diamond_path(10, -20, 45 + i * 45.0, 100, 30)
+        introcs.assert_float_lists_equal(diamond, paths[i].tolist())
+
+    print('Testing hsv_webcolors')
+    hues = [0, 30, 59.5, 120, 200, 300, 359]
+    colors = a4.hsv_webcolors(a4.np.array(hues))
+    for hue, color in zip(hues, colors):
+        introcs.assert_equals(introcs.HSV(hue, 1, 1).webColor().lower(), color.lower())
+
+
+def test_geometry_files():
+    """
+    Tests the functions save_geometry and load_geometry
+    """
+    print('Testing save_geometry and load_geometry')
+    import os
+    import tempfile
+    np = a4.np
+    geom = a4.triangle_geometry(300, 3, fill='red', edge='blue')
+    path = os.path.join(tempfile.mkdtemp(), 'triangle.a4g')
+    a4.save_geometry(geom, path)
+
+    loaded = a4.load_geometry(path)
+    introcs.assert_equals(['#ff0000', '#0000ff'], loaded.palette)
+    introcs.assert_true(np.allclose(geom.segments, loaded.segments, atol=1e-3))
+    introcs.assert_true(np.allclose(geom.triangles, loaded.triangles, atol=1e-3))
+    introcs.assert_equals(geom.segcolors.tolist(), loaded.segcolors.tolist())
+    introcs.assert_equals(geom.tricolors.tolist(), loaded.tricolors.tolist())
+
+    # Empty figures round-trip too
+    a4.save_geometry(a4.Geometry(), path)
+    loaded = a4.load_geometry(path)
+    introcs.assert_equals((0, 4), loaded.segments.shape)
+    introcs.assert_equals((0, 6), loaded.triangles.shape)
+    del loaded
+    os.remove(path)
+
+
+def test_geometry_cache():
+    """
+    Tests the function cached_geometry and the cache maintenance functions
+    """
+    print('Testing cached_geometry')
+    import os
+    import time
+    import tempfile
+    np = a4.np
+    saved = (a4.GEOMETRY_CACHE_DIR, a4.GEOMETRY_PRECISION, a4.GEOMETRY_CACHE_BYTES)
+    save = a4.save_geometry
+    a4.GEOMETRY_CACHE_DIR = tempfile.mkdtemp()
+    try:
+        # A miss and a hit give the same figure, with the same types
+        miss = a4.cached_geometry(a4.triangle_geometry, side=300, d=3)
+        hit = a4.cached_geometry(a4.triangle_geometry, d=3, side=300)
+        introcs.assert_equals(1, len(os.listdir(a4.GEOMETRY_CACHE_DIR)))
+        introcs.assert_equals(miss.precision(), hit.precision())
+        introcs.assert_true(np.array_equal(miss.triangles, hit.triangles))
+        introcs.assert_true(np.allclose(a4.triangle_geometry(300, 3).triangles,
+                                        hit.triangles, atol=1e-3))
+
+        # Figures without a stable name cannot be keyed
+        if __debug__:
+            introcs.assert_error(a4.cached_geometry, lambda: a4.Geometry(), error=AssertionError)
+
+        # Settings that change the figure are part of the key
+        a4.GEOMETRY_PRECISION = 'int16'
+        quantized = a4.cached_geometry(a4.triangle_geometry, side=300, d=3)
+        introcs.assert_equals('int16', quantized.precision())
+        introcs.assert_equals(2, len(os.listdir(a4.GEOMETRY_CACHE_DIR)))
+        a4.GEOMETRY_PRECISION = 'float64'
+
+        # A damaged file is computed again
+        key = a4._cache_key('a4.triangle_geometry', {'side': 300, 'd': 3})
+        introcs.assert_not_equals(key, a4._cache_key('a4.triangle_geometry', {'side': 300, 'd': 3.0}))
+        path = os.path.join(a4.GEOMETRY_CACHE_DIR, key)
+        del miss, hit, quantized
+        with open(path, 'wb') as file:
+            file.write(b'garbage')
+        introcs.assert_error(a4.load_geometry, path, error=ValueError)
+        again = a4.cached_geometry(a4.triangle_geometry, side=300, d=3)
+        introcs.assert_equals(81, len(again.segments))
+        del again
+
+        # Old temporary files are trimmed, recent ones are not
+        old = os.path.join(a4.GEOMETRY_CACHE_DIR, 'old.tmp')
+        new = os.path.join(a4.GEOMETRY_CACHE_DIR, 'new.tmp')
+        for name in [old, new]:
+            open(name, 'wb').close()
+        os.utime(old, (time.time() - 2 * a4.GEOMETRY_CACHE_TEMP_AGE,) * 2)
+        a4.trim_geometry_cache()
+        introcs.assert_false(os.path.exists(old))
+        introcs.assert_true(os.path.exists(new))
+        a4.clear_geometry_cache()
+        introcs.assert_equals(['new.tmp'], os.listdir(a4.GEOMETRY_CACHE_DIR))
+        os.remove(new)
+
+        # A failed write leaves no temporary file behind
+        def fail(geom, path):
+            open(path, 'wb').write(b'partial')
+            raise ValueError('bad figure')
+        a4.save_geometry = fail
+        try:
+            figure = lambda: a4.cached_geometry(a4.triangle_geometry, side=300, d=2)
+            introcs.assert_error(figure, error=ValueError)
+        finally:
+            a4.save_geometry = save
+        introcs.assert_equals([], os.listdir(a4.GEOMETRY_CACHE_DIR))
+
+        # An entry evicted as soon as it is written still gives the stored figure
+        a4.GEOMETRY_CACHE_BYTES = 0
+        evicted = a4.cached_geometry(a4.triangle_geometry, side=300, d=3)
+        introcs.assert_equals([], os.listdir(a4.GEOMETRY_CACHE_DIR))
+        introcs.assert_equals('float32', evicted.precision())
+        introcs.assert_true(np.allclose(a4.triangle_geometry(300, 3).triangles,
+                                        evicted.triangles, atol=1e-3))
+    finally:
+        a4.GEOMETRY_CACHE_DIR, a4.GEOMETRY_PRECISION, a4.GEOMETRY_CACHE_BYTES = saved
+
+
+def test_lazy_imports():
+    """
+    Tests that importing a4 does not import numpy, Tkinter or the turtle
+    """
+    print('Testing lazy imports')
+    import os
+    import subprocess
+    code = ('import sys, a4; a4.is_valid_depth(3); '
+            'print(sorted(m for m in ["numpy", "tkinter", "introcs"] if m in sys.modules))')
+    here = os.path.dirname(os.path.abspath(a4.__file__))
+    result = subprocess.run([sys.executable, '-c', code], cwd=here,
+                            capture_output=True, text=True)
+    introcs.assert_equals("[]", result.stdout.strip())
+
+    # A deferred module is imported by its first attribute, or by loading it
+    import colorsys
+    lazy = a4._LazyModule('colorsys')
+    introcs.assert_true(lazy._load() is colorsys)
+    introcs.assert_true(lazy.rgb_to_hsv is colorsys.rgb_to_hsv)
+
+
+def test_polyline_runs():
+    """
+    Tests the function polyline_runs
+    """
+    print('Testing polyline_runs')
+    np = a4.np
+    segments = np.array([[0, 0, 1, 0], [1, 0, 1, 1], [1, 1, 0, 1],   # One run
+                         [5, 5, 6, 6],                               # Elsewhere
+                         [6, 6, 7, 7]], dtype=float)                 # Other color
+    runs = a4.polyline_runs(segments, np.array([0, 0, 0, 0, 1]))
+    introcs.assert_equals([([0, 0, 1, 0, 1, 1, 0, 1], 0), ([5, 5, 6, 6], 0), ([6, 6, 7, 7], 1)], runs)
+    introcs.assert_equals([], a4.polyline_runs(np.zeros((0, 4)), np.zeros(0)))
+
+    # Long runs are split, but still cover every segment
+    path = a4.island_path(300, 4)
+    segments = a4.path_segments(path)
+    runs = a4.polyline_runs(segments, np.zeros(len(segments), dtype=int))
+    introcs.assert_equals(-(-len(segments) // a4.RUN_LIMIT), len(runs))
+    introcs.assert_equals(len(segments), sum(len(run[0]) // 2 - 1 for run in runs))
+    introcs.assert_float_lists_equal(path[-1].tolist(), runs[-1][0][-2:])
+
+
+def test_petals_geometry():
+    """
+    Tests the function petals_geometry
+    """
+    print('Testing petals_geometry')
+    np = a4.np
+    geom = a4.petals_geometry(100, 30, 8, 5, 5, 90)
+    introcs.assert_equals((32, 4), geom.segments.shape)
+    paths = a4.petal_paths(5, 5, 90, 100, 30, 8)
+    colors = a4.hsv_webcolors((90 + np.arange(8) * 45.0) % 360)
+    for i in range(8):
+        # Each petal is four connected segments around its diamond
+        petal = geom.segments[4 * i:4 * i + 4]
+        introcs.assert_float_lists_equal(paths[i, :8].tolist(), petal[:, :2].ravel().tolist())
+        introcs.assert_float_lists_equal(paths[i, 2:].tolist(), petal[:, 2:].ravel().tolist())
+        for k in geom.segcolors[4 * i:4 * i + 4].tolist():
+            introcs.assert_equals(colors[i], geom.palette[k])
+
+
+def test_canvas_pool():
+    """
+    Tests that redrawing in place reuses canvas items (see redraw_geometry)
+    """
+    print('Testing canvas pool')
+
+    class Canvas(object):
+        def __init__(self):
+            self._currw = 200
+            self._currh = 100
+            self.items = {}
+            self.calls = []
+
+        def create_line(self, coords, **options):
+            self.calls.append('create')
+            self.items[len(self.items)+1] = coords
+            return len(self.items)
+
+        create_polygon = create_line
+
+        def coords(self, item, *coords):
+            self.calls.append('coords')
+            self.items[item] = coords[0]
+
+        def itemconfigure(self, item, **options):
+            self.calls.append('configure')
+
+        def delete(self, *items):
+            self.calls.append('delete')
+            for item in items:
+                del self.items[item]
+
+        def tag_raise(self, item):
+            pass
+
+        def type(self, item):
+            return 'line' if item in self.items else ''
+
+    w = type('Blank', (object,), {})()
+    w._canvas = Canvas()
+    pool = a4._CanvasPool()
+    red = {'fill': '#ff0000', 'width': 1}
+    blue = {'fill': '#0000ff', 'width': 1}
+    lines = [([0, 0, 10, 10], red), ([0, 0, -10, 5], red), ([1, 1, 2, 2], red)]
+
+    a4._tk_update_pool(w, pool, lines, [], None)
+    introcs.assert_equals(['create']*3, w._canvas.calls)
+    introcs.assert_equals([100, 50, 110, 40], w._canvas.items[1])
+
+    # The same number of lines: moved in place, and only new colors are set
+    del w._canvas.calls[:]
+    lines[1] = ([5, 5, 6, 6], blue)
+    a4._tk_update_pool(w, pool, lines, [], None)
+    introcs.assert_equals(['coords']*2+['configure', 'coords'], w._canvas.calls)
+    introcs.assert_equals([105, 45, 106, 44], w._canvas.items[2])
+
+    # Fewer lines: the extra items are deleted
+    del w._canvas.calls[:]
+    a4._tk_update_pool(w, pool, lines[:1], [], None)
+    introcs.assert_equals(['coords', 'delete'], w._canvas.calls)
+    introcs.assert_equals(1, len(pool.lines))
+
+    # A cleared window starts over
+    w._canvas.items.clear()
+    del w._canvas.calls[:]
+    a4._tk_update_pool(w, pool, lines, [], None)
+    introcs.assert_equals(['create']*3, w._canvas.calls)
+
+
+def test_island_path():
+    """
+    Tests the function island_path against island_edge_path
+    """
+    print('Testing island_path')
+    np = a4.np
+    for d in [0, 1, 3]:
+        path = a4.island_path(300, d, 10, -20)
+        introcs.assert_equals((4 * 8 ** d + 1, 2), path.shape)
+
+        # The island closes exactly where it started
+        introcs.assert_equals(path[0].tolist(), path[-1].tolist())
+        introcs.assert_float_lists_equal([160.0, -170.0], path[0].tolist())
+
+        # Each side is a Minkowski edge turned 90 degrees from the last
+        n = 8 ** d
+        for k in range(4):
+            start = path[k * n]
+            edge = a4.island_edge_path(start[0], start[1], 90 + 90 * k, 300, d)
+            introcs.assert_true(np.allclose(edge, path[k * n:(k + 1) * n + 1]))
+
+
+def test_fill_mask():
+    """
+    Tests the function fill_mask
+    """
+    print('Testing fill_mask')
+    np = a4.np
+    square = np.array([[100, 100], [200, 100], [200, 200], [100, 200], [100, 100]], dtype=float)
+    mask = a4.fill_mask(square, 400, 300)
+    introcs.assert_equals((300, 400), mask.shape)
+    introcs.assert_equals(10000, int(mask.sum()))
+    introcs.assert_true(mask[150, 150])
+    introcs.assert_false(mask[50, 150])
+
+    # Clipped to the image
+    introcs.assert_equals(2500, int(a4.fill_mask(square - 150, 400, 300).sum()))
+
+    # A Minkowski island has the same area as its square, at every depth
+    for d in range(4):
+        screen = a4._screen_coords(a4.island_path(300, d), 350, 350)
+        introcs.assert_equals(90000, int(a4.fill_mask(screen, 700, 700).sum()))
+
+
+def test_dedupe_geometry():
+    """
+    Tests the function dedupe_geometry and the figures that use it
+    """
+    print('Testing dedupe_geometry')
+    np = a4.np
+    segments = np.array([[0, 0, 1, 0], [1, 0, 2, 0], [2, 0, 1, 0], [0, 0, 1, 1]], dtype=float)
+    geom, saved = a4.dedupe_geometry(a4.Geometry(segments=segments))
+    introcs.assert_equals(2, saved)
+    introcs.assert_equals([[0, 0, 2, 0], [0, 0, 1, 1]], geom.segments.tolist())
+
+    # Different colors are never merged, and the last copy is kept
+    colors = np.array([0, 1])
+    geom, saved = a4.dedupe_geometry(a4.Geometry(segments=segments[[0, 0]], segcolors=colors,
+                                                 palette=['red', 'blue']))
+    introcs.assert_equals(1, saved)
+    introcs.assert_equals([1], geom.segcolors.tolist())
+
+    # A hexagon: 18 strokes become 6 outer edges and 3 diameters
+    introcs.assert_equals(18, len(a4.hex_geometry(50, dedupe=False).segments))
+    introcs.assert_equals(9, len(a4.hex_geometry(50).segments))
+    introcs.assert_equals(9, a4.DEDUPE_SAVED['hex_geometry'])
+
+
+def test_tilings():
+    """
+    Tests the functions hex_tiling and triangle_tiling
+    """
+    print('Testing tilings')
+    np = a4.np
+
+    # Outlines only, with each shared edge in the figure once
+    introcs.assert_equals(6, len(a4.hex_tiling(1, 1, 10).segments))
+    introcs.assert_equals(11, len(a4.hex_tiling(2, 1, 10).segments))
+    introcs.assert_equals(11, len(a4.hex_tiling(1, 2, 10).segments))
+    introcs.assert_equals(3, len(a4.triangle_tiling(1, 1, 10).segments))
+    introcs.assert_equals(5, len(a4.triangle_tiling(2, 1, 10).segments))
+
+    for geom in [a4.hex_tiling(3, 3, 10), a4.triangle_tiling(4, 2, 10)]:
+        ends = np.round(geom.segments, 6).reshape(-1, 2, 2)
+        ends.sort(axis=1)
+        keys = set(map(tuple, ends.reshape(-1, 4).tolist()))
+        introcs.assert_equals(len(geom.segments), len(keys))
+
+        # Every side is 10 long
+        lengths = np.hypot(geom.segments[:, 2]-geom.segments[:, 0], geom.segments[:, 3]-geom.segments[:, 1])
+        introcs.assert_float_lists_equal([10.0]*len(lengths), lengths.tolist())
+
+    # Centered on (x, y)
+    for make in [a4.hex_tiling, a4.triangle_tiling]:
+        pts = make(3, 2, 10, 50, -20).segments.reshape(-1, 2)
+        introcs.assert_floats_equal(50, float(pts[:, 0].min()+pts[:, 0].max())/2)
+        introcs.assert_floats_equal(-20, float(pts[:, 1].min()+pts[:, 1].max())/2)
+
+
+def test_extents():
+    """
+    Tests the function extents against the bounding box of each geometry
+    """
+    print('Testing extents')
+    np = a4.np
+
+    def box(geom):
+        points = [geom.segments.reshape(-1, 2), geom.triangles.reshape(-1, 2)]
+        points = np.vstack(points)
+        return [float(v) for v in list(points.min(axis=0))+list(points.max(axis=0))]
+
+    cases = [(a4.triangle, {'side': 300, 'd': 0}, a4.triangle_geometry(300, 0)),
+             (a4.triangle, {'side': 300, 'd': 4}, a4.triangle_geometry(300, 4)),
+             (a4.island, {'side': 300, 'd': 0}, a4.island_geometry(300, 0)),
+             (a4.island, {'side': 300, 'd': 3}, a4.island_geometry(300, 3)),
+             (a4.draw_spiral, {'side': 2, 'ang': 83, 'n': 40}, a4.spiral_geometry(2, 83, 40)),
+             (a4.multi_polygons, {'side': 40, 'k': 7, 'n': 5}, a4.polygons_geometry(40, 7, 5)),
+             (a4.radiate_petals, {'radius': 100, 'width': 30, 'n': 9},
+                 a4.petals_geometry(100, 30, 9, heading=90)),
+             (a4.tiling, {'shape': 'hex', 'cols': 4, 'rows': 3, 'side': 10}, a4.hex_tiling(4, 3, 10)),
+             (a4.tiling, {'shape': 'triangle', 'cols': 5, 'rows': 2, 'side': 10},
+                 a4.triangle_tiling(5, 2, 10))]
+    for figure, params, geom in cases:
+        introcs.assert_float_lists_equal(box(geom), list(a4.extents(figure, **params)))
+
+    if __debug__:  # The check is an assert, which python -O removes
+        introcs.assert_error(a4.extents, a4.draw_two_lines, error=AssertionError)
+
+
+def test_render_within():
+    """
+    Tests the function render_within with a stand-in window
+    """
+    print('Testing render_within')
+
+    class Blank(object):
+        def clear(self):
+            self.drawn = []
+
+    def redraw(w, geom, stroke=1, mode=None):
+        w.drawn.append(len(geom.segments))
+
+    saved = (a4.redraw_geometry, dict(a4.COST_MODEL))
+    a4.redraw_geometry = redraw
+    try:
+        # Cheap enough: drawn at depth d right away
+        w = Blank()
+        a4.COST_MODEL['island'] = 1e-12
+        report = a4.render_within(w, 'island', lambda d: a4.island_geometry(100, d), 3, 10)
+        introcs.assert_equals([3], [depth for depth, took in report.levels])
+        introcs.assert_equals([2048], w.drawn)
+        introcs.assert_equals(3, report.depth)
+        introcs.assert_true(report.met())
+
+        # The estimate for depth 4 is over budget, but drawing depth 3 shows
+        # it was too high, so depth 4 is drawn as well
+        w = Blank()
+        a4.COST_MODEL['island'] = 1.5 * 10 / 4 ** 7
+        report = a4.render_within(w, 'island', lambda d: a4.island_geometry(100, d), 4, 10)
+        introcs.assert_equals([3, 4], [depth for depth, took in report.levels])
+        introcs.assert_equals([2048, 16384], w.drawn)
+        introcs.assert_equals(4, report.depth)
+
+        # Too expensive: only depth 0 is drawn
+        w = Blank()
+        a4.COST_MODEL['triangle'] = 1e6
+        report = a4.render_within(w, 'triangle', lambda d: a4.triangle_geometry(100, d), 4, 0.5)
+        introcs.assert_equals([0], [depth for depth, took in report.levels])
+        introcs.assert_equals(0, report.depth)
+        introcs.assert_equals(1, len(w.drawn))
+    finally:
+        a4.redraw_geometry = saved[0]
+        a4.COST_MODEL.clear()
+        a4.COST_MODEL.update(saved[1])
+
+    if __debug__:  # The check is an assert, which python -O removes
+        introcs.assert_error(a4.render_within, Blank(), 'island', a4.island_geometry, 2, 0,
+                             error=AssertionError)
+
+
+def test_parallel():
+    """
+    Tests that island_path and triangle_geometry give the same figures in parallel
+    """
+    print('Testing parallel')
+    np = a4.np
+
+    saved = a4.PARALLEL_DEPTH
+    a4.PARALLEL_DEPTH = 2
+    try:
+        for d in [2, 3]:
+            serial = a4.island_path(300, d, 10, -20, workers=1)
+            parallel = a4.island_path(300, d, 10, -20, workers=2)
+            introcs.assert_equals(serial.shape, parallel.shape)
+            introcs.assert_true(np.allclose(serial, parallel))
+
+            serial = a4.triangle_geometry(300, d, 10, -20, workers=1)
+            parallel = a4.triangle_geometry(300, d, 10, -20, workers=3)
+            introcs.assert_true(np.allclose(serial.triangles, parallel.triangles))
+            introcs.assert_true(np.allclose(serial.segments, parallel.segments))
+            introcs.assert_equals(serial.tricolors.tolist(), parallel.tricolors.tolist())
+            introcs.assert_equals(serial.segcolors.tolist(), parallel.segcolors.tolist())
+    finally:
+        a4.PARALLEL_DEPTH = saved
+
+
+def test_color_index():
+    """
+    Tests the functions color_index, palette_web and palette_rgb
+    """
+    print('Testing color_index')
+    red = a4.color_index('red')
+    introcs.assert_equals(red, a4.color_index('red'))
+    introcs.assert_equals(red, a4.color_index('#FF0000'))
+    introcs.assert_equals(red, a4.color_index(introcs.RGB(255, 0, 0)))
+    introcs.assert_equals(red, a4.color_index(introcs.HSV(0, 1, 1)))
+    introcs.assert_equals('#ff0000', a4.palette_web(red))
+    introcs.assert_equals((255, 0, 0), a4.palette_rgb(red))
+
+    blue = a4.color_index('blue')
+    introcs.assert_not_equals(red, blue)
+    introcs.assert_equals((0, 0, 255), a4.palette_rgb(blue))
+
+    # Mutable colors are keyed by their current value
+    c = introcs.RGB(0, 0, 255)
+    introcs.assert_equals(blue, a4.color_index(c))
+    c.red = 255
+    c.blue = 0
+    introcs.assert_equals(red, a4.color_index(c))
+    if __debug__:  # The check is an assert, which python -O removes
+        introcs.assert_error(a4.color_index, 'not a color', error=AssertionError)
+
+    # A full palette starts over, so ramps of new colors do not grow it forever
+    limit = a4.PALETTE_LIMIT
+    a4.PALETTE_LIMIT = 8
+    try:
+        for k in range(20):
+            web = '#0000%02x' % k
+            introcs.assert_equals(web, a4.palette_web(a4.color_index(web)))
+            introcs.assert_true(len(a4._COLOR_WEB) <= 8)
+        introcs.assert_true(a4.is_valid_color('#000013'))
+        introcs.assert_equals((255, 0, 0), a4.palette_rgb(a4.color_index('red')))
+    finally:
+        a4.PALETTE_LIMIT = limit
+    a4.clear_palette()
+    introcs.assert_equals(([], []), (a4._COLOR_WEB, a4._COLOR_RGB))
+    introcs.assert_equals({}, a4._COLOR_INDEX)
+    introcs.assert_equals(0, a4.color_index('blue'))
+
+
+def test_color_ramp():
+    """
+    Tests the function color_ramp
+    """
+    print('Testing color_ramp')
+    geom = a4.island_geometry(100, 1)
+    ramp = a4.color_ramp(geom, groups=4)
+    colors = [ramp.palette[k] for k in ramp.segcolors.tolist()]
+    introcs.assert_equals(['#ff0000']*8+['#80ff00']*8+['#00ffff']*8+['#8000ff']*8, colors)
+    introcs.assert_equals(['black'], [geom.palette[k] for k in set(geom.segcolors.tolist())])
+
+    # Only the triangles are colored, with the hue going from red towards green
+    geom = a4.triangle_geometry(100, 2)
+    ramp = a4.color_ramp(geom, 0, 120, segments=False)
+    colors = [ramp.palette[k] for k in ramp.tricolors.tolist()]
+    introcs.assert_equals(9, len(set(colors)))
+    introcs.assert_equals('#ff0000', colors[0])
+    introcs.assert_equals(geom.segcolors.tolist(), ramp.segcolors.tolist())
+    introcs.assert_true(a4.np.array_equal(ramp.segments, geom.segments))
+
+
+def test_draw_pipelined():
+    """
+    Tests that draw_pipelined raises drawing errors without hanging
+    """
+    print('Testing draw_pipelined')
+    import threading
+    import time
+
+    def fail(t, geom, mode=None):
+        time.sleep(0.2)  # Lets the producer fill the queue and wait to put the end
+        raise RuntimeError('drawing failed')
+
+    def run(outcome):
+        tool = a4._turtle.Turtle.__new__(a4._turtle.Turtle)
+        chunks = [a4.hex_geometry(10) for _ in range(a4.PIPELINE_DEPTH + 1)]
+        try:
+            a4.draw_pipelined(tool, chunks)
+        except RuntimeError as error:
+            outcome.append(str(error))
+
+    saved = a4.draw_geometry
+    a4.draw_geometry = fail
+    try:
+        outcome = []
+        runner = threading.Thread(target=run, args=(outcome,), daemon=True)
+        runner.start()
+        runner.join(5)
+        introcs.assert_false(runner.is_alive())
+        introcs.assert_equals(['drawing failed'], outcome)
+    finally:
+        a4.draw_geometry = saved
+
+
+def test_replay():
+    """
+    Tests the functions replay and record on hand-built and recorded logs
+    """
+    print('Testing replay')
+    import threading
+    np = a4.np
+
+    log = a4.CommandLog()
+    red = log.color('red')
+    log.add(a4.OP_TOOL, [0, 0, 0, 0, red, -1, 1])
+    log.add(a4.OP_FORWARD, [10])
+    log.add(a4.OP_LEFT, [90])
+    log.add(a4.OP_FORWARD, [10])
+    log.add(a4.OP_MODE, [0])
+    log.add(a4.OP_FORWARD, [5])
+    log.add(a4.OP_MODE, [1])
+    log.add(a4.OP_FORWARD, [-5])
+    log.path([0, 0, 1, 1, 2, 0], 'blue', 1)
+    log.polygon([0, 0, 4, 0, 4, 4, 0, 4], 'green', None, 1)
+    introcs.assert_equals(10, len(log))
+    introcs.assert_equals(['#ff0000', '#0000ff', '#00ff00'], log.colors)
+
+    geom = a4.replay(log)
+    expected = [[0, 0, 10, 0], [10, 0, 10, 10], [10, 15, 10, 10], [0, 0, 1, 1], [1, 1, 2, 0]]
+    introcs.assert_true(np.allclose(expected, geom.segments))
+    introcs.assert_equals([0, 0, 0, 1, 1], geom.segcolors.tolist())
+    introcs.assert_equals(2, len(geom.triangles))
+    introcs.assert_equals([2, 2], geom.tricolors.tolist())
+
+    # Frame by frame gives the same figure
+    frames = a4.replay(log, fps=1000, frame=3)
+    introcs.assert_true(np.allclose(geom.segments, frames.segments))
+    introcs.assert_true(np.allclose(geom.triangles, frames.triangles))
+
+    # A raster drawing is recorded as its lines, and other threads are not recorded
+    tool = a4._turtle.Turtle.__new__(a4._turtle.Turtle)
+    tool._window = type('Blank', (object,), {'width': 100, 'height': 100})()
+    tool._width = 1
+    hex = a4.hex_geometry(20)
+    seen = []
+
+    def figure():
+        thread = threading.Thread(target=lambda: seen.append(a4._recording_log()))
+        thread.start()
+        thread.join()
+        seen.append(a4._recording_log())
+        a4.draw_geometry(tool, hex, 'raster')
+
+    saved = a4._blit_image
+    a4._blit_image = lambda t, image: None
+    try:
+        log = a4.record(figure)
+    finally:
+        a4._blit_image = saved
+    introcs.assert_equals(None, seen[0])
+    introcs.assert_true(seen[1] is log)
+    introcs.assert_equals(None, a4._recording_log())
+    introcs.assert_true(np.allclose(hex.segments, a4.replay(log).segments))
+
+    # Only the tools on the windows given to the figure (here, the window of
+    # its turtle) are recorded
+    def tool(window):
+        t = a4._turtle.Turtle.__new__(a4._turtle.Turtle)
+        t._window = window
+        t._x, t._y, t._heading, t._edge, t._isdown = 0.0, 0.0, 90.0, 'red', True
+        return t
+
+    mine = tool(object())
+    other = tool(object())
+
+    def figure(t):
+        t.drawmode = False
+        other.drawmode = False
+
+    drawmode = a4._turtle.Turtle.__dict__['drawmode']
+    log = a4.record(figure, mine)
+    introcs.assert_equals([a4.OP_TOOL, a4.OP_MODE], list(log.ops))
+    introcs.assert_false(other.drawmode)
+    introcs.assert_true(a4._turtle.Turtle.__dict__['drawmode'] is drawmode)
+
+    # The tools are restored even if the figure fails
+    def fail(t):
+        raise RuntimeError('figure failed')
+    original = a4._turtle.Turtle.__dict__['forward']
+    introcs.assert_error(a4.record, fail, mine, error=RuntimeError)
+    introcs.assert_true(a4._turtle.Turtle.__dict__['forward'] is original)
+
+
+def test_chain_code():
+    """
+    Tests the class ChainCode and the functions chain_encode, path_chain and island_chain
+    """
+    print('Testing chain_code')
+    np = a4.np
+
+    # Four steps to a byte, the first in the lowest bits
+    code = a4.chain_encode([0, 1, 2, 3, 3], 5, 6, 2)
+    introcs.assert_equals(5, code.count)
+    introcs.assert_equals(bytes([0b11100100, 0b11]), code.data)
+    introcs.assert_equals([0, 1, 2, 3, 3], code.directions().tolist())
+    expected = [[5, 6], [5, 8], [3, 8], [3, 6], [5, 6], [7, 6]]
+    introcs.assert_true(np.allclose(expected, code.path()))
+
+    empty = a4.chain_encode([])
+    introcs.assert_equals(0, empty.count)
+    introcs.assert_equals(b'', empty.data)
+
+    # Encoding a path and decoding it gives the path back
+    again = a4.path_chain(code.path())
+    introcs.assert_equals(code.data, again.data)
+    introcs.assert_floats_equal(2.0, again.step)
+
+    for d in range(4):
+        chain = a4.island_chain(300, d, 10, -20)
+        path = a4.island_path(300, d, 10, -20)
+        introcs.assert_equals(4 * 8 ** d, chain.count)
+        introcs.assert_equals((chain.count + 3) // 4, len(chain.data))
+        introcs.assert_true(np.allclose(path, chain.path()))
+        introcs.assert_equals(chain.data, a4.path_chain(path).data)
+
+
+def test_memory_report():
+    """
+    Tests the function memory_report
+    """
+    print('Testing memory_report')
+    report = a4.memory_report(a4.island_geometry, 300, 3)
+    geom = a4.island_geometry(300, 3)
+    introcs.assert_equals('island_geometry', report.figure)
+    introcs.assert_equals(2048, report.segments)
+    introcs.assert_equals(0, report.triangles)
+    introcs.assert_equals(geom.nbytes(), report.geometry)
+    introcs.assert_true(report.peak >= report.geometry)
+    introcs.assert_true(report.retained <= report.peak)
+    introcs.assert_equals(0, report.log)
+    introcs.assert_equals(0, report.items)
+    introcs.assert_floats_equal(report.peak/2048, report.per_shape())
+
+    fields = report.asdict()
+    introcs.assert_equals(['figure', 'peak', 'retained', 'backend', 'geometry', 'log',
+                           'segments', 'triangles', 'items', 'per_shape'], list(fields))
+    introcs.assert_equals(report.peak, fields['peak'])
+
+    # Smaller storage shows up in the report
+    small = a4.memory_report(a4.island_geometry, 300, 3, precision='int16')
+    introcs.assert_true(small.geometry < report.geometry)
+    introcs.assert_equals(2048, small.segments)
+
+
+def test_quantize():
+    """
+    Tests the functions quantize_coords and quantize_geometry, and saving quantized figures
+    """
+    print('Testing quantize')
+    import os
+    import tempfile
+    np = a4.np
+
+    # The bounding box fills the integer range, with one scale for both axes
+    stored, scale, origin = a4.quantize_coords(np.array([[0., 0., 10., 5.]]), 'int16')
+    introcs.assert_equals([[-32767, -16384, 32767, 16384]], stored.tolist())
+    introcs.assert_floats_equal(5/32767, scale)
+    introcs.assert_equals((5.0, 2.5), origin)
+
+    stored, scale, origin = a4.quantize_coords(np.array([[0.5, 1.5]]), 'float32')
+    introcs.assert_equals('float32', str(stored.dtype))
+    introcs.assert_equals((1.0, (0.0, 0.0)), (scale, origin))
+
+    geom = a4.triangle_geometry(300, 4)
+    for precision in ['float32', 'int32', 'int16']:
+        small = a4.quantize_geometry(geom, precision)
+        introcs.assert_equals(precision, small.precision())
+        introcs.assert_true(small.nbytes() < geom.nbytes())
+        error = max(abs(small.segments - geom.segments).max(), abs(small.triangles - geom.triangles).max())
+        bound = small.scale/2 if precision[0] == 'i' else 1e-4
+        introcs.assert_true(error <= bound * 1.0001)
+        introcs.assert_equals(geom.tricolors.tolist(), small.tricolors.tolist())
+
+    # Drawing code decodes an integer figure once and reads the float copy
+    small = a4.quantize_geometry(geom, 'int16')
+    introcs.assert_true(geom.decoded() is geom)
+    introcs.assert_true(small.segments is not small.segments)
+    decode = a4.Geometry._decode
+    calls = []
+    a4.Geometry._decode = lambda self, stored: calls.append(stored) or decode(self, stored)
+    try:
+        copy = small.decoded()
+        introcs.assert_equals(2, len(calls))
+        introcs.assert_true(copy.segments is copy.segments)
+        introcs.assert_equals(4, len(calls))  # Reading the copy makes no new array
+    finally:
+        a4.Geometry._decode = decode
+    introcs.assert_equals('float64', copy.precision())
+    introcs.assert_true(np.array_equal(small.segments, copy.segments))
+    introcs.assert_true(np.array_equal(small.triangles, copy.triangles))
+    introcs.assert_equals(small.segcolors.tolist(), copy.segcolors.tolist())
+
+    # A quantized figure is saved and loaded exactly
+    small = a4.quantize_geometry(geom, 'int16')
+    path = os.path.join(tempfile.mkdtemp(), 'small.a4g')
+    a4.save_geometry(small, path)
+    loaded = a4.load_geometry(path)
+    introcs.assert_equals('int16', loaded.precision())
+    introcs.assert_equals(small.scale, loaded.scale)
+    introcs.assert_equals(small.origin, loaded.origin)
+    introcs.assert_true(np.array_equal(small.segments, loaded.segments))
+    introcs.assert_true(np.array_equal(small.triangles, loaded.triangles))
+    introcs.assert_true(os.path.getsize(path) < small.nbytes() + 1024)
+    del loaded
+    os.remove(path)
+
+
+def test_state_stack():
+    """
+    Tests the functions push_state, pop_state and set_state with a stand-in turtle
+    """
+    print('Testing state stack')
+
+    class Tool(object):
+        def __init__(self):
+            object.__setattr__(self, 'sets', [])
+            for name, value in [('x', 0.0), ('y', 0.0), ('heading', 90.0), ('color', 'red'),
+                                ('drawmode', True), ('speed', 0)]:
+                object.__setattr__(self, name, value)
+
+        def __setattr__(self, name, value):
+            self.sets.append(name)
+            object.__setattr__(self, name, value)
+
+        def move(self, x, y):
+            self.sets.append('move')
+            object.__setattr__(self, 'x', x)
+            object.__setattr__(self, 'y', y)
+
+    t = Tool()
+    a4.push_state(t, heading=180, color='#ff0000', drawmode=False)
+    introcs.assert_equals(180, t.heading)
+    introcs.assert_false(t.drawmode)
+    introcs.assert_equals(['heading', 'drawmode'], t.sets)  # red is already #ff0000
+
+    # Nested states restore in order, setting only what changed
+    a4.push_state(t, ('x', 'y', 'color'), x=10, y=20.0, color='blue')
+    introcs.assert_equals((10, 20.0, 'blue'), (t.x, t.y, t.color))
+    t.heading = 45
+    del t.sets[:]
+    a4.pop_state(t)
+    introcs.assert_equals((0.0, 0.0, 'red'), (t.x, t.y, t.color))
+    introcs.assert_equals(45, t.heading)
+    introcs.assert_equals(['move', 'color'], t.sets)
+
+    del t.sets[:]
+    a4.pop_state(t)
+    introcs.assert_equals((90.0, 'red', True, 0), (t.heading, t.color, t.drawmode, t.speed))
+    introcs.assert_equals(['heading', 'drawmode'], t.sets)
+
+    # Nothing is set when nothing changed
+    del t.sets[:]
+    a4.set_state(t, x=1e-12, heading=90.0, speed=0)
+    a4.push_state(t)
+    a4.pop_state(t)
+    introcs.assert_equals([], t.sets)
+    introcs.assert_equals(None, a4.TurtleState(t, ('x',)).heading)
+
+
+def test_curve_order():
+    """
+    Tests the functions curve_keys and order_geometry
+    """
+    print('Testing curve order')
+    np = a4.np
+
+    # One point in the middle of each cell of an 8 x 8 grid
+    bits = 3
+    ys, xs = np.mgrid[0:8, 0:8]
+    points = np.column_stack([xs.ravel(), ys.ravel()]) + 0.5
+    points = np.vstack([points, [[0, 0], [8, 8]]])  # The corners of the box
+    for curve in ['hilbert', 'morton']:
+        keys = a4.curve_keys(points, curve, bits)[:-2]
+        introcs.assert_equals('uint64', str(keys.dtype))
+        introcs.assert_equals(list(range(64)), sorted(keys.tolist()))
+
+    # Each step along the Hilbert curve goes to a neighboring cell
+    keys = a4.curve_keys(points, 'hilbert', bits)[:-2]
+    path = points[:-2][np.argsort(keys)]
+    steps = np.abs(np.diff(path, axis=0)).sum(axis=1)
+    introcs.assert_equals([1.0]*63, steps.tolist())
+
+    # The Morton curve interleaves the bits, x first
+    keys = a4.curve_keys(np.array([[0.5, 0.5], [1.5, 0.5], [0.5, 1.5], [3.5, 3.5]]), 'morton', 2)
+    introcs.assert_equals([0, 1, 2, 15], keys.tolist())
+    introcs.assert_equals(0, len(a4.curve_keys(np.zeros((0, 2)))))
+
+    # Sorting moves the shapes but keeps all of them
+    geom = a4.polygons_geometry(40, 7, 5)
+    for overdraw in [True, False]:
+        ordered = a4.order_geometry(geom, 'hilbert', overdraw)
+        before = sorted(map(tuple, np.round(geom.segments, 9).tolist()))
+        after = sorted(map(tuple, np.round(ordered.segments, 9).tolist()))
+        introcs.assert_equals(before, after)
+    introcs.assert_true(a4.order_geometry(geom, None) is geom)
+
+
 #################### Main Test Procedure ####################
 
 def get_speed():
@@ -590,5 +1487,43 @@ def test_all():
     print('Testing complete')
 
 
+def test_headless():
+    """
+    Tests the parts of a4 that do not draw on a window.
+
+    This is the master test procedure for the headless tests. They need no
+    window and no input, so they can be run on a machine without a display.
+    """
+    print('Testing module a4 (headless)')
+    test_heading_steps()
+    test_petal_paths()
+    test_geometry_files()
+    test_geometry_cache()
+    test_lazy_imports()
+    test_polyline_runs()
+    test_petals_geometry()
+    test_canvas_pool()
+    test_island_path()
+    test_fill_mask()
+    test_dedupe_geometry()
+    test_tilings()
+    test_extents()
+    test_render_within()
+    test_parallel()
+    test_color_index()
+    test_color_ramp()
+    test_draw_pipelined()
+    test_replay()
+    test_chain_code()
+    test_memory_report()
+    test_quantize()
+    test_state_stack()
+    test_curve_order()
+    print('Testing complete')
+
+
 if __name__ == '__main__':
-    test_all()
+    if sys.argv[1:] == ['headless']:
+        test_headless()
+    else:
+        test_all()